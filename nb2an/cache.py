@@ -0,0 +1,254 @@
+"""Bounded caches for the NetBox client's stores.
+
+By default a Cache behaves like a plain dict.  Given limits, it evicts
+entries once it holds more than max_entries or (estimated) max_bytes,
+in least-recently-used (lru) or least-frequently-used (lfu) order,
+and expires entries older than ttl seconds.  Pinned entries are never
+evicted or expired.
+
+The lfu policy ages its counts (each entry's priority is its number of
+uses plus the priority of the last entry evicted), so entries that
+were popular long ago eventually make way for new ones.  An entry is
+never evicted by its own insertion while anything else could be."""
+
+import collections
+import heapq
+import itertools
+import sys
+import threading
+import time
+
+POLICIES = ["lru", "lfu"]
+
+
+def estimate_size(value, _depth: int = 0) -> int:
+    "Estimate the memory used by decoded JSON data, in bytes"
+    size = sys.getsizeof(value)
+    if _depth > 32:
+        return size
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key, _depth + 1) + estimate_size(item, _depth + 1)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += estimate_size(item, _depth + 1)
+    return size
+
+
+class Cache:
+    "A dict-like store with optional size limits, expiry and eviction"
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        max_bytes: int = None,
+        ttl: float = None,
+        policy: str = "lru",
+        sizer=estimate_size,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown cache policy {policy}")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.policy = policy
+        self.sizer = sizer
+
+        self.entries = collections.OrderedDict()  # key -> value, oldest first
+        self.sizes = {}
+        self.times = {}
+        self.uses = collections.Counter()
+        self.pinned = set()
+
+        # lfu: a heap of (priority, order, key), with stale entries
+        # (whose key has since been used or removed) skipped lazily
+        self.priorities = {}  # key -> (priority, order)
+        self.heap = []
+        self.order = itertools.count()
+        self.age = 0  # the priority of the last entry evicted
+        self.bytes = 0
+        self.lock = threading.RLock()
+        self.counts = collections.Counter()
+
+    def _expired(self, key) -> bool:
+        return (
+            self.ttl is not None
+            and key not in self.pinned
+            and time.time() - self.times[key] > self.ttl
+        )
+
+    def _remove(self, key) -> None:
+        del self.entries[key]
+        self.bytes -= self.sizes.pop(key, 0)
+        del self.times[key]
+        self.uses.pop(key, None)
+        self.priorities.pop(key, None)
+
+    def _prioritize(self, key) -> None:
+        "(Re)queue a key for lfu eviction after a use"
+        if self.policy != "lfu":
+            return
+        priority = (self.age + self.uses[key], next(self.order))
+        self.priorities[key] = priority
+        heapq.heappush(self.heap, priority + (key,))
+        if len(self.heap) > 2 * len(self.entries) + 32:
+            # drop the stale entries
+            self.heap = [x + (k,) for k, x in self.priorities.items()]
+            heapq.heapify(self.heap)
+
+    def _victim(self, protect=None):
+        """The next entry to evict, or None if everything is pinned.
+        protect (a new entry) is only chosen when nothing else can be."""
+        victim = None
+        if self.policy == "lru":
+            for key in self.entries:
+                if key not in self.pinned and key != protect:
+                    victim = key
+                    break
+        else:
+            skipped = []
+            while self.heap:
+                priority, order, key = self.heap[0]
+                if self.priorities.get(key) != (priority, order):
+                    heapq.heappop(self.heap)  # stale
+                elif key in self.pinned or key == protect:
+                    skipped.append(heapq.heappop(self.heap))
+                else:
+                    victim = key
+                    break
+            for entry in skipped:
+                heapq.heappush(self.heap, entry)
+
+        if victim is None and protect in self.entries and protect not in self.pinned:
+            victim = protect
+        return victim
+
+    def _evict(self, protect=None) -> None:
+        while (
+            self.max_entries is not None and len(self.entries) > self.max_entries
+        ) or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            key = self._victim(protect)
+            if key is None:
+                return
+            if key in self.priorities:
+                self.age = self.priorities[key][0]
+            self._remove(key)
+            self.counts["evictions"] += 1
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                self.counts["misses"] += 1
+                return default
+            if self._expired(key):
+                self._remove(key)
+                self.counts["expirations"] += 1
+                self.counts["misses"] += 1
+                return default
+            self.counts["hits"] += 1
+            self.uses[key] += 1
+            self.entries.move_to_end(key)
+            self._prioritize(key)
+            return self.entries[key]
+
+    def set(self, key, value, pin: bool = False) -> None:
+        "Store a value; replacing one keeps its use count"
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.sizes.pop(key, 0)
+                self.entries[key] = value
+                self.entries.move_to_end(key)
+            else:
+                self.entries[key] = value
+                self.uses[key] += 1
+                self._prioritize(key)
+            self.times[key] = time.time()
+            if self.max_bytes is not None:
+                self.sizes[key] = self.sizer(value)
+                self.bytes += self.sizes[key]
+            if pin:
+                self.pinned.add(key)
+            self._evict(protect=key)
+
+    def pin(self, key) -> None:
+        "Never evict or expire key"
+        with self.lock:
+            self.pinned.add(key)
+
+    def unpin(self, key) -> None:
+        with self.lock:
+            self.pinned.discard(key)
+            self._evict()
+
+    def clear(self) -> None:
+        with self.lock:
+            for key in list(self.entries):
+                self._remove(key)
+            self.pinned.clear()
+            self.heap = []
+            self.age = 0
+
+    def pop(self, key, default=None):
+        "Remove key, returning its value (or default if it wasn't cached)"
+        with self.lock:
+            if key not in self.entries:
+                return default
+            value = self.entries[key]
+            self._remove(key)
+            self.pinned.discard(key)
+            return value
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            if key not in self.entries:
+                return False
+            if self._expired(key):
+                self._remove(key)
+                self.counts["expirations"] += 1
+                return False
+            return True
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value) -> None:
+        self.set(key, value)
+
+    def __delitem__(self, key) -> None:
+        with self.lock:
+            self._remove(key)
+            self.pinned.discard(key)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def keys(self):
+        return list(self.entries)
+
+    def items(self):
+        with self.lock:
+            return [(k, v) for k, v in self.entries.items() if not self._expired(k)]
+
+    def values(self):
+        return [value for key, value in self.items()]
+
+    def stats(self) -> dict:
+        "Hit rates and sizes, for sizing the limits"
+        with self.lock:
+            lookups = self.counts["hits"] + self.counts["misses"]
+            return {
+                "entries": len(self.entries),
+                "pinned": len(self.pinned),
+                "bytes": self.bytes if self.max_bytes is not None else None,
+                "hits": self.counts["hits"],
+                "misses": self.counts["misses"],
+                "hit_rate": self.counts["hits"] / lookups if lookups else 0.0,
+                "evictions": self.counts["evictions"],
+                "expirations": self.counts["expirations"],
+            }
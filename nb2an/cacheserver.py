@@ -0,0 +1,227 @@
+"""A local cache broker that nb2an processes can share.
+
+The broker listens on a unix socket and answers NetBox GET requests
+for its clients, fetching each URL from NetBox only once.  Concurrent
+requests for the same URL, from any number of processes, wait for a
+single fetch.  Set *cache_socket* in the configuration file to make
+Netbox.get use a running broker.
+
+Requests and responses are single lines of JSON:
+
+    {"url": "https://netbox/api/dcim/racks/", "strip_results": true}
+    {"ok": true, "data": [...]}
+
+Only URLs under the NetBox api_url are fetched (the requests carry the
+NetBox token), and the socket is only accessible to its owner.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from logging import debug
+from urllib.parse import urlsplit
+
+import nb2an.netbox
+
+
+class CacheServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    "Serves cached (or freshly fetched) NetBox responses over a unix socket"
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, fetch, prefix: str, ttl: float = None):
+        """fetch is called as fetch(url, strip_results) to get data from
+        NetBox, for URLs under prefix (its api_url) only; cached results
+        expire after ttl seconds if given."""
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.socket_path = socket_path
+        self.fetch = fetch
+        self.prefix = urlsplit(nb2an.netbox.canonical_url(prefix))
+        self.ttl = ttl
+        self.cache = {}  # key -> (time fetched, encoded response line)
+        self.in_flight = {}  # key -> threading.Event
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+        super().__init__(socket_path, CacheRequestHandler)
+
+    def server_bind(self):
+        # never let other users connect, whatever the umask
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+
+    def allowed(self, url: str) -> bool:
+        "Whether url is a NetBox API URL, that may be sent the token"
+        parts = urlsplit(url)
+        segments = parts.path.split("/")
+        return (
+            (parts.scheme, parts.netloc) == (self.prefix.scheme, self.prefix.netloc)
+            and parts.path.startswith(self.prefix.path)
+            and "." not in segments
+            and ".." not in segments
+        )
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def _cached(self, key):
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.time() - entry[0] > self.ttl:
+            del self.cache[key]
+            return None
+        return entry[1]
+
+    def lookup(self, url: str, strip_results: bool = True) -> bytes:
+        "Return the encoded response line for a url, fetching it at most once"
+        if not self.allowed(url):
+            with self.lock:
+                self.stats["errors"] += 1
+            error = f"{url} is not a NetBox API URL"
+            return json.dumps({"ok": False, "error": error}).encode() + b"\n"
+
+        key = (url, strip_results)
+        while True:
+            with self.lock:
+                response = self._cached(key)
+                if response is not None:
+                    self.stats["hits"] += 1
+                    return response
+
+                event = self.in_flight.get(key)
+                if event is None:
+                    # we're the one that fetches it
+                    event = threading.Event()
+                    self.in_flight[key] = event
+                    self.stats["misses"] += 1
+                    break
+                self.stats["coalesced"] += 1
+
+            # someone else is fetching it; wait and then look again
+            event.wait()
+            with self.lock:
+                if key in self.cache:
+                    self.stats["hits"] += 1
+                    return self.cache[key][1]
+            # the other fetch failed, so try it ourselves
+
+        try:
+            debug(f"broker fetching {url}")
+            data = self.fetch(url, strip_results)
+            response = json.dumps({"ok": True, "data": data}).encode() + b"\n"
+            with self.lock:
+                self.cache[key] = (time.time(), response)
+            return response
+        except Exception as exp:
+            with self.lock:
+                self.stats["errors"] += 1
+            return json.dumps({"ok": False, "error": str(exp)}).encode() + b"\n"
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            event.set()
+
+
+class CacheRequestHandler(socketserver.StreamRequestHandler):
+    "Answers one JSON request per line until the client disconnects"
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if request.get("stats"):
+                    with self.server.lock:
+                        stats = dict(self.server.stats, entries=len(self.server.cache))
+                    response = json.dumps({"ok": True, "data": stats}).encode() + b"\n"
+                else:
+                    response = self.server.lookup(
+                        request["url"], request.get("strip_results", True)
+                    )
+            except Exception as exp:
+                response = json.dumps({"ok": False, "error": str(exp)}).encode() + b"\n"
+            self.wfile.write(response)
+            self.wfile.flush()
+
+
+class CacheConnection:
+    "One socket to a CacheServer, used by one request at a time"
+
+    def __init__(self, socket_path: str):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path)
+        except Exception:
+            self.sock.close()
+            raise
+        self.reader = self.sock.makefile("rb")
+
+    def request(self, request: dict) -> bytes:
+        self.sock.sendall(json.dumps(request).encode() + b"\n")
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("cache broker closed the connection")
+        return line
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class CacheClient:
+    """Connections to a running CacheServer.
+
+    Each request borrows an idle connection (or opens a new one), so
+    requests from several threads are answered concurrently; up to
+    max_idle connections are kept open for reuse."""
+
+    def __init__(self, socket_path: str, max_idle: int = 8):
+        self.socket_path = socket_path
+        self.max_idle = max_idle
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def _request(self, request: dict):
+        with self.lock:
+            connection = self.idle.pop() if self.idle else None
+        if connection is None:
+            connection = CacheConnection(self.socket_path)
+
+        try:
+            line = connection.request(request)
+        except Exception:
+            connection.close()
+            raise
+
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(connection)
+                connection = None
+        if connection is not None:
+            connection.close()
+
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RuntimeError(f"cache broker error: {response['error']}")
+        return response["data"]
+
+    def get(self, url: str, strip_results: bool = True):
+        return self._request({"url": url, "strip_results": strip_results})
+
+    def stats(self) -> dict:
+        return self._request({"stats": True})
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+"""Run the nb2an tools as subcommands of a single nb2an command.
+
+Several subcommands can be run in one invocation by separating them
+with a lone '+' argument, in which case they share one NetBox client
+(and its configuration and cache):
+
+    nb2an devices 3 + device 40 + parameters -r 3 serial
+
+The chain stops at the first subcommand that exits with a non-zero
+status, and nb2an exits with that status.
+"""
+
+import sys
+import importlib
+
+SEPARATOR = "+"
+
+# subcommand name -> module holding its main(); imported only when run
+SUBCOMMANDS = {
+    "device": "nb2an.tools.getdevice",
+    "devices": "nb2an.tools.getdevices",
+    "racks": "nb2an.tools.getracks",
+    "rack-report": "nb2an.tools.rackreport",
+    "outlets": "nb2an.tools.getoutlets",
+    "networks": "nb2an.tools.getnetwork",
+    "ip": "nb2an.tools.getip",
+    "parameters": "nb2an.tools.getparameters",
+    "update-ansible": "nb2an.tools.update_ansible",
+    "check-ansible": "nb2an.tools.checkansible",
+    "write-back": "nb2an.tools.writeback",
+    "merge-shards": "nb2an.tools.mergeshards",
+    "cache-server": "nb2an.tools.cacheserver",
+}
+
+
+def usage(out=sys.stderr):
+    print(__doc__, file=out)
+    print("subcommands:", file=out)
+    for name in SUBCOMMANDS:
+        print(f"  {name}", file=out)
+
+
+def split_commands(argv: list[str]) -> list[list[str]]:
+    "Split an argument list into one list per subcommand"
+    commands = [[]]
+    for arg in argv:
+        if arg == SEPARATOR:
+            commands.append([])
+        else:
+            commands[-1].append(arg)
+    return [x for x in commands if x]
+
+
+def run(command: list[str]) -> int:
+    """Run one subcommand, with command[0] as its name, returning its
+    exit status (the tools exit() when they're done or fail)"""
+    name = command[0]
+    module = importlib.import_module(SUBCOMMANDS[name])
+
+    # the tools parse sys.argv themselves
+    saved_argv = sys.argv
+    sys.argv = [f"nb2an {name}"] + command[1:]
+    try:
+        module.main()
+    except SystemExit as exp:
+        if exp.code is None or isinstance(exp.code, int):
+            return exp.code or 0
+        print(exp.code, file=sys.stderr)
+        return 1
+    finally:
+        sys.argv = saved_argv
+    return 0
+
+
+def main(argv: list[str] = None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    commands = split_commands(argv)
+    if not commands or commands[0][0] in ["-h", "--help"]:
+        usage()
+        exit(0 if commands else 1)
+
+    for command in commands:
+        if command[0] not in SUBCOMMANDS:
+            print(f"unknown subcommand: {command[0]}", file=sys.stderr)
+            usage()
+            exit(1)
+
+    # stop at the first subcommand that fails
+    for command in commands:
+        status = run(command)
+        if status:
+            exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,11 @@
 
 
 class DotNest:
-    def __init__(self, data):
+    def __init__(self, data, reads: list = None):
+        """data is the nested structure to access.  If a reads list is
+        passed, every get() appends (keys, found, value) to it."""
         self._data = data
+        self.reads = reads
 
     @property
     def data(self):
@@ -18,6 +21,18 @@ class DotNest:
 
         keys must be a list/tuple of dict keys or ints for list elements"""
         keys = self.parse_keys(keys)
+        if self.reads is None:
+            return self._get(keys)
+
+        try:
+            value = self._get(keys)
+        except Exception:
+            self.reads.append((list(keys), False, None))
+            raise
+        self.reads.append((list(keys), True, value))
+        return value
+
+    def _get(self, keys):
         ptr = self.data
 
         for n, k in enumerate(keys):
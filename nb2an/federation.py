@@ -0,0 +1,338 @@
+"""Fetching from several NetBox instances as if they were one.
+
+A configuration with an `instances` section describes each member
+NetBox (its api_url, token and optionally suffix), listed in order of
+priority.  Requests are sent to every instance concurrently and the
+results merged, so the usual caches, datasets and indexes work over
+all of them at once.
+
+Object ids are renumbered so they are unique across instances: id i
+in instance n (of N) becomes i * N + n, and ids in later queries and
+URLs are mapped back to the owning instance's own ids.  The url of each
+object is rewritten to match, so objects are cached under their
+federated URLs.
+
+Devices with the same name in more than one instance are resolved by
+the `conflicts` setting:
+
+  first   keep only the device from the first instance listed (default)
+  suffix  keep every device, renaming the later ones by appending
+          their instance's conflict_suffix (default "-<instance name>")
+  error   refuse to continue"""
+
+import threading
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from logging import debug, warning
+
+import nb2an.netbox
+
+CONFLICT_RULES = ["first", "suffix", "error"]
+
+# instance settings that default to the top level configuration
+SHARED_SETTINGS = [
+    "token",
+    "user",
+    "password",
+    "verify",
+    "suffix",
+    "chunk_size",
+    "max_workers",
+    "max_retries",
+    "latency_target",
+]
+
+
+def _is_id_parameter(name: str) -> bool:
+    return name == "id" or name.endswith("_id")
+
+
+class Instance:
+    "One member of a federation"
+
+    def __init__(self, name: str, index: int, netbox: nb2an.netbox.Netbox):
+        self.name = name
+        self.index = index
+        self.netbox = netbox
+        self.suffix = netbox.suffix
+        self.conflict_suffix = netbox.config.get("conflict_suffix", f"-{name}")
+
+
+class FederatedNetbox(nb2an.netbox.Netbox):
+    "A Netbox client over several NetBox instances"
+
+    def __init__(self, *args, instances: list = None, **kwargs):
+        """instances is a list of (name, Netbox) pairs; by default they are
+        created from the configuration's instances section"""
+        super().__init__(*args, **kwargs)
+        self.conflicts = self.config.get("conflicts", "first")
+        if self.conflicts not in CONFLICT_RULES:
+            raise ValueError(f"unknown conflicts rule {self.conflicts}")
+
+        if instances is None:
+            shared = {x: self.config[x] for x in SHARED_SETTINGS if x in self.config}
+            instances = [
+                (name, nb2an.netbox.Netbox(config={**shared, **(settings or {})}))
+                for name, settings in self.config["instances"].items()
+            ]
+        self.instances = [
+            Instance(name, index, netbox)
+            for index, (name, netbox) in enumerate(instances)
+        ]
+        self._plan = None
+        self._plan_lock = threading.Lock()
+
+    def global_id(self, local_id: int, index: int) -> int:
+        return local_id * len(self.instances) + index
+
+    def local_id(self, global_id: int) -> tuple[int, int]:
+        "Returns (instance index, id within that instance)"
+        return global_id % len(self.instances), global_id // len(self.instances)
+
+    def global_url(self, url: str, index: int) -> str:
+        "The federated URL for an instance's object URL"
+        base = urlsplit(self.instances[index].netbox.prefix).path.rstrip("/")
+        path = urlsplit(url).path
+        if base and path.startswith(base + "/"):
+            path = path[len(base) :]
+        path = "/".join(
+            str(self.global_id(int(x), index)) if x.isdigit() else x
+            for x in path.split("/")
+        )
+        return nb2an.netbox.canonical_url(path, self.prefix)
+
+    def _renumber(self, value, index: int) -> None:
+        "Replace an instance's ids (and object URLs) with global ones, in place"
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if (
+                    _is_id_parameter(key)
+                    and isinstance(item, int)
+                    and not isinstance(item, bool)
+                ):
+                    value[key] = self.global_id(item, index)
+                else:
+                    self._renumber(item, index)
+            if isinstance(value.get("url"), str):
+                value["url"] = self.global_url(value["url"], index)
+        elif isinstance(value, list):
+            for item in value:
+                self._renumber(item, index)
+
+    def conflict_plan(self) -> dict:
+        """Work out (once) which device names are used in more than one
+        instance, and which of those devices are dropped or renamed"""
+        with self._plan_lock:
+            if self._plan is not None:
+                return self._plan
+
+            copies = {}  # name -> [(instance index, local id)]
+            for instance in self.instances:
+                for device in instance.netbox.get("/dcim/devices/?brief=1"):
+                    if device.get("name"):
+                        copies.setdefault(device["name"], []).append(
+                            (instance.index, device["id"])
+                        )
+
+            plan = {"dropped": set(), "renamed": {}, "instances": {}}
+            conflicted = set()
+            for name, found in copies.items():
+                found.sort()
+                owner = found[0][0]
+                plan["instances"][name] = owner
+                for index, local_id in found[1:]:
+                    if index == owner:
+                        continue
+                    conflicted.add(name)
+                    device_id = self.global_id(local_id, index)
+                    if self.conflicts == "first":
+                        plan["dropped"].add(device_id)
+                    elif self.conflicts == "suffix":
+                        new_name = name + self.instances[index].conflict_suffix
+                        plan["renamed"][device_id] = new_name
+                        plan["instances"][new_name] = index
+
+            if conflicted:
+                names = ", ".join(sorted(conflicted))
+                if self.conflicts == "error":
+                    raise ValueError(f"devices found in several instances: {names}")
+                warning(
+                    f"devices found in several instances ({self.conflicts}): {names}"
+                )
+            self._plan = plan
+            return plan
+
+    def _rename(self, value, renamed: dict) -> None:
+        "Rename the device references (under 'device' keys) of renamed devices"
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key == "device" and isinstance(item, dict):
+                    self._rename_device(item, renamed)
+                self._rename(item, renamed)
+        elif isinstance(value, list):
+            for item in value:
+                self._rename(item, renamed)
+
+    def _references(self, value, dropped: set) -> bool:
+        "Whether value refers to a dropped device, under a 'device' key at any depth"
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if (
+                    key == "device"
+                    and isinstance(item, dict)
+                    and item.get("id") in dropped
+                ):
+                    return True
+                if self._references(item, dropped):
+                    return True
+        elif isinstance(value, list):
+            return any(self._references(item, dropped) for item in value)
+        return False
+
+    def _rename_device(self, device: dict, renamed: dict) -> None:
+        new_name = renamed.get(device.get("id"))
+        if new_name:
+            for key in ["name", "display"]:
+                if key in device:
+                    device[key] = new_name
+
+    def _resolve_conflicts(self, path: str, objects: list) -> list:
+        "Drop and rename conflicting devices (and their components)"
+        if len(self.instances) < 2:
+            return objects
+        plan = self.conflict_plan()
+        if not plan["dropped"] and not plan["renamed"]:
+            return objects
+
+        is_devices = path == "/dcim/devices/"
+        results = []
+        for obj in objects:
+            if not isinstance(obj, dict):
+                results.append(obj)
+                continue
+            if is_devices and obj.get("id") in plan["dropped"]:
+                continue
+            # components (and addresses, outlets...) of a dropped device
+            if self._references(obj, plan["dropped"]):
+                continue
+            if is_devices:
+                self._rename_device(obj, plan["renamed"])
+            self._rename(obj, plan["renamed"])
+            results.append(obj)
+        return results
+
+    def _route(self, path: str, query: list) -> list:
+        "Returns (instance, path, query) for each instance a request concerns"
+        segments = path.split("/")
+        indexes = {self.local_id(int(x))[0] for x in segments if x.isdigit()}
+        id_parameters = {
+            name for name, value in query if _is_id_parameter(name) and value.isdigit()
+        }
+
+        routes = []
+        for instance in self.instances:
+            if indexes and indexes != {instance.index}:
+                continue
+            local_path = "/".join(
+                str(self.local_id(int(x))[1]) if x.isdigit() else x for x in segments
+            )
+
+            local_query = []
+            kept = set()
+            for name, value in query:
+                if _is_id_parameter(name) and value.isdigit():
+                    index, local_id = self.local_id(int(value))
+                    if index != instance.index:
+                        continue
+                    value = str(local_id)
+                    kept.add(name)
+                local_query.append((name, value))
+
+            # an id filter with none of this instance's ids matches nothing
+            if id_parameters - kept:
+                continue
+            routes.append((instance, local_path, local_query))
+        return routes
+
+    def fetch(self, url: str, strip_results: bool = True):
+        "fetch from every instance a URL concerns, merging the results"
+        parts = urlsplit(url)
+        base = urlsplit(self.prefix).path.rstrip("/")
+        path = parts.path[len(base) :] if parts.path.startswith(base) else parts.path
+        query = parse_qsl(parts.query, keep_blank_values=True)
+
+        def send(route):
+            instance, local_path, local_query = route
+            local_url = nb2an.netbox.canonical_url(
+                local_path + ("?" + urlencode(local_query) if local_query else ""),
+                instance.netbox.prefix,
+            )
+            debug(f"fetching {local_url} from {instance.name}")
+            result = instance.netbox.fetch(local_url, strip_results)
+            self._renumber(result, instance.index)
+            return result
+
+        routes = self._route(path, query)
+        if len(routes) > 1:
+            import concurrent.futures
+
+            with concurrent.futures.ThreadPoolExecutor(len(routes)) as pool:
+                responses = list(pool.map(send, routes))
+        else:
+            responses = [send(route) for route in routes]
+
+        if strip_results:
+            results = []
+            for response in responses:
+                results.extend(response)
+            return self._resolve_conflicts(path, results)
+
+        # unstripped responses are single objects or pages
+        if len(responses) == 1:
+            return responses[0]
+        merged = {"count": 0, "next": None, "previous": None, "results": []}
+        for response in responses:
+            merged["count"] += response.get("count", 0)
+            merged["results"].extend(response.get("results", []))
+        merged["results"] = self._resolve_conflicts(path, merged["results"])
+        return merged
+
+    def patch_many(self, url: str, updates: list[dict]) -> list[dict]:
+        "Send each update to the instance that owns the object"
+        by_instance = {}
+        for update in updates:
+            index, local_id = self.local_id(update["id"])
+            by_instance.setdefault(index, []).append({**update, "id": local_id})
+
+        results = []
+        for index, local_updates in sorted(by_instance.items()):
+            objects = self.instances[index].netbox.patch_many(url, local_updates)
+            self._renumber(objects, index)
+            results.extend(objects)
+        self._forget(url, results)
+        return results
+
+    def fqdn(self, hostname):
+        "Use the suffix of the instance the device is from"
+        index = None
+        if len(self.instances) > 1:
+            index = self.conflict_plan()["instances"].get(hostname)
+        elif self.instances:
+            index = 0
+        suffix = self.instances[index].suffix if index is not None else self.suffix
+        if suffix and not hostname.endswith(suffix):
+            hostname = hostname + suffix
+        return hostname
+
+    def shortname_name(self, hostname):
+        for instance in self.instances:
+            if instance.suffix and hostname.endswith(instance.suffix):
+                return hostname[0 : -len(instance.suffix)]
+        return hostname
+
+    def get_stats(self) -> dict:
+        "Statistics, with each instance's endpoints listed separately"
+        stats = super().get_stats()
+        for instance in self.instances:
+            for name, endpoint in instance.netbox.limiter.stats().items():
+                stats["endpoints"][f"{instance.name}:{name}"] = endpoint
+        return stats
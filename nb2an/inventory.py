@@ -0,0 +1,79 @@
+"""Compute ansible host variables from NetBox without host_vars files.
+
+This applies the same changes-file mapping that nb-update-ansible uses,
+but to an empty structure per host, producing the variables an ansible
+inventory plugin can hand to ansible directly (see
+nb2an/inventory_plugins/nb2an.py)."""
+
+import re
+from logging import debug
+
+import nb2an.dotnest
+from nb2an.mapping import process_changes
+from nb2an.plugins.update_ansible import PluginRun
+
+
+def group_name(value) -> str:
+    "Turn a NetBox value into a valid ansible group name"
+    return re.sub(r"[^A-Za-z0-9_]", "_", str(value))
+
+
+class HostVarsBuilder:
+    """Computes (and remembers) the variables for each host on demand.
+
+    Devices are linked lazily, so only the NetBox data the mapping
+    actually reads is fetched."""
+
+    def __init__(self, nb, changes: dict, racks: list[int] = None):
+        self.nb = nb
+        self.changes = changes or {}
+        self.racks = racks or []
+        self.host_vars = {}
+        self._devices = None
+        self._run = None
+
+    @property
+    def devices(self) -> dict:
+        "A dict of host names to (linked) devices"
+        if self._devices is None:
+            devices = self.nb.get_devices(self.racks, link_other_information=True)
+            self._devices = {self.nb.fqdn(x["name"]): x for x in devices}
+        return self._devices
+
+    def hosts(self) -> list[str]:
+        return list(self.devices)
+
+    def get_vars(self, hostname: str) -> dict:
+        if hostname not in self.host_vars:
+            debug(f"computing variables for {hostname}")
+            if self._run is None:
+                self._run = PluginRun(lambda: self.nb.get_dataset("devices"))
+            results = {}
+            process_changes(
+                self.changes, results, self.devices[hostname], run=self._run
+            )
+            self.host_vars[hostname] = results
+        return self.host_vars[hostname]
+
+    def get_groups(self, hostname: str, group_by: list[str]) -> list[str]:
+        "Group names for a host, from the NetBox values at each group_by key"
+        dn = nb2an.dotnest.DotNest(self.devices[hostname])
+        groups = []
+        for key in group_by:
+            try:
+                value = dn.get(key)
+            except Exception:
+                continue
+            if value is not None:
+                groups.append(group_name(f"{key}_{value}"))
+        return groups
+
+    def build(self, group_by: list[str] = None) -> dict:
+        "Return {hostname: {'vars': ..., 'groups': [...]}} for every host"
+        return {
+            hostname: {
+                "vars": self.get_vars(hostname),
+                "groups": self.get_groups(hostname, group_by or []),
+            }
+            for hostname in self.hosts()
+        }
@@ -0,0 +1,102 @@
+"""An ansible inventory plugin that computes host variables from NetBox.
+
+Point ansible at this directory (eg, with `inventory_plugins` in
+ansible.cfg) and use an inventory file like:
+
+    plugin: nb2an
+    changes_file: nb2an.yml
+"""
+
+DOCUMENTATION = """
+    name: nb2an
+    short_description: NetBox hosts with variables from an nb2an mapping
+    description:
+        - Creates a host for each NetBox device, with variables computed
+          by applying an nb2an changes (mapping) file to the device data,
+          without needing host_vars files to be rewritten.
+    extends_documentation_fragment:
+        - inventory_cache
+    options:
+        plugin:
+            description: Marks this as an instance of the 'nb2an' plugin.
+            required: true
+            choices: ['nb2an']
+        changes_file:
+            description: The nb2an changes (mapping) file to apply.
+            required: true
+            type: path
+        config_path:
+            description: The nb2an configuration file to use.
+            type: path
+            default: ~/.nb2an
+        racks:
+            description: Only include devices in these rack ids.
+            type: list
+            elements: int
+            default: []
+        group_by:
+            description: Dotted NetBox keys (eg site.slug) to make groups from.
+            type: list
+            elements: str
+            default: []
+"""
+
+import os
+
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable
+
+
+class InventoryModule(BaseInventoryPlugin, Cacheable):
+
+    NAME = "nb2an"
+
+    def verify_file(self, path):
+        return super().verify_file(path) and path.endswith(("nb2an.yml", "nb2an.yaml"))
+
+    def get_inventory(self) -> dict:
+        import yaml
+        import nb2an.netbox
+        import nb2an.inventory
+
+        with open(self.get_option("changes_file")) as changes_file:
+            changes = yaml.safe_load(changes_file.read())
+
+        nb = nb2an.netbox.Netbox(
+            config_path=os.path.expanduser(self.get_option("config_path"))
+        )
+        builder = nb2an.inventory.HostVarsBuilder(
+            nb, changes, racks=self.get_option("racks")
+        )
+        return builder.build(group_by=self.get_option("group_by"))
+
+    def populate(self, results: dict) -> None:
+        for hostname, host in results.items():
+            self.inventory.add_host(hostname)
+            for group in host["groups"]:
+                self.inventory.add_group(group)
+                self.inventory.add_child(group, hostname)
+            for key, value in host["vars"].items():
+                self.inventory.set_variable(hostname, key, value)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super().parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        use_cache = self.get_option("cache") and cache
+        update_cache = self.get_option("cache") and not cache
+
+        results = None
+        if use_cache:
+            try:
+                results = self._cache[cache_key]
+            except KeyError:
+                update_cache = True
+
+        if results is None:
+            results = self.get_inventory()
+
+        if update_cache:
+            self._cache[cache_key] = results
+
+        self.populate(results)
@@ -0,0 +1,121 @@
+"""An index of the IP addresses assigned to device interfaces."""
+
+import bisect
+import ipaddress
+from typing import Union
+
+
+class IPEntry:
+    "One address assigned to a device interface"
+
+    __slots__ = ["interface", "address", "host"]
+
+    def __init__(self, host: str, interface: str, address: str):
+        self.host = host
+        self.interface = interface
+        self.address = ipaddress.ip_interface(address)
+
+    def __repr__(self):
+        return f"IPEntry({self.host!r}, {self.interface!r}, '{self.address}')"
+
+    def __eq__(self, other):
+        return (self.host, self.interface, self.address) == (
+            other.host,
+            other.interface,
+            other.address,
+        )
+
+
+class IPIndex:
+    """Answers address ownership and containment queries.
+
+    Addresses are kept in sorted integer arrays per family so that all
+    addresses within a prefix can be found with a binary search, plus
+    tables keyed by exact address and by each address's network for
+    reverse lookups and longest-prefix matches."""
+
+    def __init__(self, addresses: dict = None):
+        # per family: sorted address ints, and entries in the same order
+        self.sorted_ints = {4: [], 6: []}
+        self.sorted_entries = {4: [], 6: []}
+        self.by_address = {}
+        # per family: prefix length -> network int -> entries
+        self.by_network = {4: {}, 6: {}}
+        self.prefix_lengths = {4: [], 6: []}
+
+        if addresses:
+            self.add_addresses(addresses)
+
+    def add_addresses(self, addresses: dict) -> None:
+        "Add a host/interface/family = address dict (see Netbox.get_addresses)"
+        entries = []
+        for host, interfaces in addresses.items():
+            for interface, families in interfaces.items():
+                for address in families.values():
+                    entries.append(IPEntry(host, interface, address))
+        self.add(entries)
+
+    def add_ip_addresses(self, addresses: list[dict]) -> None:
+        """Add NetBox IP address objects (see Netbox.get_ip_addresses);
+        those not assigned to a device interface are skipped"""
+        entries = []
+        for addr in addresses:
+            assigned = addr.get("assigned_object") or {}
+            if "device" not in assigned:
+                continue
+            host = assigned["device"]["display"]
+            entries.append(IPEntry(host, assigned["name"], addr["address"]))
+        self.add(entries)
+
+    def add(self, entries: list[IPEntry]) -> None:
+        "Add entries to the index"
+        for entry in entries:
+            family = entry.address.version
+            ip = int(entry.address.ip)
+            self.by_address.setdefault((family, ip), []).append(entry)
+
+            network = entry.address.network
+            length = network.prefixlen
+            networks = self.by_network[family].setdefault(length, {})
+            networks.setdefault(int(network.network_address), []).append(entry)
+
+            self.sorted_entries[family].append(entry)
+
+        for family in [4, 6]:
+            self.sorted_entries[family].sort(key=lambda x: int(x.address.ip))
+            self.sorted_ints[family] = [
+                int(x.address.ip) for x in self.sorted_entries[family]
+            ]
+            self.prefix_lengths[family] = sorted(self.by_network[family], reverse=True)
+
+    def __len__(self):
+        return len(self.sorted_entries[4]) + len(self.sorted_entries[6])
+
+    def owners(self, address: Union[str, ipaddress._BaseAddress]) -> list[IPEntry]:
+        "Return the entries assigned exactly this address"
+        ip = ipaddress.ip_address(address)
+        return list(self.by_address.get((ip.version, int(ip)), []))
+
+    def within(self, prefix: Union[str, ipaddress._BaseNetwork]) -> list[IPEntry]:
+        "Return the entries whose address falls within prefix, in address order"
+        network = ipaddress.ip_network(prefix, strict=False)
+        family = network.version
+        ints = self.sorted_ints[family]
+        start = bisect.bisect_left(ints, int(network.network_address))
+        end = bisect.bisect_right(ints, int(network.broadcast_address))
+        return self.sorted_entries[family][start:end]
+
+    def longest_match(
+        self, address: Union[str, ipaddress._BaseAddress]
+    ) -> list[IPEntry]:
+        """Return the entries on the most specific assigned network
+        containing address, or an empty list if there are none"""
+        ip = ipaddress.ip_address(address)
+        family = ip.version
+        bits = ip.max_prefixlen
+        for length in self.prefix_lengths[family]:
+            mask = ((1 << length) - 1) << (bits - length)
+            entries = self.by_network[family][length].get(int(ip) & mask)
+            if entries:
+                return list(entries)
+        return []
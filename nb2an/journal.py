@@ -0,0 +1,106 @@
+"""A journal of the hosts a run has finished, so a failed run can resume.
+
+The journal starts with a header identifying the run: a snapshot id
+of the NetBox data it used (the devices, and the linked data such as
+interfaces and addresses that the mapping reads) and a digest of its
+mapping.  A line is
+then appended (and synced to disk) as each host's file is written.
+Resuming a run skips the hosts already in the journal, as long as the
+NetBox snapshot and mapping are the same as before; otherwise the run
+starts again from the beginning."""
+
+import json
+import os
+import threading
+from logging import info, warning
+
+import nb2an.manifest
+
+
+def _stamp(value):
+    "Reduce NetBox objects to their id and when they last changed"
+    if isinstance(value, dict):
+        if "id" in value:
+            return [value["id"], value.get("last_updated")]
+        return {str(k): _stamp(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_stamp(x) for x in value]
+    return value
+
+
+def snapshot_id(devices: list[dict], linked: list[str] = ()) -> str:
+    """Identify the state of a set of NetBox devices by when each last
+    changed, along with their linked data (eg, interfaces) in linked,
+    whose changes don't update the devices' own last_updated"""
+    stamps = []
+    for device in devices:
+        stamp = [device["id"], device.get("last_updated")]
+        for key in sorted(linked):
+            stamp.append(_stamp(device.get(key)))
+        stamps.append(stamp)
+    return nb2an.manifest.digest(sorted(stamps, key=lambda x: x[0]))
+
+
+class Journal:
+    "The hosts completed by a run, stored as JSON lines"
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.resume = resume
+        self.completed = set()
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _read(self) -> tuple[dict, set]:
+        header = None
+        completed = set()
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # a partly written last line
+                if header is None:
+                    header = entry
+                elif "host" in entry:
+                    completed.add(entry["host"])
+        return header, completed
+
+    def start(self, snapshot: str, mapping: str) -> set:
+        "Begin (or resume) a run, returning the hosts already completed"
+        header = {"snapshot": snapshot, "mapping": mapping}
+
+        if self.resume and os.path.exists(self.path):
+            previous, completed = self._read()
+            if previous == header:
+                info(f"resuming: {len(completed)} hosts were already done")
+                self.completed = completed
+                self._file = open(self.path, "a")
+                return self.completed
+            warning(
+                "netbox data or the mapping changed since the last run: starting over"
+            )
+
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as journal_file:
+            journal_file.write(json.dumps(header) + "\n")
+        os.replace(temporary, self.path)
+        self.completed = set()
+        self._file = open(self.path, "a")
+        return self.completed
+
+    def complete(self, hostname: str) -> None:
+        "Record that a host's file has been written"
+        with self._lock:
+            self._file.write(json.dumps({"host": hostname}) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.completed.add(hostname)
+
+    def finish(self) -> None:
+        "The run completed, so there is nothing to resume"
+        if self._file:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
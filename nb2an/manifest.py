@@ -0,0 +1,96 @@
+"""A record of what each host's last update was computed from.
+
+For every host the manifest stores the NetBox keys that the changes
+file read (through DotNest.get) along with a digest of their values,
+a hash of the changes file itself, and a hash of the host_vars file as
+it was written.  When none of those have changed, the mapping would
+produce the same file again, so the host can be skipped."""
+
+import hashlib
+import json
+import os
+from logging import debug, warning
+
+import nb2an.dotnest
+
+
+def digest(value) -> str:
+    encoded = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def digest_reads(reads: list) -> tuple[list, str]:
+    """Reduce DotNest reads to the unique paths read (in order) and a
+    digest of what was found at each"""
+    paths = []
+    found = []
+    seen = set()
+    for keys, exists, value in reads:
+        key = json.dumps(keys)
+        if key in seen:
+            continue
+        seen.add(key)
+        paths.append(keys)
+        found.append([keys, exists, value if exists else None])
+    return paths, digest(found)
+
+
+class Manifest:
+    "Per-host input fingerprints, saved as JSON"
+
+    def __init__(self, path: str, changes: dict):
+        self.path = path
+        self.mapping_hash = digest(changes)
+        self.hosts = {}
+        self.skipped = 0
+        if os.path.exists(path):
+            try:
+                with open(path) as manifest_file:
+                    self.hosts = json.load(manifest_file).get("hosts", {})
+            except Exception as exp:
+                warning(f"ignoring unreadable manifest {path}: {exp}")
+
+    def is_current(self, hostname: str, nb_data: dict, text: str) -> bool:
+        "True if the host's mapping, file and NetBox inputs are unchanged"
+        entry = self.hosts.get(hostname)
+        if not entry:
+            return False
+        if entry["mapping"] != self.mapping_hash:
+            return False
+        if entry["file"] != digest(text):
+            debug(f"{hostname}: host_vars file has changed")
+            return False
+
+        reads = []
+        dn = nb2an.dotnest.DotNest(nb_data, reads=reads)
+        for keys in entry["paths"]:
+            try:
+                dn.get(keys)
+            except Exception:
+                pass
+        if digest_reads(reads)[1] != entry["netbox"]:
+            debug(f"{hostname}: netbox data has changed")
+            return False
+
+        self.skipped += 1
+        return True
+
+    def record(self, hostname: str, reads: list, text: str) -> None:
+        "Remember what the host's file (text) was computed from"
+        paths, netbox_digest = digest_reads(reads)
+        self.hosts[hostname] = {
+            "mapping": self.mapping_hash,
+            "file": digest(text),
+            "paths": paths,
+            "netbox": netbox_digest,
+        }
+
+    def forget(self, hostname: str) -> None:
+        self.hosts.pop(hostname, None)
+
+    def save(self) -> None:
+        "Write the manifest, replacing the old one only once fully written"
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as manifest_file:
+            json.dump({"hosts": self.hosts}, manifest_file)
+        os.replace(temporary, self.path)
@@ -0,0 +1,90 @@
+"""Applying a changes mapping to a device's NetBox data.
+
+A changes mapping mirrors the structure of the YAML to produce: string
+values are dotted NetBox keys to copy, nested dicts are descended into
+and dicts with a __function key call the named plugin (see
+nb2an.plugins.update_ansible)."""
+
+from logging import debug, error
+import time
+import traceback
+
+import nb2an.dotnest
+from nb2an.plugins.update_ansible import update_ansible_plugins, profile, PluginRun
+
+PLUGIN_KEY = "__function"
+
+
+def unknown_functions(changes) -> list[str]:
+    "The names of any plugins a changes mapping uses that don't exist"
+    if not isinstance(changes, dict):
+        return []
+    if PLUGIN_KEY in changes:
+        name = changes[PLUGIN_KEY]
+        return [] if name in update_ansible_plugins else [name]
+    results = []
+    for value in changes.values():
+        results.extend(unknown_functions(value))
+    return results
+
+
+def process_changes(changes, yaml_struct, nb_data, path=None, reads=None, run=None):
+    """Apply a changes mapping to yaml_struct using one device's nb_data.
+
+    run holds the data shared by batch plugins over all the devices being
+    processed; without one, batch plugins only see this device."""
+    dn = nb2an.dotnest.DotNest(nb_data, reads=reads)
+    for item in changes:
+        item_path = f"{path}.{item}" if path else str(item)
+        # only the leaves are profiled: a section's time is its entries'
+        leaf = not isinstance(changes[item], dict) or PLUGIN_KEY in changes[item]
+        if profile.enabled:
+            start = time.perf_counter()
+
+        if isinstance(changes[item], dict):
+
+            # check if it's a special dict with instructions
+            if PLUGIN_KEY in changes[item]:
+                function_name = changes[item][PLUGIN_KEY]
+                if function_name not in update_ansible_plugins:
+                    raise ValueError(f"function '{function_name}' is unknown")
+
+                try:
+                    fn = update_ansible_plugins[function_name]
+                    if hasattr(fn, "prepare"):
+                        if run is None:
+                            run = PluginRun([nb_data])
+                        if reads is not None:
+                            # the result depends on other devices, so a
+                            # manifest can never consider this host current
+                            reads.append((["<batch>", function_name], True, None))
+                        context = run.context(function_name, changes[item])
+                        value = fn(dn, yaml_struct, changes[item], item, context)
+                    else:
+                        value = fn(dn, yaml_struct, changes[item], item)
+                except Exception as exp:
+                    error(f"failed to call function {function_name} for item {item}")
+                    errors = traceback.format_exception(exp)
+                    for err in errors:
+                        debug(err)
+            else:
+                if item not in yaml_struct:
+                    yaml_struct[item] = {}  # TODO: allow list creation
+                process_changes(
+                    changes[item], yaml_struct[item], nb_data, item_path, reads, run
+                )
+
+            # if nothing was added, drop it again
+            if item in yaml_struct and yaml_struct[item] == {}:
+                del yaml_struct[item]
+        elif isinstance(changes[item], str):
+            try:
+                value = dn.get(changes[item])
+                yaml_struct[item] = value
+            except Exception:
+                debug(f"skipping {changes[item]}: failed to find netbox value")
+
+        if profile.enabled and leaf:
+            profile.record(
+                "mapping", item_path, nb_data.get("name"), time.perf_counter() - start
+            )
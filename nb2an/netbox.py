@@ -1,15 +1,102 @@
 import os
-import yaml
-import requests
 import collections
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from typing import Union
-from logging import debug, error
-from rich import print
+from logging import debug, warning, error
 
 default_url = "https://netbox/api"
+default_chunk_size = 50
+default_max_workers = 4
+default_latency_target = 5.0
+default_max_retries = 5
 default_config_path = os.path.join(os.environ.get("HOME"), ".nb2an")
 
 
+def canonical_url(url: str, prefix: str = default_url) -> str:
+    """Normalize a URL so equivalent requests share a cache entry: it's
+    made absolute, given a trailing slash and has its query sorted"""
+    if not url.startswith("http"):
+        url = prefix.rstrip("/") + "/" + url.lstrip("/")
+    parts = urlsplit(url)
+    path = "/".join([x for x in parts.path.split("/") if x])
+    path = f"/{path}/" if path else "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+class LinkedDevice(dict):
+    """A view of a device that links in related NetBox data on demand.
+
+    The device's own fields are copied (shallowly) into the view, so the
+    shared device data is never modified.  The related data in
+    LINKED_KEYS (interfaces, addresses, power_ports, outlets and the
+    cabled neighbors of each component) is only looked up, through the
+    Netbox indexes, the first time it's read.  A view given a scope (the
+    ids of the devices in a shard) reads the datasets fetched for just
+    those devices."""
+
+    LINKED_KEYS = ["interfaces", "addresses", "power_ports", "outlets", "neighbors"]
+
+    def __init__(self, device: dict, netbox, scope: tuple = None):
+        super().__init__(device)
+        self._netbox = netbox
+        self._scope = scope
+
+    def _resolve(self, key):
+        "Find the linked data for key, or None if there is none"
+        nb = self._netbox
+        if key == "interfaces":
+            return nb.get_dataset("interfaces", self._scope).get(self["name"])
+        if key == "addresses":
+            return nb.get_dataset("addresses", self._scope).get(self["name"])
+        if key == "power_ports":
+            return list(nb.get_index("power_ports_by_device").get(self["name"], []))
+        if key == "outlets":
+            return list(nb.get_index("outlets_by_endpoint").get(self["id"], []))
+        if key == "neighbors":
+            # a component can have several peers (and components of
+            # different kinds can share a name), so each is a list
+            neighbors = {}
+            for x in nb.get_topology(self._scope).neighbors(self["id"]):
+                neighbors.setdefault(x["name"], []).append(
+                    {"kind": x["kind"], "device": x["device"], "port": x["port"]}
+                )
+            return neighbors
+        return None
+
+    def __missing__(self, key):
+        if key in self.LINKED_KEYS:
+            value = self._resolve(key)
+            if value is not None:
+                self[key] = value
+                return value
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+        if key in self.LINKED_KEYS:
+            try:
+                self[key]
+                return True
+            except KeyError:
+                pass
+        return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def materialize(self) -> dict:
+        "Return a plain dict copy with all of the linked data resolved"
+        for key in self.LINKED_KEYS:
+            key in self  # resolve and remember it
+        return dict(self)
+
+
 class Netbox:
     "An interface to Netbox to extract data needed for nb2an to function"
 
@@ -19,10 +106,13 @@ class Netbox:
         config_path=default_config_path,
         ansible_dir=None,
         suffix=None,
+        config: dict = None,
     ):
         self.config_path = config_path
         self.config = {}
-        if os.path.exists(self.config_path):
+        if config is not None:
+            self.config = config  # eg, one instance of a federation
+        elif os.path.exists(self.config_path):
             self.config = self.get_config()
         else:
             error(f"you must create a {self.config} configuration file first")
@@ -30,17 +120,49 @@ class Netbox:
         self.prefix = self.config.get("api_url", api_url)
         self.suffix = self.config.get("suffix", suffix)
         self.ansible_dir = self.config.get("ansible_dir", ansible_dir)
-        self.url_cache = {}
-        self.devices_by_id = {}
-        self.devices_by_name = {}
-
-        self.data = {}
+        self.chunk_size = self.config.get("chunk_size", default_chunk_size)
+        self.max_workers = self.config.get("max_workers", default_max_workers)
+        self.max_retries = self.config.get("max_retries", default_max_retries)
+
+        import nb2an.throttle
+
+        self.limiter = nb2an.throttle.AdaptiveLimiter(
+            maximum=self.max_workers,
+            latency_target=self.config.get("latency_target", default_latency_target),
+        )
+        self.cache_client = None
+        if self.config.get("cache_socket"):
+            import nb2an.cacheserver
+
+            self.cache_client = nb2an.cacheserver.CacheClient(
+                os.path.expanduser(self.config["cache_socket"]),
+                max_idle=self.max_workers,
+            )
+        import nb2an.cache
+
+        # each store can be bounded by a cache_policies config entry
+        policies = self.config.get("cache_policies") or {}
+        self.url_cache = nb2an.cache.Cache(**policies.get("url_cache", {}))
+        # objects taken from list responses, kept apart so that seeding
+        # many of them can't evict the responses (or anything else)
+        self.object_cache = nb2an.cache.Cache(**policies.get("object_cache", {}))
+        self.single_flight = nb2an.throttle.SingleFlight()
+        self.devices_by_id = nb2an.cache.Cache(**policies.get("devices_by_id", {}))
+        self.devices_by_name = nb2an.cache.Cache(**policies.get("devices_by_name", {}))
+
+        self.data = nb2an.cache.Cache(**policies.get("data", {}))
+        self.indexes = {}
+
+        self.http_backend = self.config.get("http_backend", "requests")
+        self._transport = None
+        self._transport_lock = threading.Lock()
 
     def get_config(self):
+        import yaml
+
         debug(f"loading config from {self.config_path}")
-        content = open(self.config_path).read()
-        # debug(f"{content=}")
-        results = yaml.safe_load(str(open(self.config_path).read()))
+        with open(self.config_path) as config_file:
+            results = yaml.safe_load(config_file.read())
         return results
 
     def fqdn(self, hostname):
@@ -51,88 +173,288 @@ class Netbox:
         return hostname
 
     def shortname_name(self, hostname):
-        if hostname.endswith(self.suffix):
+        if self.suffix and hostname.endswith(self.suffix):
             return hostname[0 : -len(self.suffix)]
         return hostname
 
     def get_cached_device_by_name(self, hostname):
-        # try whatever they passed
-        if hostname in self.devices_by_name:
-            return self.devices_by_name[hostname]
-
-        # try shorter
-        shorter = self.shortname_name(hostname)
-        if shorter in self.devices_by_name:
-            return self.devices_by_name[shorter]
-
-        # try longer
-        fqdn = self.fqdn(hostname)
-        if fqdn in self.devices_by_name:
-            return self.devices_by_name[fqdn]
+        # try whatever they passed, then shorter, then longer
+        for name in [hostname, self.shortname_name(hostname), self.fqdn(hostname)]:
+            device = self.devices_by_name.get(name)
+            if device is not None:
+                return device
 
         return None  # whoops
 
     def get(self, url: str, use_cache: bool = True, strip_results: bool = True):
         "fetch data from a URL, and potentially cache the results"
-        if not url.startswith("http"):
-            url = self.prefix + url
+        url = canonical_url(url, self.prefix)
 
-        if use_cache and url in self.url_cache:
-            debug(f"returning cached: {url}")
-            return self.url_cache[url]
-        debug(f"fetching: {url}")
+        if use_cache:
+            cached = self.cached(url)
+            if cached is not None:
+                debug(f"returning cached: {url}")
+                return cached
+
+        # concurrent requests for the same thing share one fetch
+        return self.single_flight.do(
+            (url, use_cache, strip_results),
+            lambda: self._load(url, use_cache, strip_results),
+        )
+
+    def cached(self, url: str):
+        "The cached response for a canonical URL, or None"
+        cached = self.url_cache.get(url)
+        if cached is None and url in self.object_cache:
+            cached = self.object_cache.get(url)
+        return cached
+
+    def seed_cache(self, url: str, objects: list) -> None:
+        """Cache each object from a list response under its own URL (in
+        object_cache), so later requests for individual objects aren't
+        fetched again"""
+        if "brief" in urlsplit(url).query:
+            return  # brief objects are missing most of their fields
+        for obj in objects:
+            if not isinstance(obj, dict) or "url" not in obj:
+                continue
+            object_url = canonical_url(obj["url"], self.prefix)
+            if object_url not in self.url_cache:
+                self.object_cache[object_url] = obj
+
+    def _load(self, url: str, use_cache: bool = True, strip_results: bool = True):
+        if use_cache:
+            cached = self.cached(url)
+            if cached is not None:
+                return cached
 
+        encoded_results = None
+        if self.cache_client:
+            try:
+                encoded_results = self.cache_client.get(url, strip_results)
+            except (OSError, ConnectionError) as exp:
+                # no broker running (any more): talk to netbox directly
+                warning(f"not using the cache broker: {exp}")
+                self.cache_client = None
+
+        if encoded_results is None:
+            encoded_results = self.fetch(url, strip_results)
+
+        if use_cache:
+            self.url_cache[url] = encoded_results
+            if strip_results and isinstance(encoded_results, list):
+                self.seed_cache(url, encoded_results)
+
+        return encoded_results
+
+    def request_options(self) -> dict:
+        "The authentication and verification options for each request"
         c = self.config
-        headers = {"Authorization": f"Token {c['token']}"}
-        auth = None
+        options = {
+            "headers": {"Authorization": f"Token {c['token']}"},
+            "auth": None,
+            "verify": c.get("verify", True),
+        }
         if "user" in c and "password" in c:
-            auth = (c["user"], c["password"])
+            options["auth"] = (c["user"], c["password"])
 
-        # debug(f"headers: {headers}")
-        verify = self.config.get("verify", True)
-
-        if not verify:
+        if not options["verify"]:
             # disable the warning screen if the user doesn't want validation
             import urllib3
 
             urllib3.disable_warnings()
+        return options
+
+    def get_transport(self):
+        "The (shared, pooled) HTTP transport, created on first use"
+        with self._transport_lock:
+            if self._transport is None:
+                import nb2an.transport
+
+                self._transport = nb2an.transport.create(
+                    self.http_backend,
+                    max_connections=self.max_workers,
+                    verify=self.config.get("verify", True),
+                )
+            return self._transport
+
+    def fetch(self, url: str, strip_results: bool = True):
+        "fetch data from a (full) URL directly from netbox, without caching"
+        debug(f"fetching: {url}")
+        options = self.request_options()
+        transport = self.get_transport()
+
+        def send(url):
+            "GET a url within the endpoint's adaptive concurrency limit"
+            r = self.limiter.request(
+                url,
+                lambda: transport.request("GET", url, **options),
+                max_retries=self.max_retries,
+            )
+            r.raise_for_status()
+            return r
 
         # get the contents
-        r = requests.get(url, headers=headers, auth=auth, verify=verify)
-        r.raise_for_status()
+        r = send(url)
 
         # maybe cache them
         encoded_results = r.json()
         if strip_results:
+            # collect every page of a paginated list
+            next_url = encoded_results.get("next")
             encoded_results = encoded_results["results"]
-        if use_cache:
-            self.url_cache[url] = encoded_results
+            while next_url:
+                debug(f"fetching next page: {next_url}")
+                r = send(next_url)
+                page = r.json()
+                encoded_results.extend(page["results"])
+                next_url = page.get("next")
 
         return encoded_results
 
+    def patch_many(self, url: str, updates: list[dict]) -> list[dict]:
+        """Update many objects of one type using NetBox's bulk PATCH.
+
+        Each update is a dict with the object's id and the fields to
+        change.  Updates are sent in chunks, concurrently within the
+        endpoint's adaptive limit.  The updated objects returned by
+        NetBox replace any cached copies, and the cached lists and
+        datasets they may be in are dropped to be fetched again."""
+        url = canonical_url(url, self.prefix)
+        options = self.request_options()
+        chunks = [
+            updates[n : n + self.chunk_size]
+            for n in range(0, len(updates), self.chunk_size)
+        ]
+
+        transport = self.get_transport()
+
+        def send(chunk):
+            debug(f"patching {len(chunk)} objects at {url}")
+            r = self.limiter.request(
+                url,
+                lambda: transport.request("PATCH", url, json=chunk, **options),
+                max_retries=self.max_retries,
+            )
+            r.raise_for_status()
+            return r.json()
+
+        if len(chunks) > 1 and self.max_workers > 1:
+            import concurrent.futures
+
+            with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+                pages = list(pool.map(send, chunks))
+        else:
+            pages = [send(chunk) for chunk in chunks]
+
+        results = []
+        for page in pages:
+            results.extend(page)
+        self._forget(url, results)
+        return results
+
+    def _forget(self, url: str, objects: list[dict]) -> None:
+        """Drop the cached responses and datasets that updates to an
+        endpoint made stale, keeping the updated objects"""
+        endpoint = canonical_url(url, self.prefix)
+        for key in self.url_cache.keys():
+            if key.startswith(endpoint):
+                self.url_cache.pop(key)
+        for obj in objects:
+            if isinstance(obj, dict) and "url" in obj:
+                object_url = canonical_url(obj["url"], self.prefix)
+                self.object_cache[object_url] = obj
+        self.data.clear()
+        self.indexes = {}
+        self.devices_by_id.clear()
+        self.devices_by_name.clear()
+
+    def get_stats(self) -> dict:
+        "Statistics about this client's use of NetBox"
+        return {
+            "transport": self._transport.name if self._transport else None,
+            "endpoints": self.limiter.stats(),
+            "shared_fetches": self.single_flight.shared,
+            "caches": {
+                "url_cache": self.url_cache.stats(),
+                "object_cache": self.object_cache.stats(),
+                "data": self.data.stats(),
+                "devices_by_id": self.devices_by_id.stats(),
+                "devices_by_name": self.devices_by_name.stats(),
+            },
+        }
+
     def get_racks(self):
         results = self.get("/dcim/racks")
         return results
 
+    def get_many(self, url: str, parameter: str, values: list) -> list:
+        """Fetch a list endpoint filtered by many values of one parameter.
+
+        Values are sent in chunks as repeated (multi-valued) query
+        parameters, with the chunks fetched concurrently.  The results
+        are merged, dropping any objects already seen (by id)."""
+        values = list(dict.fromkeys(values))  # unique, in order
+        separator = "&" if "?" in url else "?"
+        urls = []
+        for n in range(0, len(values), self.chunk_size):
+            chunk = values[n : n + self.chunk_size]
+            query = "&".join([f"{parameter}={value}" for value in chunk])
+            urls.append(f"{url}{separator}{query}")
+
+        if len(urls) > 1 and self.max_workers > 1:
+            import concurrent.futures
+
+            with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+                responses = list(pool.map(self.get, urls))
+        else:
+            responses = [self.get(x) for x in urls]
+
+        results = []
+        seen = set()
+        for response in responses:
+            for obj in response:
+                if obj["id"] in seen:
+                    continue
+                seen.add(obj["id"])
+                results.append(obj)
+        return results
+
     def get_devices(
         self,
         racknums: Union[list[int], int] = None,
         link_other_information: bool = False,
+        shard: "nb2an.shard.Shard" = None,
     ):
+        """Returns the devices in racknums (or all devices), or only
+        those in shard when given.  A shard's linked devices then read
+        per-device data (such as interfaces and addresses) fetched for
+        its devices only."""
         if isinstance(racknums, int):
             racknums = [racknums]
 
         devices = []
+
+        # rack and site shards only need their own racks' devices, and
+        # the unracked devices (which are sharded by name or site)
+        by_rack = shard and shard.by != "name" and not racknums
+        if by_rack:
+            racknums = [x["id"] for x in self.get_racks() if shard.includes_rack(x)]
+            devices.extend(self.get("/dcim/devices/?rack_id=null"))
+
         if racknums:
-            for racknum in racknums:
-                rack_devices = self.get("/dcim/devices/?rack_id=" + str(racknum))
-                devices.extend(rack_devices)
-        else:
+            devices.extend(self.get_many("/dcim/devices/", "rack_id", racknums))
+        elif not by_rack:
             all_devices = self.get("/dcim/devices/")
             devices.extend(all_devices)
 
+        scope = None
+        if shard:
+            devices = [x for x in devices if shard.includes(x)]
+            scope = tuple(sorted(x["id"] for x in devices))
+
         if link_other_information:
-            devices = self.link_device_data(devices)
+            devices = self.link_device_data(devices, scope)
         return devices
 
     def get_devices_by_id(
@@ -152,8 +474,9 @@ class Netbox:
         results = []
         for device in devices:
             debug(f"looking for device {device} by id")
-            if device in self.devices_by_id:
-                results.append(self.devices_by_id[device])
+            cached = self.devices_by_id.get(device)
+            if cached is not None:
+                results.append(cached)
                 continue
 
             the_devices = self.get("/dcim/devices/" + str(device), strip_results=False)
@@ -208,22 +531,11 @@ class Netbox:
 
     # generic grabber for things attached to a device
     def get_device_components_by_device_id(self, component: str, device_id: int):
-        self.bootstrap_all_data()
-        objects = self.data[component]
-
-        results = []
-        for obj in objects:
-            try:
-                if obj["connected_endpoint"]["device"]["id"] == device_id:
-                    results.append(obj)
-
-            except Exception:
-                pass
-        return results
+        index = self.get_index(component + "_by_endpoint")
+        return list(index.get(device_id, []))
 
     def get_device_components_by_device_name(self, component: str, device_name: int):
-        self.bootstrap_all_data()
-        objects = self.data[component]
+        objects = self.get_dataset(component)
 
         results = []
         for obj in objects:
@@ -236,8 +548,7 @@ class Netbox:
 
     # Outlets
     def get_outlets(self):
-        self.bootstrap_all_data()
-        return self.data["outlets"]
+        return self.get_dataset("outlets")
 
     @property
     def outlets(self):
@@ -251,8 +562,7 @@ class Netbox:
 
     # power ports
     def get_power_ports(self, device: int = None):
-        self.bootstrap_all_data()
-        return self.data["power_ports"]
+        return self.get_dataset("power_ports")
 
     @property
     def power_ports(self):
@@ -264,24 +574,47 @@ class Netbox:
     def get_power_ports_by_device_name(self, device: str):
         return self.get_device_components_by_device_name("power_ports", device)
 
-    def get_addresses(self) -> dict:
-        "Returns a nested dict of all registered hosts/interface/family = addresses"
-        interface_addresses = collections.defaultdict(dict)
+    def get_ip_addresses(self, device_ids: list[int] = None) -> list[dict]:
+        """Returns every IP address object (of both families), or only
+        those of the devices in device_ids (fetched in batches)"""
+        results = []
         for family in [4, 6]:
-            r = self.get(f"/ipam/ip-addresses/?family={family}")
-            for addr in r:
-                host = addr["assigned_object"]["device"]["display"]
-                endpoint = addr["assigned_object"]["name"]
-                if endpoint not in interface_addresses[host]:
-                    interface_addresses[host][endpoint] = {}
-                interface_addresses[host][endpoint][addr["family"]["label"]] = addr[
-                    "address"
-                ]
+            url = f"/ipam/ip-addresses/?family={family}"
+            if device_ids is not None:
+                results.extend(self.get_many(url, "device_id", device_ids))
+            else:
+                results.extend(self.get(url))
+        return results
+
+    def get_addresses(self, device_ids: list[int] = None) -> dict:
+        """Returns a nested dict of registered hosts/interface/family = addresses
+
+        If device_ids is passed, only the addresses for those devices are
+        fetched (in batches) rather than every address in NetBox.  Only
+        the last address of each family is kept for an interface."""
+        interface_addresses = collections.defaultdict(dict)
+        for addr in self.get_ip_addresses(device_ids):
+            if not addr.get("assigned_object"):
+                continue
+            host = addr["assigned_object"]["device"]["display"]
+            endpoint = addr["assigned_object"]["name"]
+            if endpoint not in interface_addresses[host]:
+                interface_addresses[host][endpoint] = {}
+            interface_addresses[host][endpoint][addr["family"]["label"]] = addr[
+                "address"
+            ]
 
         return dict(interface_addresses)
 
-    def get_interfaces(self) -> list:
-        r = self.get(f"/dcim/interfaces/?limit=100000000")
+    def get_interfaces(self, device_ids: list[int] = None) -> dict:
+        """Returns a dict of device names to lists of their interfaces
+
+        If device_ids is passed, only the interfaces for those devices
+        are fetched (in batches) rather than every interface in NetBox."""
+        if device_ids is not None:
+            r = self.get_many("/dcim/interfaces/?limit=1000", "device_id", device_ids)
+        else:
+            r = self.get(f"/dcim/interfaces/?limit=100000000")
 
         interfaces = collections.defaultdict(dict)
         for interface in r:
@@ -290,46 +623,120 @@ class Netbox:
 
         return interfaces
 
-    def bootstrap_all_data(self) -> None:
-        "pre-fetch all netbox data"
-        if "interfaces" not in self.data:
-            self.data["interfaces"] = self.get_interfaces()
-
-        if "addresses" not in self.data:
-            self.data["addresses"] = self.get_addresses()
-
-        if "devices" not in self.data:
-            self.data["devices"] = self.get_devices()
+    def get_ip_index(self, scope: tuple = None) -> "nb2an.ipindex.IPIndex":
+        "Returns an index of all addresses for ownership and prefix lookups"
+        return self.get_dataset("ip_index", scope)
+
+    def _build_ip_index(self, scope: tuple = None):
+        import nb2an.ipindex
+
+        # every address, including an interface's secondaries and VIPs
+        index = nb2an.ipindex.IPIndex()
+        index.add_ip_addresses(self.get_ip_addresses(scope))
+        return index
+
+    def get_topology(self, scope: tuple = None) -> "nb2an.topology.Topology":
+        "Returns the graph of cabled connections between devices"
+        return self.get_dataset("topology", scope)
+
+    def _build_topology(self, scope: tuple = None):
+        import nb2an.topology
+
+        interfaces = []
+        for device_interfaces in self.get_dataset("interfaces", scope).values():
+            interfaces.extend(device_interfaces)
+        return nb2an.topology.Topology.from_components(
+            interfaces,
+            self.get_dataset("power_ports"),
+            self.get_dataset("outlets"),
+        )
+
+    def get_dataset(self, name: str, scope: tuple = None):
+        """Fetch (once) one of the bulk NetBox datasets, which are pinned in
+        memory.  Per-device datasets can be limited to a scope (a tuple of
+        device ids), and are stored apart from the full ones."""
+        scoped = {
+            "interfaces": lambda: self.get_interfaces(scope),
+            "addresses": lambda: self.get_addresses(scope),
+            "ip_index": lambda: self._build_ip_index(scope),
+            "topology": lambda: self._build_topology(scope),
+        }
+        loaders = {
+            "devices": self.get_devices,
+            "outlets": lambda: self.get("/dcim/power-outlets/"),
+            "power_ports": lambda: self.get("/dcim/power-ports/"),
+            **scoped,
+        }
+        key = name
+        if scope is not None and name in scoped:
+            key = (name, scope)
+        dataset = self.data.get(key)
+        if dataset is None:
+            dataset = loaders[name]()
+            self.data.set(key, dataset, pin=True)
+        return dataset
+
+    def get_index(self, name: str) -> dict:
+        "Build (once) and return a lookup index over a dataset"
+        if name in self.indexes:
+            return self.indexes[name]
+
+        index = collections.defaultdict(list)
+        if name == "power_ports_by_device":
+            for port in self.get_dataset("power_ports"):
+                index[port["device"]["name"]].append(port)
+        elif name.endswith("_by_endpoint"):
+            # components indexed by the device id they're connected to
+            for obj in self.get_dataset(name[0 : -len("_by_endpoint")]):
+                try:
+                    index[obj["connected_endpoint"]["device"]["id"]].append(obj)
+                except Exception:
+                    pass
+        else:
+            raise ValueError(f"unknown index {name}")
 
-        self.data["outlets"] = self.get("/dcim/power-outlets/")
-        self.data["power_ports"] = self.get("/dcim/power-ports/")
+        self.indexes[name] = dict(index)
+        return self.indexes[name]
 
-        if "power_ports" not in self.data:
-            self.data["power_ports"] = self.get_power_ports()
+    def bootstrap_all_data(self) -> None:
+        "pre-fetch all netbox data"
+        for name in ["interfaces", "addresses", "devices", "outlets", "power_ports"]:
+            self.get_dataset(name)
 
-    def link_device_data(self, devices=None) -> dict:
-        self.bootstrap_all_data()
+    def link_device_data(self, devices=None, scope: tuple = None) -> list:
+        """Wrap devices in LinkedDevice views so their interfaces,
+        addresses, power_ports and outlets are available on access
+        (limited to the devices in scope, when given)"""
         if not devices:
-            devices = self.data["devices"]
+            devices = self.get_dataset("devices")
 
+        results = []
         for device in devices:
-            if device["name"] in self.data["interfaces"]:
-                device["interfaces"] = self.data["interfaces"][device["name"]]
-            if device["name"] in self.data["addresses"]:
-                device["addresses"] = self.data["addresses"][device["name"]]
-
-            device["power_ports"] = []
-            for port in self.data["power_ports"]:
-                if port["device"]["name"] == device["name"]:
-                    device["power_ports"].append(port)
+            if not isinstance(device, LinkedDevice):
+                device = LinkedDevice(device, self, scope)
+            results.append(device)
 
             self.devices_by_id[device["id"]] = device
             self.devices_by_name[device["name"]] = device
 
-        return devices
+        return results
 
     def get_interfaces_by_device_name(self, device_name: str) -> dict:
-        self.bootstrap_all_data()
-
-        interfaces = self.data["interfaces"][device_name]
+        interfaces = self.get_dataset("interfaces")[device_name]
         return interfaces
+
+
+_shared_netbox = None
+
+
+def get_netbox(**kwargs) -> Netbox:
+    """Return the Netbox client shared by everything in this process,
+    creating (and loading the configuration for) it on first use"""
+    global _shared_netbox
+    if _shared_netbox is None:
+        _shared_netbox = Netbox(**kwargs)
+        if _shared_netbox.config.get("instances"):
+            import nb2an.federation
+
+            _shared_netbox = nb2an.federation.FederatedNetbox(**kwargs)
+    return _shared_netbox
@@ -0,0 +1,135 @@
+"""A pipeline of stages connected by bounded queues.
+
+Each stage runs its function on its own worker threads, taking items
+from the previous stage's queue and putting results on the next one,
+so that (eg) disk reads, NetBox requests and CPU-bound transforms all
+make progress at the same time.  The queues are bounded, so a slow
+stage makes earlier stages wait rather than letting items pile up in
+memory.  A stage's function may return None to drop an item."""
+
+import queue
+import threading
+import time
+from logging import debug, error
+
+_DONE = object()
+
+
+class Stage:
+    "One step of a pipeline, and its throughput statistics"
+
+    def __init__(self, name: str, function, workers: int = 1):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.items = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy = 0.0  # seconds spent in function, summed over workers
+        self.waiting = 0.0  # seconds spent waiting on the next stage
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def stats(self) -> dict:
+        elapsed = (self.finished or time.time()) - (self.started or time.time())
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "busy": self.busy,
+            "waiting": self.waiting,
+            "elapsed": elapsed,
+            "per_second": self.items / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class Pipeline:
+    "Runs items through a list of stages"
+
+    def __init__(self, stages: list[Stage], queue_size: int = 16):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for x in stages]
+        self.failure = None
+
+    def _work(self, n: int, remaining: list) -> None:
+        stage = self.stages[n]
+        source = self.queues[n]
+        destination = self.queues[n + 1] if n + 1 < len(self.stages) else None
+
+        while True:
+            item = source.get()
+            if item is _DONE:
+                break
+
+            start = time.time()
+            try:
+                result = stage.function(item)
+            except BaseException as exp:
+                error(f"{stage.name} failed: {exp}")
+                with stage.lock:
+                    stage.errors += 1
+                    if self.failure is None:
+                        self.failure = exp
+                continue
+            finally:
+                with stage.lock:
+                    stage.busy += time.time() - start
+
+            with stage.lock:
+                stage.items += 1
+                if result is None:
+                    stage.dropped += 1
+
+            if result is not None and destination is not None:
+                start = time.time()
+                destination.put(result)  # waits while the next stage is behind
+                with stage.lock:
+                    stage.waiting += time.time() - start
+
+        # the last worker out tells the next stage there's nothing more
+        with stage.lock:
+            remaining[n] -= 1
+            last = remaining[n] == 0
+            if last:
+                stage.finished = time.time()
+        if last and destination is not None:
+            for worker in range(self.stages[n + 1].workers):
+                destination.put(_DONE)
+
+    def run(self, items) -> None:
+        """Feed items through every stage, returning once all are done.
+
+        If any stage raised an exception, the first one is re-raised
+        after the remaining items have been processed.  If items itself
+        raises, the items already queued are finished before its
+        exception is re-raised."""
+        remaining = [stage.workers for stage in self.stages]
+        threads = []
+        for n, stage in enumerate(self.stages):
+            stage.started = time.time()
+            for worker in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work, args=(n, remaining), daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in items:
+                self.queues[0].put(item)
+        finally:
+            # always let the stages finish, or they'd wait forever
+            for worker in range(self.stages[0].workers):
+                self.queues[0].put(_DONE)
+
+            for thread in threads:
+                thread.join()
+
+        debug(f"pipeline finished: { {x.name: x.items for x in self.stages} }")
+        if self.failure is not None:
+            raise self.failure
+
+    def stats(self) -> dict:
+        return {stage.name: stage.stats() for stage in self.stages}
@@ -1,23 +1,207 @@
 from logging import debug, info, warning, error, critical
 import re
+import time
+import heapq
+import json
+import collections
+import threading
+import nb2an.dotnest
 update_ansible_plugins = {}
 
-from functools import wraps
+try:
+    from re import _parser as sre_parse
+except ImportError:  # before python 3.11
+    import sre_parse
+
+from functools import wraps, lru_cache
+
+
+class MappingProfile:
+    """Collects call counts and timings for plugins and mapping keys.
+
+    Entries are keyed by a (kind, name) tuple where kind is either
+    "plugin" or "mapping".  For each entry the slowest hosts are
+    remembered so outliers can be reported."""
+
+    def __init__(self, outliers: int = 3):
+        self.enabled = False
+        self.outliers = outliers
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.entries = {}
+
+    def record(self, kind: str, name: str, host: str, elapsed: float):
+        "Add one timed call to the (kind, name) entry"
+        with self._lock:
+            entry = self.entries.get((kind, name))
+            if entry is None:
+                entry = {"count": 0, "total": 0.0, "max": 0.0, "hosts": []}
+                self.entries[(kind, name)] = entry
+            entry["count"] += 1
+            entry["total"] += elapsed
+            entry["max"] = max(entry["max"], elapsed)
+
+            # keep only the N slowest hosts in a min-heap, holding each
+            # host's slowest call once
+            slowest = entry["hosts"]
+            host = str(host)
+            for n, (previous, seen) in enumerate(slowest):
+                if seen == host:
+                    if elapsed > previous:
+                        slowest[n] = (elapsed, host)
+                        heapq.heapify(slowest)
+                    break
+            else:
+                if len(slowest) < self.outliers:
+                    heapq.heappush(slowest, (elapsed, host))
+                elif slowest and elapsed > slowest[0][0]:
+                    heapq.heapreplace(slowest, (elapsed, host))
+
+    def report(self, limit: int = None, kind: str = None) -> list:
+        "Return entries ranked by cumulative time, most expensive first"
+        with self._lock:
+            rows = []
+            for (entry_kind, name), entry in self.entries.items():
+                if kind and entry_kind != kind:
+                    continue
+                rows.append(
+                    {
+                        "kind": entry_kind,
+                        "name": name,
+                        "count": entry["count"],
+                        "total": entry["total"],
+                        "mean": entry["total"] / entry["count"],
+                        "max": entry["max"],
+                        "slowest_hosts": [
+                            host for _, host in sorted(entry["hosts"], reverse=True)
+                        ],
+                    }
+                )
+        rows.sort(key=lambda x: x["total"], reverse=True)
+        if limit:
+            rows = rows[0:limit]
+        return rows
+
+
+profile = MappingProfile()
+
+
+def _profile_host(dn):
+    "Best guess at a host name for the data being processed"
+    try:
+        return dn.data.get("name")
+    except Exception:
+        return None
 
 
 def plugin(function):
     # register it
     fn_name = function.__name__
     fn_name = fn_name.replace("fn_", "", 1)
-    update_ansible_plugins[fn_name] = function
 
     @wraps(function)
     def _wrap(*args, **kwargs):
-        return function(*args, **kwargs)
+        if not profile.enabled:
+            return function(*args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            host = _profile_host(args[0]) if args else None
+            profile.record("plugin", fn_name, host, time.perf_counter() - start)
 
+    update_ansible_plugins[fn_name] = _wrap
     return _wrap
 
 
+def batch_plugin(prepare):
+    """Register a plugin that shares work between hosts.
+
+    prepare(all_devices, definition) is called once per run for each
+    distinct definition using the plugin, and its result is handed to
+    every call of the plugin (as context.prepared) along with a memo
+    dict (context.memo) that lasts for the run.  Batch plugins are
+    called as function(dn, yaml_struct, definition, item, context)."""
+
+    def register(function):
+        wrapped = plugin(function)
+        wrapped.prepare = prepare
+        return wrapped
+
+    return register
+
+
+def is_batch_plugin(name: str) -> bool:
+    return hasattr(update_ansible_plugins.get(name), "prepare")
+
+
+class PluginContext:
+    "What a batch plugin call gets from its run"
+
+    def __init__(self, prepared, memo: dict, lock: threading.Lock):
+        self.prepared = prepared
+        self.memo = memo
+        self._lock = lock
+
+    def remember(self, key, compute):
+        "Return memo[key], calling compute() to fill it in the first time"
+        with self._lock:
+            if key not in self.memo:
+                self.memo[key] = compute()
+            return self.memo[key]
+
+
+class PluginRun:
+    """Data shared by every host's plugin calls during one run: the
+    prepared results of batch plugins and their memos.
+
+    all_devices is every device in NetBox (not just those being
+    processed), or a function returning them that's only called if a
+    batch plugin needs them."""
+
+    def __init__(self, all_devices):
+        self._all_devices = all_devices
+        self.prepared = {}
+        self.memos = collections.defaultdict(dict)
+        self._lock = threading.RLock()
+
+    @property
+    def all_devices(self) -> list:
+        with self._lock:
+            if callable(self._all_devices):
+                self._all_devices = self._all_devices()
+            return self._all_devices
+
+    def prepare(self, name: str, definition: dict):
+        "Run (once) a batch plugin's prepare hook for a definition"
+        key = (name, json.dumps(definition, sort_keys=True, default=str))
+        with self._lock:
+            if key not in self.prepared:
+                debug(f"preparing {name} for {len(self.all_devices)} devices")
+                fn = update_ansible_plugins[name]
+                self.prepared[key] = fn.prepare(self.all_devices, definition)
+            return self.prepared[key]
+
+    def prepare_all(self, changes, plugin_key: str = "__function"):
+        "Prepare every batch plugin used in a changes mapping up front"
+        if not isinstance(changes, dict):
+            return
+        if is_batch_plugin(changes.get(plugin_key)):
+            self.prepare(changes[plugin_key], changes)
+            return
+        for value in changes.values():
+            self.prepare_all(value, plugin_key)
+
+    def context(self, name: str, definition: dict) -> PluginContext:
+        return PluginContext(
+            self.prepare(name, definition), self.memos[name], self._lock
+        )
+
+
 def keys_present(definition: dict, keys: list[str]):
     for key in keys:
         if key not in definition:
@@ -26,19 +210,159 @@ def keys_present(definition: dict, keys: list[str]):
     return True
 
 
+@lru_cache(maxsize=1024)
+def compile_pattern(search: str):
+    "Compile (and remember) a regular expression from a mapping definition"
+    return re.compile(search)
+
+
+def _has_backreference(items) -> bool:
+    "Whether a parsed pattern refers back to a group (by number or name)"
+    references = (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS)
+    for item in items:
+        if isinstance(item, tuple) and item and any(item[0] is x for x in references):
+            return True
+        if isinstance(item, (tuple, list, sre_parse.SubPattern)):
+            if _has_backreference(item):
+                return True
+    return False
+
+
+def combinable(search: str) -> bool:
+    """Whether a pattern still means the same inside a larger alternation.
+
+    Backreferences would point at the wrong (renumbered) group, and
+    inline global flags and named groups can't be repeated or placed
+    after other rules, so such patterns must be used on their own."""
+    pattern = compile_pattern(search)
+    if pattern.groupindex or pattern.flags & ~re.UNICODE:
+        return False
+    return not _has_backreference(sre_parse.parse(search))
+
+
+@lru_cache(maxsize=256)
+def compile_rules(rules: tuple):
+    """Combine an ordered tuple of (search, replacement) pairs into one
+    alternation, returning the combined pattern and per-rule data.
+
+    Each rule is wrapped in its own capturing group so the rule that
+    matched can be found with the match's lastindex.  When any rule
+    can't be combined (see combinable) the combined pattern is None
+    and the per-rule data is a list, in rule order."""
+    if not all(combinable(search) for search, replacement in rules):
+        return None, [
+            (compile_pattern(search), replacement, "\\" in replacement)
+            for search, replacement in rules
+        ]
+
+    parts = []
+    by_group = {}
+    group = 1
+    for search, replacement in rules:
+        pattern = compile_pattern(search)
+        parts.append(f"({search})")
+        # templates with backrefs need the rule's own match to expand
+        by_group[group] = (pattern, replacement, "\\" in replacement)
+        group += pattern.groups + 1
+    return re.compile("|".join(parts)), by_group
+
+
+def _next_match(pattern, value: str, position: int, must_advance: bool):
+    """A rule's first match from position, or False.  As in re.sub,
+    after an empty match the next match may not be empty at the same
+    position (but may be a longer match starting there)."""
+    for match in pattern.finditer(value, position):
+        if must_advance and match.end() == position:
+            continue  # finditer then looks for a non-empty one here
+        return match
+    return False
+
+
+def replace_separately(rules: list, value: str, count: int = 0) -> str:
+    """Apply rules with the same meaning as a combined alternation, but
+    searching with each rule's own pattern.
+
+    The leftmost match wins, and the earliest rule among matches
+    starting at the same place.  Each rule's next match is remembered
+    until the text before it has been consumed."""
+    results = []
+    upcoming = [None] * len(rules)  # None: not searched, False: no more
+    position = 0
+    must_advance = False
+    replaced = 0
+    while position <= len(value) and (not count or replaced < count):
+        best = None
+        for n, (pattern, replacement, expand) in enumerate(rules):
+            match = upcoming[n]
+            if match is None or (
+                match
+                and (
+                    match.start() < position
+                    or (must_advance and match.end() == position)
+                )
+            ):
+                match = _next_match(pattern, value, position, must_advance)
+                upcoming[n] = match
+            if match and (best is None or match.start() < best[0].start()):
+                best = (match, replacement, expand)
+        if best is None:
+            break
+
+        match, replacement, expand = best
+        results.append(value[position : match.start()])
+        results.append(match.expand(replacement) if expand else replacement)
+        replaced += 1
+        position = match.end()
+        must_advance = match.end() == match.start()
+
+    results.append(value[position:])
+    return "".join(results)
+
+
 @plugin
 def fn_replace(dn, yaml_struct, definition, item):
     "A function to do internal string replacements before setting a value"
     if not keys_present(definition, ['value', 'search', 'replacement']):
         return
     value = dn.get(definition['value'])
-    search = definition['search']
+    search = compile_pattern(definition['search'])
     replacement = definition['replacement']
-    newvalue = re.sub(search, replacement, value,
-                      count=definition.get('count', 0))
+    newvalue = search.sub(replacement, value,
+                          count=definition.get('count', 0))
     yaml_struct[item] = newvalue
 
 
+@plugin
+def fn_replace_many(dn, yaml_struct, definition, item):
+    """Apply an ordered list of search/replacement rules in a single pass.
+
+    At each position in the value the first rule (in list order) that
+    matches wins, and the replaced text is not searched again."""
+    if not keys_present(definition, ["value", "rules"]):
+        return
+    value = dn.get(definition["value"])
+    rules = tuple(
+        (rule["search"], rule.get("replacement", "")) for rule in definition["rules"]
+    )
+    count = definition.get("count", 0)
+    combined, by_group = compile_rules(rules)
+    if combined is None:
+        yaml_struct[item] = replace_separately(by_group, value, count)
+        return
+
+    def _replace(match):
+        pattern, replacement, expand = by_group[match.lastindex]
+        if expand:
+            rule_match = pattern.match(match.string, match.start())
+            if rule_match.end() != match.end():
+                # re.sub passed over an empty match here
+                rule_match = _next_match(pattern, match.string, match.start(), True)
+            return rule_match.expand(replacement)
+        return replacement
+
+    yaml_struct[item] = combined.sub(_replace, value, count=count)
+
+
 @plugin
 def fn_delete(dn, yaml_struct, definition, item):
     "A plugin to remove a node"
@@ -52,7 +376,8 @@ def fn_foreach_create_dict(dn, yaml_struct, definition, item):
     # clear the existing content
     yaml_struct[item] = {}
 
-    fn_foreach_augment_dict(dn, yaml_struct, definition, item)
+    # unwrapped, so this isn't also profiled as a foreach_augment_dict call
+    fn_foreach_augment_dict.__wrapped__(dn, yaml_struct, definition, item)
 
 
 @plugin
@@ -77,3 +402,45 @@ def fn_foreach_augment_dict(dn, yaml_struct, definition, item):
             replacement[subitem] = value
         yaml_struct[item][keyvalue] = replacement
 
+
+@plugin
+def fn_neighbors(dn, yaml_struct, definition, item):
+    "Lists the devices and ports cabled to each interface"
+    kinds = definition.get("kinds", ["interface"])
+    neighbors = dn.get("neighbors")
+    yaml_struct[item] = {}
+    for name, peers in neighbors.items():
+        peers = [
+            {"device": peer["device"], "port": peer["port"]}
+            for peer in peers
+            if peer["kind"] in kinds
+        ]
+        if peers:
+            yaml_struct[item][name] = peers
+
+
+def _group_key(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def _prepare_group_members(all_devices, definition):
+    "Group (the value of) every device by its value at definition['by']"
+    groups = collections.defaultdict(list)
+    for device in all_devices:
+        dn = nb2an.dotnest.DotNest(device)
+        try:
+            key = dn.get(definition['by'])
+            value = dn.get(definition.get('value', 'name'))
+        except Exception:
+            continue
+        groups[_group_key(key)].append(value)
+    return {key: sorted(values, key=str) for key, values in groups.items()}
+
+
+@batch_plugin(prepare=_prepare_group_members)
+def fn_group_members(dn, yaml_struct, definition, item, context):
+    "Lists every device sharing this device's value of 'by' (eg, site.slug)"
+    if not keys_present(definition, ['by']):
+        return
+    key = dn.get(definition['by'])
+    yaml_struct[item] = list(context.prepared.get(_group_key(key), []))
@@ -0,0 +1,104 @@
+"""Rack elevation, space and power summaries for many racks at once.
+
+Everything is computed in a single pass over data fetched in bulk
+(racks, devices, device types, power ports and outlets), indexed by
+rack, rather than querying NetBox once per rack."""
+
+import collections
+
+
+def _value(obj, key):
+    "Get a key's value, using the value of choice fields ({value, label})"
+    value = obj.get(key)
+    if isinstance(value, dict):
+        value = value.get("value")
+    return value
+
+
+def build_rack_report(
+    racks: list,
+    devices: list,
+    device_types: list = [],
+    power_ports: list = [],
+    outlets: list = [],
+) -> list[dict]:
+    """Returns a summary for each rack:
+
+    the elevation (devices by position), U used and free, and the
+    allocated and maximum power draw of the rack and of each PDU in it."""
+    heights = {x["id"]: x.get("u_height", 1) for x in device_types}
+
+    devices_by_rack = collections.defaultdict(list)
+    rack_by_device = {}
+    for device in devices:
+        if device.get("rack"):
+            devices_by_rack[device["rack"]["id"]].append(device)
+            rack_by_device[device["id"]] = device["rack"]["id"]
+
+    # power draws per rack, and per power port so PDUs can sum them
+    draws_by_rack = collections.defaultdict(lambda: [0, 0])
+    draws_by_port = {}
+    for port in power_ports:
+        allocated = port.get("allocated_draw") or 0
+        maximum = port.get("maximum_draw") or 0
+        draws_by_port[port["id"]] = (allocated, maximum)
+        rack = rack_by_device.get(port["device"]["id"])
+        if rack is not None:
+            draws_by_rack[rack][0] += allocated
+            draws_by_rack[rack][1] += maximum
+
+    pdus_by_rack = collections.defaultdict(dict)
+    for outlet in outlets:
+        pdu = outlet["device"]
+        rack = rack_by_device.get(pdu["id"])
+        if rack is None:
+            continue
+        name = pdu.get("name") or pdu.get("display")
+        summary = pdus_by_rack[rack].setdefault(
+            name, {"outlets": 0, "used": 0, "allocated_draw": 0, "maximum_draw": 0}
+        )
+        summary["outlets"] += 1
+        endpoint = outlet.get("connected_endpoint")
+        if endpoint and "id" in endpoint:
+            summary["used"] += 1
+            allocated, maximum = draws_by_port.get(endpoint["id"], (0, 0))
+            summary["allocated_draw"] += allocated
+            summary["maximum_draw"] += maximum
+
+    results = []
+    for rack in racks:
+        elevation = []
+        used = 0
+        for device in devices_by_rack.get(rack["id"], []):
+            height = heights.get((device.get("device_type") or {}).get("id"), 1)
+            position = device.get("position")
+            if position is not None:
+                used += height
+            elevation.append(
+                {
+                    "position": position,
+                    "height": height,
+                    "name": device.get("name") or device.get("display"),
+                    "face": _value(device, "face"),
+                }
+            )
+        elevation.sort(key=lambda x: x["position"] or 0, reverse=True)
+
+        u_height = rack.get("u_height") or 0
+        allocated, maximum = draws_by_rack.get(rack["id"], (0, 0))
+        results.append(
+            {
+                "id": rack["id"],
+                "name": rack.get("name") or rack.get("display"),
+                "site": (rack.get("site") or {}).get("display"),
+                "u_height": u_height,
+                "u_used": used,
+                "u_free": u_height - used,
+                "devices": len(elevation),
+                "allocated_draw": allocated,
+                "maximum_draw": maximum,
+                "elevation": elevation,
+                "pdus": pdus_by_rack.get(rack["id"], {}),
+            }
+        )
+    return results
@@ -0,0 +1,180 @@
+"""Splitting one run over many devices into deterministic shards.
+
+A shard "i/N" (counting from 1) holds the devices whose key hashes to
+bucket i of N, where the key is the device's name, rack or site.  The
+hash is stable across processes and machines, so N runners given
+shards 1/N to N/N each process a distinct slice and together cover
+every device.  Sharding by rack or site lets each shard fetch only its
+own racks' devices from NetBox (along with the unracked devices, which
+are assigned to shards by name or site).
+
+The outputs of the shards (drift reports, write-back plans, request
+statistics or patches) can be combined again with merge()."""
+
+import argparse
+import hashlib
+import json
+
+SHARD_KEYS = ["name", "rack", "site"]
+
+
+class Shard:
+    "One slice of the devices"
+
+    def __init__(self, index: int, count: int, by: str = "name"):
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"invalid shard {index}/{count}")
+        if by not in SHARD_KEYS:
+            raise ValueError(f"unknown shard key {by}")
+        self.index = index
+        self.count = count
+        self.by = by
+
+    @classmethod
+    def parse(cls, text: str, by: str = "name") -> "Shard":
+        """Create a shard from an 'i/N' string (also the --shard type, so
+        bad values are reported as usage errors)"""
+        try:
+            index, count = [int(x) for x in text.split("/")]
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                f"shards must be given as i/N, not '{text}'"
+            )
+        if not 1 <= index <= count:
+            raise argparse.ArgumentTypeError(
+                f"invalid shard {text}: i must be between 1 and N"
+            )
+        return cls(index, count, by)
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def bucket(self, key) -> int:
+        digest = hashlib.sha1(str(key).encode()).hexdigest()
+        return int(digest[:8], 16) % self.count + 1
+
+    def device_key(self, device: dict):
+        if self.by == "rack":
+            rack = device.get("rack")
+            if rack:
+                return rack.get("id")
+            return device["name"]  # spread unracked devices by name
+        if self.by == "site":
+            return (device.get("site") or {}).get("slug")
+        return device["name"]
+
+    def rack_key(self, rack: dict):
+        if self.by == "site":
+            return (rack.get("site") or {}).get("slug")
+        return rack["id"]
+
+    def includes(self, device: dict) -> bool:
+        return self.bucket(self.device_key(device)) == self.index
+
+    def includes_rack(self, rack: dict) -> bool:
+        "Whether a rack's devices belong to this shard (for rack or site shards)"
+        return self.bucket(self.rack_key(rack)) == self.index
+
+
+def add_arguments(parser) -> None:
+    "Add the --shard and --shard-by options to a tool's argument parser"
+    parser.add_argument(
+        "--shard",
+        default=None,
+        type=Shard.parse,
+        help="Only process shard i of N (given as i/N) of the devices",
+    )
+
+    parser.add_argument(
+        "--shard-by",
+        default="name",
+        choices=SHARD_KEYS,
+        help="Assign devices to shards by their name, rack or site",
+    )
+
+
+def from_args(args) -> Shard:
+    if not args.shard:
+        return None
+    return Shard(args.shard.index, args.shard.count, args.shard_by)
+
+
+def _merge_drift(reports: list[dict]) -> dict:
+    summary = {}
+    hosts = []
+    for report in reports:
+        for key, value in report["summary"].items():
+            summary[key] = summary.get(key, 0) + value
+        hosts.extend(report["hosts"])
+    return {"summary": summary, "hosts": sorted(hosts, key=lambda x: x["host"])}
+
+
+def _merge_stats(stats: list[dict]) -> dict:
+    endpoints = {}
+    caches = {}
+    for stat in stats:
+        for name, endpoint in stat["endpoints"].items():
+            merged = endpoints.setdefault(
+                name,
+                {"limit": 0, "requests": 0, "throttled": 0, "slow": 0, "latency": 0.0},
+            )
+            merged["limit"] = max(merged["limit"], endpoint["limit"])
+            for key in ["requests", "throttled", "slow"]:
+                merged[key] += endpoint[key]
+            merged["latency"] += endpoint["mean_latency"] * endpoint["requests"]
+        for name, cache in stat["caches"].items():
+            merged = caches.setdefault(name, {})
+            for key, value in cache.items():
+                if isinstance(value, int) and not isinstance(value, bool):
+                    merged[key] = merged.get(key, 0) + value
+
+    for endpoint in endpoints.values():
+        latency = endpoint.pop("latency")
+        endpoint["in_flight"] = 0
+        endpoint["mean_latency"] = (
+            latency / endpoint["requests"] if endpoint["requests"] else 0.0
+        )
+    for cache in caches.values():
+        lookups = cache.get("hits", 0) + cache.get("misses", 0)
+        cache["hit_rate"] = cache.get("hits", 0) / lookups if lookups else 0.0
+
+    return {
+        "endpoints": endpoints,
+        "shared_fetches": sum(x.get("shared_fetches", 0) for x in stats),
+        "caches": caches,
+    }
+
+
+def _merge_plans(plans: list[dict]) -> dict:
+    merged = {}
+    for plan in plans:
+        for endpoint, updates in plan.items():
+            merged.setdefault(endpoint, []).extend(updates)
+    return merged
+
+
+def merge(documents: list[str]) -> str:
+    """Combine the outputs of several shards.
+
+    JSON drift reports, request statistics and write-back plans are
+    merged into one document of the same kind; anything else (such as
+    patches) is concatenated."""
+    try:
+        parsed = [json.loads(x) for x in documents]
+    except ValueError:
+        return "".join(documents)
+
+    if all(isinstance(x, dict) and "summary" in x and "hosts" in x for x in parsed):
+        merged = _merge_drift(parsed)
+    elif all(
+        isinstance(x, dict) and "endpoints" in x and "caches" in x for x in parsed
+    ):
+        merged = _merge_stats(parsed)
+    elif all(
+        isinstance(x, dict) and all(isinstance(y, list) for y in x.values())
+        for x in parsed
+    ):
+        merged = _merge_plans(parsed)
+    else:
+        raise ValueError("the shard outputs are not all of the same kind")
+    return json.dumps(merged, indent=2, default=str) + "\n"
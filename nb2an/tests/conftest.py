@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+"""A Netbox that answers requests from canned data, for tests"""
+import pytest
+
+devices = [
+    {"id": 1, "name": "pdu1", "rack": {"id": 10}},
+    {"id": 2, "name": "server1", "rack": {"id": 10}},
+]
+
+interfaces = [
+    {
+        "id": 100,
+        "name": "eth0",
+        "device": {"id": 2, "name": "server1"},
+        "cable_peer_type": "dcim.interface",
+        "cable_peer": {
+            "id": 101,
+            "name": "ge-0/0/1",
+            "device": {"id": 3, "name": "switch1"},
+        },
+    },
+    {
+        "id": 101,
+        "name": "ge-0/0/1",
+        "device": {"id": 3, "name": "switch1"},
+        "link_peers_type": "dcim.interface",
+        "link_peers": [
+            {"id": 100, "name": "eth0", "device": {"id": 2, "name": "server1"}}
+        ],
+    },
+]
+
+power_ports = [
+    {
+        "id": 200,
+        "display": "PSU1",
+        "device": {"id": 2, "name": "server1"},
+        "connected_endpoint": {"id": 300, "device": {"id": 1, "name": "pdu1"}},
+        "cable_peer_type": "dcim.poweroutlet",
+        "cable_peer": {"id": 300, "name": "PO-1", "device": {"id": 1, "name": "pdu1"}},
+    },
+]
+
+outlets = [
+    {
+        "id": 300,
+        "display": "PO-1",
+        "device": {"id": 1, "name": "pdu1"},
+        "connected_endpoint": {"id": 200, "device": {"id": 2, "name": "server1"}},
+    },
+]
+
+addresses = {
+    4: [
+        {
+            "id": 400,
+            "address": "10.0.0.2/24",
+            "device_id": 2,
+            "family": {"label": "IPv4"},
+            "assigned_object": {"name": "eth0", "device": {"display": "server1"}},
+        }
+    ],
+    6: [],
+}
+
+
+@pytest.fixture
+def nb(tmp_path):
+    import nb2an.netbox
+
+    config = tmp_path / "nb2an.yml"
+    config.write_text("token: abc\napi_url: https://netbox/api\n")
+
+    class FakeNetbox(nb2an.netbox.Netbox):
+        "Answers requests from the canned data above"
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.fetched = []
+
+        def get(self, url, use_cache=True, strip_results=True):
+            self.fetched.append(url)
+            if url.startswith("/dcim/devices/?rack_id="):
+                racks = [int(x.split("=")[1]) for x in url.split("?")[1].split("&")]
+                return [x for x in devices if x["rack"]["id"] in racks]
+            if url.startswith("/dcim/devices"):
+                return devices
+            if url.startswith("/dcim/interfaces/"):
+                return [x for x in interfaces if self._wanted(url, x["device"]["id"])]
+            if url.startswith("/dcim/power-ports/"):
+                return power_ports
+            if url.startswith("/dcim/power-outlets/"):
+                return outlets
+            if url.startswith("/ipam/ip-addresses/?family="):
+                family = int(url.split("?family=")[1][0])
+                return [
+                    x for x in addresses[family] if self._wanted(url, x["device_id"])
+                ]
+            raise ValueError(f"unexpected url {url}")
+
+        def _wanted(self, url, device_id):
+            "True if a url has no device_id= filter, or includes device_id"
+            wanted = [x[10:] for x in url.split("&") if x.startswith("device_id=")]
+            return not wanted or str(device_id) in wanted
+
+    return FakeNetbox(config_path=str(config))
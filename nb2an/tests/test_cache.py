@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+import time
+import pytest
+
+
+def test_cache_unbounded():
+    from nb2an.cache import Cache
+
+    c = Cache()
+    for n in range(100):
+        c[n] = n * 2
+    assert len(c) == 100
+    assert c[5] == 10
+    assert 5 in c and 500 not in c
+    assert c.get(500) is None
+    with pytest.raises(KeyError):
+        c[500]
+    stats = c.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_cache_lru():
+    from nb2an.cache import Cache
+
+    c = Cache(max_entries=3)
+    for key in "abc":
+        c[key] = key
+    c.get("a")  # b is now the oldest
+    c["d"] = "d"
+    assert sorted(c.keys()) == ["a", "c", "d"]
+    assert c.stats()["evictions"] == 1
+
+
+def test_cache_lfu_and_pinning():
+    from nb2an.cache import Cache
+
+    c = Cache(max_entries=3, policy="lfu")
+    c.set("bootstrap", 1, pin=True)
+    c["often"] = 2
+    for n in range(5):
+        c.get("often")
+    c["rarely"] = 3
+    c["newest"] = 4
+    # the new entry is admitted, and the rarely used one loses
+    assert sorted(c.keys()) == ["bootstrap", "newest", "often"]
+
+    # replacing a value keeps its count
+    c["often"] = 5
+    c["another"] = 6
+    assert sorted(c.keys()) == ["another", "bootstrap", "often"]
+
+    with pytest.raises(ValueError):
+        Cache(policy="random")
+
+
+def test_cache_lfu_ages():
+    from nb2an.cache import Cache
+
+    c = Cache(max_entries=3, policy="lfu")
+    for key in ["old1", "old2"]:
+        c[key] = key
+        for n in range(10):
+            c.get(key)
+
+    # a stream of new entries, each used a little, eventually wins out
+    # over entries that were only popular long ago
+    for n in range(20):
+        c[n] = n
+        c.get(n)
+    assert "old1" not in c and "old2" not in c
+    assert 19 in c
+    assert len(c.heap) <= 2 * len(c) + 32
+
+
+def test_cache_bytes_and_ttl():
+    from nb2an.cache import Cache
+
+    c = Cache(max_bytes=1000, sizer=len)
+    c["a"] = "x" * 600
+    c["b"] = "y" * 600
+    assert list(c.keys()) == ["b"]
+    assert c.stats()["bytes"] == 600
+
+    c = Cache(ttl=0.05)
+    c["a"] = 1
+    c.set("b", 2, pin=True)
+    time.sleep(0.1)
+    assert "a" not in c
+    assert c["b"] == 2
+    assert c.stats()["expirations"] == 1
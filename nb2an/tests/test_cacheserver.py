@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+import os
+import shutil
+import tempfile
+import threading
+import time
+import pytest
+
+
+@pytest.fixture
+def broker():
+    "Runs a CacheServer over a slow stand-in for netbox"
+    import nb2an.cacheserver
+
+    fetched = []
+
+    def fetch(url, strip_results):
+        fetched.append(url)
+        time.sleep(0.1)  # let concurrent requests pile up
+        if "bad" in url:
+            raise ValueError("404 Client Error")
+        return [{"id": 1, "url": url}]
+
+    # unix socket paths must be short, so avoid pytest's tmp_path
+    directory = tempfile.mkdtemp()
+    server = nb2an.cacheserver.CacheServer(
+        os.path.join(directory, "s"), fetch, "https://netbox/api"
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, fetched
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(directory)
+
+
+def test_cache_server_coalesces(broker):
+    import nb2an.cacheserver
+
+    server, fetched = broker
+    results = []
+
+    def client():
+        c = nb2an.cacheserver.CacheClient(server.socket_path)
+        results.append(c.get("https://netbox/api/dcim/racks/"))
+        c.close()
+
+    threads = [threading.Thread(target=client) for x in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fetched == ["https://netbox/api/dcim/racks/"]
+    assert results == [[{"id": 1, "url": "https://netbox/api/dcim/racks/"}]] * 8
+
+    stats = nb2an.cacheserver.CacheClient(server.socket_path).stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] + stats["coalesced"] >= 7
+
+
+def test_cache_client_concurrent(broker):
+    import concurrent.futures
+    import nb2an.cacheserver
+
+    server, fetched = broker
+    client = nb2an.cacheserver.CacheClient(server.socket_path, max_idle=2)
+    urls = [f"https://netbox/api/dcim/racks/{n}/" for n in range(4)]
+
+    # one client's requests from several threads don't wait on each other
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(client.get, urls))
+    assert time.time() - start < 0.3
+    assert [x[0]["url"] for x in results] == urls
+    assert sorted(fetched) == urls
+
+    assert len(client.idle) == 2
+    assert client.get(urls[0])[0]["url"] == urls[0]
+    client.close()
+    assert client.idle == []
+
+
+def test_cache_server_errors(broker):
+    import nb2an.cacheserver
+
+    server, fetched = broker
+    client = nb2an.cacheserver.CacheClient(server.socket_path)
+    with pytest.raises(RuntimeError, match="404"):
+        client.get("https://netbox/api/bad/")
+
+    # errors aren't cached
+    with pytest.raises(RuntimeError):
+        client.get("https://netbox/api/bad/")
+    assert len(fetched) == 2
+
+
+def test_cache_server_only_fetches_netbox(broker):
+    import stat
+    import nb2an.cacheserver
+
+    server, fetched = broker
+    assert stat.S_IMODE(os.stat(server.socket_path).st_mode) == 0o600
+
+    # the token is never sent anywhere but netbox
+    client = nb2an.cacheserver.CacheClient(server.socket_path)
+    for url in [
+        "https://evil/",
+        "http://netbox/api/dcim/racks/",
+        "https://netbox/other/",
+        "https://netbox/api/../other/",
+        "https://netbox.evil/api/dcim/racks/",
+    ]:
+        with pytest.raises(RuntimeError, match="not a NetBox API URL"):
+            client.get(url)
+    assert fetched == []
+
+
+def test_netbox_uses_broker(broker, tmp_path):
+    import nb2an.netbox
+
+    server, fetched = broker
+    config = tmp_path / "nb2an.yml"
+    config.write_text(
+        f"token: abc\napi_url: https://netbox/api\ncache_socket: {server.socket_path}\n"
+    )
+
+    nb = nb2an.netbox.Netbox(config_path=str(config))
+    assert nb.get("/dcim/racks/")[0]["url"] == "https://netbox/api/dcim/racks/"
+    assert fetched == ["https://netbox/api/dcim/racks/"]
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+
+changes = {"host_info": {"name": "name", "rack": "rack.id"}}
+
+
+def test_find_drift():
+    from nb2an.tools.checkansible import find_drift
+
+    assert find_drift({"a": {"b": 1}}, {"a": {"b": 1}}) == []
+    assert find_drift({"a": {"b": 1}, "c": 2}, {"a": {"b": 2, "d": 3}}) == [
+        {"path": "a.b", "current": 1, "expected": 2},
+        {"path": "a.d", "expected": 3},
+        {"path": "c", "current": 2},
+    ]
+    assert find_drift({"a": 1}, {"a": True}) == [
+        {"path": "a", "current": 1, "expected": True}
+    ]
+
+
+def test_check_devices(nb, tmp_path):
+    from nb2an.tools.checkansible import check_devices, exit_code, EXIT_DRIFT
+
+    host_vars = tmp_path / "host_vars"
+    host_vars.mkdir()
+    (host_vars / "pdu1.yml").write_text("host_info:\n  name: pdu1\n  rack: 10\n")
+    original = "host_info:\n  name: old-name\nother: [1, 2]\n"
+    (host_vars / "server1.yml").write_text(original)
+
+    report = check_devices(nb, str(tmp_path), changes, jobs=2)
+    assert report["summary"] == {"checked": 2, "drifted": 1, "errors": 0}
+    assert report["hosts"] == [
+        {
+            "host": "server1",
+            "file": str(host_vars / "server1.yml"),
+            "drift": [
+                {
+                    "path": "host_info.name",
+                    "current": "old-name",
+                    "expected": "server1",
+                },
+                {"path": "host_info.rack", "expected": 10},
+            ],
+        }
+    ]
+    assert exit_code(report) == EXIT_DRIFT
+
+    # nothing is rewritten
+    assert (host_vars / "server1.yml").read_text() == original
+
+
+def test_check_devices_errors(nb, tmp_path):
+    from nb2an.tools.checkansible import check_devices, exit_code, EXIT_ERROR
+
+    host_vars = tmp_path / "host_vars"
+    host_vars.mkdir()
+    (host_vars / "server1.yml").write_text("host_info: [unclosed\n")
+
+    report = check_devices(nb, str(tmp_path), changes, names=["server1"])
+    assert report["summary"]["errors"] == 1
+    assert "error" in report["hosts"][0]
+    assert exit_code(report) == EXIT_ERROR
+
+
+def test_check_host_yaml_1_2(tmp_path):
+    from nb2an.tools.checkansible import check_host
+
+    # nb-update-ansible writes these strings unquoted, as YAML 1.2 allows
+    yaml_file = tmp_path / "server1.yml"
+    yaml_file.write_text("host_info:\n  enabled: yes\n  power: off\n")
+
+    mapping = {"host_info": {"enabled": "enabled", "power": "power"}}
+    nb_data = {"name": "server1", "enabled": "yes", "power": "off"}
+    result = check_host("server1", str(yaml_file), mapping, nb_data)
+    assert result == {"host": "server1", "file": str(yaml_file), "drift": []}
+
+
+def test_check_devices_unknown_function(nb, tmp_path):
+    from nb2an.tools.checkansible import check_devices, exit_code, EXIT_ERROR
+    from nb2an.mapping import unknown_functions
+
+    host_vars = tmp_path / "host_vars"
+    host_vars.mkdir()
+    (host_vars / "server1.yml").write_text("host_info:\n  name: server1\n")
+
+    bad = {"host_info": {"name": {"__function": "nonexistent"}}}
+    assert unknown_functions(bad) == ["nonexistent"]
+    assert unknown_functions(changes) == []
+
+    report = check_devices(nb, str(tmp_path), bad, jobs=2)
+    assert "nonexistent" in report["hosts"][0]["error"]
+    assert exit_code(report) == EXIT_ERROR
+
+
+def test_check_devices_batch_plugin_sees_every_device(nb, tmp_path):
+    from nb2an.tools.checkansible import check_devices
+    from nb2an.shard import Shard
+
+    host_vars = tmp_path / "host_vars"
+    host_vars.mkdir()
+    (host_vars / "server1.yml").write_text("peers: [pdu1, server1]\n")
+
+    shard = [x for x in [Shard(1, 2), Shard(2, 2)] if x.includes({"name": "server1"})]
+    mapping = {"peers": {"__function": "group_members", "by": "rack.id"}}
+    report = check_devices(nb, str(tmp_path), mapping, racks=[10], shard=shard[0])
+    assert report["summary"] == {"checked": 1, "drifted": 0, "errors": 0}
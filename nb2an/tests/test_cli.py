@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+import sys
+import types
+
+import pytest
+
+
+def test_chained_subcommands(monkeypatch):
+    import nb2an.cli
+
+    ran = []
+
+    def tool(name, status):
+        def main():
+            ran.append((name, sys.argv[1:]))
+            if status is not None:
+                exit(status)
+
+        monkeypatch.setitem(
+            sys.modules, f"fake_{name}", types.SimpleNamespace(main=main)
+        )
+        monkeypatch.setitem(nb2an.cli.SUBCOMMANDS, name, f"fake_{name}")
+
+    tool("returns", None)
+    tool("exits", 0)
+    tool("drifts", 2)
+
+    # tools that exit successfully don't end the chain
+    nb2an.cli.main(["exits", "1", "+", "returns", "2", "+", "exits"])
+    assert ran == [("exits", ["1"]), ("returns", ["2"]), ("exits", [])]
+
+    # but the first failure does, with its status
+    ran.clear()
+    with pytest.raises(SystemExit) as exp:
+        nb2an.cli.main(["exits", "+", "drifts", "+", "returns"])
+    assert exp.value.code == 2
+    assert [x[0] for x in ran] == ["exits", "drifts"]
@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+import copy
+from urllib.parse import urlsplit, parse_qsl
+
+import pytest
+
+
+def address(id, address, device_id, device_name):
+    return {
+        "id": id,
+        "address": address,
+        "family": {"value": 4, "label": "IPv4"},
+        "assigned_object": {
+            "id": 1,
+            "name": "eth0",
+            "device": {"id": device_id, "name": device_name, "display": device_name},
+        },
+    }
+
+
+regions = {
+    "us": {
+        "devices": [
+            {"id": 1, "name": "fw1", "rack": {"id": 1}},
+            {"id": 2, "name": "us-server", "rack": {"id": 1}},
+        ],
+        "interfaces": [
+            {"id": 1, "name": "eth0", "device": {"id": 2, "name": "us-server"}},
+        ],
+        "ip-addresses": [address(1, "10.0.0.1/24", 1, "fw1")],
+    },
+    "eu": {
+        "devices": [
+            {"id": 1, "name": "fw1", "rack": {"id": 7}},
+            {"id": 3, "name": "eu-server", "rack": {"id": 7}},
+        ],
+        "interfaces": [
+            {"id": 1, "name": "eth0", "device": {"id": 1, "name": "fw1"}},
+            {"id": 2, "name": "eth0", "device": {"id": 3, "name": "eu-server"}},
+        ],
+        "ip-addresses": [address(1, "192.168.9.9/24", 1, "fw1")],
+    },
+}
+
+
+def make_federation(tmp_path, conflicts="first", api_url="https://netbox/api"):
+    import nb2an.netbox
+    from nb2an.federation import FederatedNetbox
+
+    class FakeInstance(nb2an.netbox.Netbox):
+        "Answers fetches from one region's canned data"
+
+        def __init__(self, region, **kwargs):
+            super().__init__(**kwargs)
+            self.region = region
+            self.fetched = []
+
+        def fetch(self, url, strip_results=True):
+            self.fetched.append(url)
+            parts = urlsplit(url)
+            kind = parts.path.split("/")[-2]
+            filters = {}
+            for name, value in parse_qsl(parts.query):
+                if name in ["rack_id", "device_id"]:
+                    filters.setdefault(name[:-3], []).append(int(value))
+
+            results = []
+            for obj in regions[self.region][kind]:
+                if all(obj[key]["id"] in ids for key, ids in filters.items()):
+                    results.append(self._object(kind, obj))
+            return results
+
+        def patch_many(self, url, updates):
+            kind = urlsplit(url).path.split("/")[-2]
+            objects = {x["id"]: x for x in regions[self.region][kind]}
+            return [{**self._object(kind, objects[x["id"]]), **x} for x in updates]
+
+        def _object(self, kind, obj):
+            return {
+                **copy.deepcopy(obj),
+                "url": f"{self.prefix}/dcim/{kind}/{obj['id']}/",
+            }
+
+    config = tmp_path / "nb2an.yml"
+    config.write_text(f"api_url: {api_url}\nconflicts: {conflicts}\ninstances: {{}}\n")
+    instances = [
+        (
+            region,
+            FakeInstance(
+                region,
+                config={
+                    "api_url": f"https://{region}/api",
+                    "suffix": f".{region}.example.com",
+                },
+            ),
+        )
+        for region in regions
+    ]
+    return FederatedNetbox(config_path=str(config), instances=instances)
+
+
+def test_merge_and_renumber(tmp_path):
+    nb = make_federation(tmp_path)
+
+    devices = nb.get_devices()
+    assert [(x["name"], x["id"]) for x in devices] == [
+        ("fw1", 2),
+        ("us-server", 4),
+        ("eu-server", 7),
+    ]
+    assert nb.local_id(7) == (1, 3)
+
+    # rack ids are routed to the instance owning them
+    assert [x["name"] for x in nb.get_devices([15])] == ["eu-server"]
+    assert (
+        nb.instances[1].netbox.fetched[-1] == "https://eu/api/dcim/devices/?rack_id=7"
+    )
+    assert not any("rack_id" in x for x in nb.instances[0].netbox.fetched)
+    # unracked devices are asked for from every instance
+    assert len(nb._route("/dcim/devices/", [("rack_id", "null")])) == 2
+
+    # the interfaces of the dropped eu fw1 are dropped too
+    interfaces = nb.get_interfaces([x["id"] for x in devices])
+    assert sorted(interfaces) == ["eu-server", "us-server"]
+    assert interfaces["eu-server"][0]["device"]["id"] == 7
+
+    assert nb.fqdn("eu-server") == "eu-server.eu.example.com"
+    assert nb.fqdn("fw1") == "fw1.us.example.com"
+    assert nb.shortname_name("eu-server.eu.example.com") == "eu-server"
+
+
+def test_conflict_suffix(tmp_path):
+    nb = make_federation(tmp_path, conflicts="suffix")
+
+    names = sorted(x["name"] for x in nb.get_devices())
+    assert names == ["eu-server", "fw1", "fw1-eu", "us-server"]
+    interfaces = nb.get_interfaces()
+    assert interfaces["fw1-eu"][0]["device"]["id"] == 3
+    assert nb.fqdn("fw1-eu") == "fw1-eu.eu.example.com"
+
+
+def test_conflict_error(tmp_path):
+    nb = make_federation(tmp_path, conflicts="error")
+    with pytest.raises(ValueError):
+        nb.get_devices()
+
+
+def test_cached_objects_use_global_urls(tmp_path):
+    nb = make_federation(tmp_path, api_url="https://eu/api")
+    devices = nb.get_devices()
+    assert devices[2]["url"] == "https://eu/api/dcim/devices/7/"
+
+    # eu's device 3 is federated device 7; federated device 3 is eu's
+    # (dropped) fw1, which mustn't be answered from eu-server's cache
+    assert nb.cached("https://eu/api/dcim/devices/7/")["name"] == "eu-server"
+    assert nb.cached("https://eu/api/dcim/devices/3/") is None
+
+
+def test_patch_many(tmp_path):
+    nb = make_federation(tmp_path)
+    nb.get_dataset("devices")
+    fetches = len(nb.instances[1].netbox.fetched)
+
+    results = nb.patch_many("/dcim/devices/", [{"id": 7, "serial": "1234"}])
+    assert [(x["id"], x["serial"]) for x in results] == [(7, "1234")]
+    assert nb.cached(results[0]["url"])["serial"] == "1234"
+
+    # the stale device list is fetched again
+    nb.get_dataset("devices")
+    assert len(nb.instances[1].netbox.fetched) > fetches
+
+
+def test_dropped_device_addresses(tmp_path):
+    nb = make_federation(tmp_path)
+
+    # eu's fw1 is dropped, and so is the address assigned to it
+    assert nb.get_addresses() == {"fw1": {"eth0": {"IPv4": "10.0.0.1/24"}}}
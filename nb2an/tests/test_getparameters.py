@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+import io
+import pytest
+
+specifications = ["id", "power_ports.0.display", "rack"]
+
+
+def test_extract_rows(nb):
+    from nb2an.tools.getparameters import extract_rows, DNE
+
+    rows = list(extract_rows(nb, nb.get_devices(), specifications))
+    assert rows == [
+        ["pdu1", 1, DNE, {"id": 10}],
+        ["server1", 2, "PSU1", {"id": 10}],
+    ]
+
+
+def test_write_csv(nb):
+    from nb2an.tools.getparameters import extract_rows, write_csv
+
+    out = io.StringIO()
+    write_csv(extract_rows(nb, nb.get_devices(), specifications), specifications, out)
+    assert out.getvalue().splitlines() == [
+        "name,id,power_ports.0.display,rack",
+        'pdu1,1,,"{""id"": 10}"',
+        'server1,2,PSU1,"{""id"": 10}"',
+    ]
+
+
+def test_write_parquet(nb, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+    import nb2an.tools.getparameters as getparameters
+
+    output = str(tmp_path / "report.parquet")
+    getparameters.ARROW_BATCH_SIZE = 1
+    try:
+        getparameters.process_devices(
+            nb, specifications=specifications, output_format="parquet", output=output
+        )
+    finally:
+        getparameters.ARROW_BATCH_SIZE = 1000
+
+    table = pyarrow.parquet.read_table(output)
+    assert table.column_names == ["name"] + specifications
+    assert table.column("id").to_pylist() == [1, 2]
+    assert table.column("power_ports.0.display").to_pylist() == [None, "PSU1"]
+
+
+@pytest.mark.parametrize("as_parquet", [True, False])
+def test_write_arrow_mixed_types(tmp_path, as_parquet):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+    import nb2an.tools.getparameters as getparameters
+
+    rows = [["a", 1], ["b", 2], ["c", "x"], ["d", 4.5]]
+    output = str(tmp_path / "report")
+    getparameters.ARROW_BATCH_SIZE = 2
+    try:
+        getparameters.write_arrow(iter(rows), ["value"], output, as_parquet)
+    finally:
+        getparameters.ARROW_BATCH_SIZE = 1000
+
+    if as_parquet:
+        table = pyarrow.parquet.read_table(output)
+    else:
+        table = pa.ipc.open_file(output).read_all()
+    # a later batch's strings widen the whole column, rather than being lost
+    assert table.column("value").to_pylist() == ["1", "2", "x", "4.5"]
+    assert [x.name for x in tmp_path.iterdir()] == ["report"]
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+import os
+import pytest
+
+changes = {
+    "host_info": {"rack": "rack.id"},
+    "power": {
+        "__function": "foreach_create_dict",
+        "array": "power_ports",
+        "keyname": "display",
+        "structure": {"pdu": "connected_endpoint.device.name"},
+    },
+}
+
+
+def test_build_inventory(nb):
+    import nb2an.inventory
+
+    builder = nb2an.inventory.HostVarsBuilder(nb, changes)
+    results = builder.build(group_by=["rack.id", "missing.key"])
+    assert results == {
+        "pdu1": {"vars": {"host_info": {"rack": 10}}, "groups": ["rack_id_10"]},
+        "server1": {
+            "vars": {"host_info": {"rack": 10}, "power": {"PSU1": {"pdu": "pdu1"}}},
+            "groups": ["rack_id_10"],
+        },
+    }
+
+
+def test_host_vars_are_lazy(nb):
+    import nb2an.inventory
+
+    builder = nb2an.inventory.HostVarsBuilder(nb, {"id": "id"})
+    assert builder.get_vars("server1") == {"id": 2}
+    assert builder.host_vars == {"server1": {"id": 2}}
+
+    # a mapping that doesn't read power ports never fetches them
+    assert not any("power-ports" in url for url in nb.fetched)
+
+
+def test_inventory_plugin(nb, tmp_path, monkeypatch):
+    pytest.importorskip("ansible")
+    import yaml
+    import nb2an.netbox
+    from ansible.inventory.data import InventoryData
+    from ansible.parsing.dataloader import DataLoader
+    from ansible.plugins.loader import inventory_loader
+
+    changes_file = tmp_path / "changes.yml"
+    changes_file.write_text(yaml.dump(changes))
+    inventory_file = tmp_path / "test.nb2an.yml"
+    inventory_file.write_text(
+        f"plugin: nb2an\nchanges_file: {changes_file}\ngroup_by: [rack.id]\n"
+    )
+    monkeypatch.setattr(nb2an.netbox, "Netbox", lambda **kwargs: nb)
+
+    inventory_loader.add_directory(
+        os.path.join(os.path.dirname(nb2an.__file__), "inventory_plugins")
+    )
+    plugin = inventory_loader.get("nb2an")
+    assert plugin.verify_file(str(inventory_file))
+
+    inventory = InventoryData()
+    plugin.parse(inventory, DataLoader(), str(inventory_file), cache=False)
+
+    assert sorted(inventory.hosts) == ["pdu1", "server1"]
+    assert sorted(x.name for x in inventory.groups["rack_id_10"].get_hosts()) == [
+        "pdu1",
+        "server1",
+    ]
+    server = inventory.get_host("server1")
+    assert server.vars["power"] == {"PSU1": {"pdu": "pdu1"}}
+    assert server.vars["host_info"] == {"rack": 10}
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+
+addresses = {
+    "router": {
+        "eth0": {"IPv4": "10.20.0.1/16", "IPv6": "2001:db8::1/64"},
+        "eth1": {"IPv4": "192.0.2.1/24"},
+    },
+    "server1": {"eth0": {"IPv4": "10.20.1.5/24"}},
+    "server2": {"eth0": {"IPv4": "10.30.0.5/16"}},
+}
+
+
+def test_ipindex_owners():
+    from nb2an.ipindex import IPIndex, IPEntry
+
+    index = IPIndex(addresses)
+    assert len(index) == 5
+    assert index.owners("10.20.1.5") == [IPEntry("server1", "eth0", "10.20.1.5/24")]
+    assert index.owners("2001:db8::1")[0].host == "router"
+    assert index.owners("10.20.1.6") == []
+
+
+def test_ipindex_within():
+    from nb2an.ipindex import IPIndex
+
+    index = IPIndex(addresses)
+    assert [x.host for x in index.within("10.20.0.0/16")] == ["router", "server1"]
+    assert [x.host for x in index.within("10.0.0.0/8")] == [
+        "router",
+        "server1",
+        "server2",
+    ]
+    assert index.within("172.16.0.0/12") == []
+    assert [x.host for x in index.within("2001:db8::/32")] == ["router"]
+
+
+def test_ipindex_longest_match():
+    from nb2an.ipindex import IPIndex
+
+    index = IPIndex(addresses)
+    assert [x.host for x in index.longest_match("10.20.1.200")] == ["server1"]
+    assert [x.host for x in index.longest_match("10.20.9.9")] == ["router"]
+    assert [x.interface for x in index.longest_match("2001:db8::99")] == ["eth0"]
+    assert index.longest_match("198.51.100.1") == []
+
+
+def test_ipindex_netbox_addresses(nb, monkeypatch):
+    from nb2an.ipindex import IPEntry
+
+    def address(address, interface="eth0"):
+        return {
+            "address": address,
+            "assigned_object": {"name": interface, "device": {"display": "server1"}},
+        }
+
+    # secondary addresses and VIPs share an interface and family
+    addresses = [
+        address("10.0.0.2/24"),
+        address("10.0.0.3/24"),
+        address("10.0.0.100/32", "vip0"),
+        {"address": "10.0.0.200/24", "assigned_object": None},
+    ]
+    monkeypatch.setattr(nb, "get_ip_addresses", lambda device_ids=None: addresses)
+
+    index = nb.get_ip_index()
+    assert len(index) == 3
+    assert index.owners("10.0.0.3") == [IPEntry("server1", "eth0", "10.0.0.3/24")]
+    assert index.owners("10.0.0.100")[0].interface == "vip0"
+    assert index.owners("10.0.0.200") == []
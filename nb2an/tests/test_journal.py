@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+import os
+
+import pytest
+
+
+def test_journal(tmp_path):
+    from nb2an.journal import Journal
+
+    path = str(tmp_path / "journal")
+    journal = Journal(path)
+    assert journal.start("snap1", "map1") == set()
+    journal.complete("a")
+    journal.complete("b")
+
+    # a crash part way through a line is ignored
+    with open(path, "a") as journal_file:
+        journal_file.write('{"host": "c')
+
+    assert Journal(path, resume=True).start("snap1", "map1") == {"a", "b"}
+    assert Journal(path, resume=True).start("snap2", "map1") == set()
+    assert Journal(path).start("snap1", "map1") == set()
+
+    journal.finish()
+    assert not os.path.exists(path)
+
+
+def test_snapshot_id():
+    from nb2an.journal import snapshot_id
+
+    devices = [{"id": 1, "last_updated": "t1"}, {"id": 2, "last_updated": "t2"}]
+    assert snapshot_id(devices) == snapshot_id(list(reversed(devices)))
+    assert snapshot_id(devices) != snapshot_id(
+        [devices[0], {"id": 2, "last_updated": "t3"}]
+    )
+
+    # changes to the linked data the mapping reads are noticed too
+    interfaces = [{"id": 10, "last_updated": "t1"}]
+    linked = [dict(devices[0], interfaces=interfaces), devices[1]]
+    changed = [dict(devices[0], interfaces=[{"id": 10, "last_updated": "t4"}])]
+    changed.append(devices[1])
+    assert snapshot_id(linked) == snapshot_id(devices)
+    assert snapshot_id(linked, ["interfaces"]) != snapshot_id(devices, ["interfaces"])
+    assert snapshot_id(linked, ["interfaces"]) != snapshot_id(changed, ["interfaces"])
+    addresses = {"eth0": {"IPv4": "10.0.0.2/24"}}
+    assert snapshot_id(
+        [dict(devices[0], addresses=addresses)], ["addresses"]
+    ) != snapshot_id([dict(devices[0], addresses={})], ["addresses"])
+
+
+def test_write_atomic(tmp_path):
+    from nb2an.yamlfile import write_atomic
+
+    path = tmp_path / "host.yml"
+    path.write_text("old: 1\n")
+    path.chmod(0o640)
+    write_atomic(str(path), "new: 2\n")
+    assert path.read_text() == "new: 2\n"
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ["host.yml"]
+
+
+def test_default_journal_path():
+    from nb2an.shard import Shard
+    from nb2an.tools.update_ansible import default_journal_path
+
+    assert default_journal_path("ansible") == "ansible/.nb2an-journal"
+    paths = {default_journal_path("ansible", Shard(n, 3)) for n in [1, 2, 3]}
+    assert paths == {f"ansible/.nb2an-journal-{n}-of-3" for n in [1, 2, 3]}
+
+
+def test_resume(nb, tmp_path, monkeypatch):
+    from nb2an.journal import Journal
+    from nb2an.tools.update_ansible import process_devices
+    import nb2an.tools.update_ansible as update_ansible
+
+    host_vars = tmp_path / "host_vars"
+    host_vars.mkdir()
+    for name in ["pdu1", "server1"]:
+        (host_vars / f"{name}.yml").write_text("name: old\n")
+    journal_path = str(tmp_path / "journal")
+    changes = {"name": "name"}
+
+    # the run dies after writing pdu1
+    real_write_host = update_ansible.write_host
+
+    def failing_write_host(job, manifest=None, journal=None):
+        if job["hostname"] == "server1":
+            raise OSError("disk full")
+        return real_write_host(job, manifest, journal)
+
+    monkeypatch.setattr(update_ansible, "write_host", failing_write_host)
+    with pytest.raises(OSError):
+        process_devices(
+            nb, str(tmp_path), changes=changes, jobs=1, journal=Journal(journal_path)
+        )
+    monkeypatch.undo()
+
+    assert (host_vars / "pdu1.yml").read_text() == "name: pdu1\n"
+    assert (host_vars / "server1.yml").read_text() == "name: old\n"
+
+    # resuming only processes server1
+    (host_vars / "pdu1.yml").write_text("name: edited\n")
+    process_devices(
+        nb,
+        str(tmp_path),
+        changes=changes,
+        jobs=1,
+        journal=Journal(journal_path, resume=True),
+    )
+    assert (host_vars / "pdu1.yml").read_text() == "name: edited\n"
+    assert (host_vars / "server1.yml").read_text() == "name: server1\n"
+    assert not os.path.exists(journal_path)
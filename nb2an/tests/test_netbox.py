@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+import copy
+from nb2an.tests.conftest import devices
+
+
+def test_link_device_data_is_lazy(nb):
+    original = copy.deepcopy(devices)
+    linked = nb.link_device_data(copy.deepcopy(devices))
+    server = linked[1]
+
+    # nothing is fetched until a linked key is read
+    assert nb.fetched == []
+    assert server["interfaces"][0]["name"] == "eth0"
+    assert any(url.startswith("/dcim/interfaces/") for url in nb.fetched)
+    assert not any(url.startswith("/dcim/power-ports/") for url in nb.fetched)
+
+    assert server["power_ports"][0]["display"] == "PSU1"
+    assert server["outlets"][0]["display"] == "PO-1"
+    assert server["addresses"]["eth0"]["IPv4"] == "10.0.0.2/24"
+    assert "addresses" not in linked[0]
+    assert linked[0]["power_ports"] == []
+
+    # the source device data is left untouched
+    assert devices == original
+
+
+def test_linked_device_dotnest(nb):
+    import nb2an.dotnest
+
+    server = nb.link_device_data(devices)[1]
+    dn = nb2an.dotnest.DotNest(server)
+    assert dn.get("power_ports.0.connected_endpoint.device.name") == "pdu1"
+    assert dn.get("interfaces.0.name") == "eth0"
+
+    plain = server.materialize()
+    assert type(plain) == dict
+    assert set(["interfaces", "addresses", "power_ports", "outlets"]) <= set(plain)
+
+
+def test_get_outlets_by_device_id(nb):
+    assert [x["id"] for x in nb.get_outlets_by_device_id(2)] == [300]
+    assert nb.get_outlets_by_device_id(1) == []
+
+
+def test_get_devices_by_racks(nb):
+    nb.chunk_size = 2
+    results = nb.get_devices([10, 11, 12, 10])
+    assert [x["id"] for x in results] == [1, 2]
+    assert sorted(nb.fetched) == [
+        "/dcim/devices/?rack_id=10&rack_id=11",
+        "/dcim/devices/?rack_id=12",
+    ]
+
+    nb.max_workers = 1
+    assert nb.get_devices(11) == []
+
+
+def test_get_scoped_interfaces_and_addresses(nb):
+    assert nb.get_interfaces([1]) == {}
+    assert list(nb.get_interfaces([1, 2])) == ["server1"]
+    assert "device_id=1&device_id=2" in nb.fetched[-1]
+
+    assert nb.get_addresses([1]) == {}
+    assert nb.get_addresses([2]) == {"server1": {"eth0": {"IPv4": "10.0.0.2/24"}}}
+
+
+def test_canonical_url():
+    from nb2an.netbox import canonical_url
+
+    prefix = "https://netbox/api/"
+    expected = "https://netbox/api/dcim/devices/?name=a+b&rack_id=1&rack_id=2"
+    assert (
+        canonical_url("/dcim/devices?rack_id=2&name=a b&rack_id=1", prefix) == expected
+    )
+    assert (
+        canonical_url("dcim/devices/?rack_id=1&rack_id=2&name=a+b", prefix) == expected
+    )
+    assert (
+        canonical_url("https://NETBOX/api/dcim/devices/?name=a%20b&rack_id=2&rack_id=1")
+        == expected
+    )
+    assert canonical_url("/dcim/racks", prefix) == canonical_url("/dcim/racks/", prefix)
+
+
+def test_get_normalizes_seeds_and_coalesces(tmp_path):
+    import threading
+    import time
+    import nb2an.netbox
+
+    config = tmp_path / "nb2an.yml"
+    config.write_text("token: abc\napi_url: https://netbox/api\n")
+
+    class FetchingNetbox(nb2an.netbox.Netbox):
+        "Counts the fetches that make it past the cache"
+
+        fetched = []
+
+        def fetch(self, url, strip_results=True):
+            self.fetched.append(url)
+            time.sleep(0.1)
+            if url.endswith("/dcim/devices/"):
+                return [
+                    {"id": x, "url": f"https://netbox/api/dcim/devices/{x}/"}
+                    for x in [1, 2]
+                ]
+            return {"id": 3, "url": url}
+
+    nb = FetchingNetbox(config_path=str(config))
+    threads = [
+        threading.Thread(target=nb.get, args=(url,))
+        for url in [
+            "/dcim/devices",
+            "/dcim/devices/",
+            "https://netbox/api/dcim/devices/",
+        ]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert nb.fetched == ["https://netbox/api/dcim/devices/"]
+
+    # individual devices come from the list response
+    assert nb.get_devices_by_id(2) == [
+        {"id": 2, "url": "https://netbox/api/dcim/devices/2/"}
+    ]
+    assert nb.get_devices_by_id(3)[0]["id"] == 3
+    assert nb.fetched[-1] == "https://netbox/api/dcim/devices/3/"
+    assert len(nb.fetched) == 2
+
+
+def test_seeding_a_bounded_cache(tmp_path):
+    import nb2an.netbox
+
+    config = tmp_path / "nb2an.yml"
+    config.write_text(
+        "token: abc\napi_url: https://netbox/api\n"
+        "cache_policies:\n  url_cache: {max_entries: 100}\n"
+        "  object_cache: {max_entries: 100}\n"
+    )
+
+    class FetchingNetbox(nb2an.netbox.Netbox):
+        fetched = []
+
+        def fetch(self, url, strip_results=True):
+            self.fetched.append(url)
+            if url.endswith("/dcim/interfaces/"):
+                return [
+                    {"id": x, "url": f"https://netbox/api/dcim/interfaces/{x}/"}
+                    for x in range(500)
+                ]
+            return [{"id": 1, "url": "https://netbox/api/dcim/racks/1/"}]
+
+    nb = FetchingNetbox(config_path=str(config))
+    nb.get("/dcim/racks/")
+    nb.get("/dcim/interfaces/")
+    assert len(nb.object_cache) == 100
+
+    # the seeded objects evicted neither their own list nor anything else
+    nb.get("/dcim/interfaces/")
+    nb.get("/dcim/racks/")
+    assert len(nb.fetched) == 2
+    assert nb.get("/dcim/interfaces/499/")["id"] == 499
+    assert len(nb.fetched) == 2
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+import threading
+import time
+
+import pytest
+
+
+def test_pipeline():
+    from nb2an.pipeline import Pipeline, Stage
+
+    results = []
+    in_flight = [0, 0]  # current, most seen
+    lock = threading.Lock()
+
+    def slow(x):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.001)
+        with lock:
+            in_flight[0] -= 1
+        return x
+
+    pipeline = Pipeline(
+        [
+            Stage("double", lambda x: x * 2, workers=3),
+            Stage("odd", lambda x: None if x % 4 else x),
+            Stage("slow", slow, workers=2),
+            Stage("collect", results.append),
+        ],
+        queue_size=2,
+    )
+    pipeline.run(range(100))
+
+    assert sorted(results) == [x for x in range(0, 200, 4)]
+    stats = pipeline.stats()
+    assert stats["double"]["items"] == 100
+    assert stats["odd"]["dropped"] == 50
+    assert stats["collect"]["items"] == 50
+    assert in_flight[1] <= 2
+
+
+def test_pipeline_errors():
+    from nb2an.pipeline import Pipeline, Stage
+
+    seen = []
+
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("three")
+        return x
+
+    pipeline = Pipeline(
+        [Stage("check", fail_on_three, workers=2), Stage("keep", seen.append)]
+    )
+    with pytest.raises(ValueError):
+        pipeline.run(range(6))
+
+    # the other items still made it through
+    assert sorted(seen) == [0, 1, 2, 4, 5]
+    assert pipeline.stats()["check"]["errors"] == 1
+
+
+def test_pipeline_source_errors():
+    from nb2an.pipeline import Pipeline, Stage
+
+    seen = []
+
+    def items():
+        yield from range(3)
+        raise RuntimeError("lost the inventory")
+
+    pipeline = Pipeline(
+        [Stage("double", lambda x: x * 2, workers=2), Stage("keep", seen.append)]
+    )
+    with pytest.raises(RuntimeError):
+        pipeline.run(items())
+
+    # the queued items were finished rather than left waiting
+    assert sorted(seen) == [0, 2, 4]
+    assert pipeline.stats()["keep"]["items"] == 3
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+
+racks = [
+    {"id": 10, "name": "Rack1", "site": {"display": "MIA"}, "u_height": 42},
+    {"id": 11, "name": "Rack2", "site": {"display": "MIA"}, "u_height": 42},
+]
+
+devices = [
+    {
+        "id": 1,
+        "name": "pdu1",
+        "rack": {"id": 10},
+        "position": None,
+        "device_type": {"id": 7},
+    },
+    {
+        "id": 2,
+        "name": "server1",
+        "rack": {"id": 10},
+        "position": 40,
+        "device_type": {"id": 8},
+    },
+    {
+        "id": 3,
+        "name": "switch1",
+        "rack": {"id": 10},
+        "position": 42,
+        "device_type": {"id": 9},
+    },
+    {
+        "id": 4,
+        "name": "spare",
+        "rack": None,
+        "position": None,
+        "device_type": {"id": 9},
+    },
+]
+
+device_types = [
+    {"id": 7, "u_height": 0},
+    {"id": 8, "u_height": 2},
+    {"id": 9, "u_height": 1},
+]
+
+power_ports = [
+    {"id": 200, "device": {"id": 2}, "allocated_draw": 300, "maximum_draw": 500},
+    {"id": 201, "device": {"id": 2}, "allocated_draw": 300, "maximum_draw": 500},
+    {"id": 202, "device": {"id": 3}, "allocated_draw": None, "maximum_draw": 100},
+]
+
+outlets = [
+    {"id": 300, "device": {"id": 1, "name": "pdu1"}, "connected_endpoint": {"id": 200}},
+    {"id": 301, "device": {"id": 1, "name": "pdu1"}, "connected_endpoint": {"id": 202}},
+    {"id": 302, "device": {"id": 1, "name": "pdu1"}, "connected_endpoint": None},
+]
+
+
+def test_build_rack_report():
+    from nb2an.rackreport import build_rack_report
+
+    rack1, rack2 = build_rack_report(racks, devices, device_types, power_ports, outlets)
+
+    assert rack1["u_used"] == 3
+    assert rack1["u_free"] == 39
+    assert rack1["devices"] == 3
+    assert [x["name"] for x in rack1["elevation"]] == ["switch1", "server1", "pdu1"]
+    assert (rack1["allocated_draw"], rack1["maximum_draw"]) == (600, 1100)
+    assert rack1["pdus"] == {
+        "pdu1": {"outlets": 3, "used": 2, "allocated_draw": 300, "maximum_draw": 600}
+    }
+
+    assert rack2["u_free"] == 42
+    assert rack2["devices"] == 0
+    assert rack2["pdus"] == {}
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+import json
+
+import pytest
+
+
+def test_shards_cover_every_device():
+    from nb2an.shard import Shard
+
+    devices = [{"name": f"host{n}", "rack": {"id": n % 30}} for n in range(200)]
+    for by in ["name", "rack"]:
+        shards = [Shard(n, 3, by) for n in range(1, 4)]
+        counts = [len([x for x in devices if shard.includes(x)]) for shard in shards]
+        assert sum(counts) == len(devices)
+        assert all(counts)
+
+        # the same device always lands in the same shard
+        assert Shard.parse("2/3", by).includes(devices[5]) == shards[1].includes(
+            devices[5]
+        )
+
+
+def test_parse_errors():
+    import argparse
+    from nb2an.shard import Shard, add_arguments
+
+    for text in ["3", "x", "0/3", "3/0", "4/3", "a/b"]:
+        with pytest.raises(argparse.ArgumentTypeError):
+            Shard.parse(text)
+    with pytest.raises(ValueError):
+        Shard(1, 2, by="color")
+
+    # bad values are usage errors, before any work is done
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--shard", "3/0"])
+
+
+def test_get_devices_by_shard(nb):
+    from nb2an.shard import Shard
+
+    shards = [Shard(n, 2) for n in [1, 2]]
+    names = []
+    for shard in shards:
+        names.extend(x["name"] for x in nb.get_devices(shard=shard))
+    assert sorted(names) == ["pdu1", "server1"]
+
+    # the shard's per-device data is fetched for its devices only
+    shard = [x for x in shards if x.includes({"name": "server1"})][0]
+    server = nb.get_devices(shard=shard, link_other_information=True)[0]
+    assert [x["name"] for x in server["interfaces"]] == ["eth0"]
+    interfaces = [x for x in nb.fetched if x.startswith("/dcim/interfaces")]
+    assert interfaces and all("device_id=" in x for x in interfaces)
+
+    # and nothing is left behind for later, unsharded, calls
+    full = nb.get_devices(link_other_information=True)
+    assert sorted(nb.get_dataset("interfaces")) == ["server1", "switch1"]
+    assert [x["name"] for x in full[1]["interfaces"]] == ["eth0"]
+    assert any(
+        "device_id=" not in x for x in nb.fetched if x.startswith("/dcim/interfaces")
+    )
+
+
+def test_merge():
+    from nb2an.shard import merge
+
+    reports = [
+        {
+            "summary": {"checked": 2, "drifted": 1, "errors": 0},
+            "hosts": [{"host": "b"}],
+        },
+        {
+            "summary": {"checked": 3, "drifted": 1, "errors": 1},
+            "hosts": [{"host": "a"}],
+        },
+    ]
+    assert json.loads(merge([json.dumps(x) for x in reports])) == {
+        "summary": {"checked": 5, "drifted": 2, "errors": 1},
+        "hosts": [{"host": "a"}, {"host": "b"}],
+    }
+
+    stats = [
+        {
+            "endpoints": {
+                "/dcim/devices/": {
+                    "limit": n,
+                    "in_flight": 0,
+                    "requests": n,
+                    "throttled": 0,
+                    "slow": 0,
+                    "mean_latency": 0.1 * n,
+                }
+            },
+            "shared_fetches": 1,
+            "caches": {
+                "url_cache": {
+                    "entries": 2,
+                    "hits": n,
+                    "misses": 1,
+                    "hit_rate": 0.5,
+                    "bytes": None,
+                }
+            },
+        }
+        for n in [1, 3]
+    ]
+    merged = json.loads(merge([json.dumps(x) for x in stats]))
+    assert merged["endpoints"]["/dcim/devices/"]["requests"] == 4
+    assert merged["endpoints"]["/dcim/devices/"]["limit"] == 3
+    assert merged["endpoints"]["/dcim/devices/"]["mean_latency"] == pytest.approx(0.25)
+    assert merged["caches"]["url_cache"]["hit_rate"] == pytest.approx(4 / 6)
+    assert merged["shared_fetches"] == 2
+
+    plans = [{"/dcim/devices/": [{"id": 1}]}, {"/dcim/devices/": [{"id": 2}]}]
+    assert json.loads(merge([json.dumps(x) for x in plans])) == {
+        "/dcim/devices/": [{"id": 1}, {"id": 2}]
+    }
+
+    assert merge(["--- a\n", "--- b\n"]) == "--- a\n--- b\n"
+    with pytest.raises(ValueError):
+        merge([json.dumps(reports[0]), json.dumps(plans[0])])
+
+
+def test_rack_shards_include_unracked_devices(nb, monkeypatch):
+    from nb2an.shard import Shard
+
+    devices = [
+        {"id": 1, "name": "a", "rack": {"id": 1}, "site": {"slug": "sea"}},
+        {"id": 2, "name": "b", "rack": None, "site": {"slug": "sea"}},
+        {"id": 3, "name": "c", "rack": {"id": 2}, "site": {"slug": "mia"}},
+    ]
+
+    def get(url, use_cache=True, strip_results=True):
+        nb.fetched.append(url)
+        racks = [x.split("=")[1] for x in url.partition("?")[2].split("&") if x]
+        return [x for x in devices if str((x["rack"] or {}).get("id", "null")) in racks]
+
+    monkeypatch.setattr(nb, "get", get)
+    racks = [{"id": 1, "site": {"slug": "sea"}}, {"id": 2, "site": {"slug": "mia"}}]
+    monkeypatch.setattr(nb, "get_racks", lambda: racks)
+
+    for by in ["rack", "site"]:
+        names = []
+        for n in range(1, 4):
+            shard = Shard(n, 3, by)
+            names.extend(x["name"] for x in nb.get_devices(shard=shard))
+        assert sorted(names) == ["a", "b", "c"]
+    assert "/dcim/devices/?rack_id=null" in nb.fetched
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+import subprocess
+import sys
+
+# the tools are run from shell loops, so importing them must stay cheap
+IMPORT_BUDGET_US = 150000
+
+TOOLS = [
+    "nb2an.cli",
+    "nb2an.tools.getdevice",
+    "nb2an.tools.getdevices",
+    "nb2an.tools.getracks",
+    "nb2an.tools.getoutlets",
+    "nb2an.tools.getnetwork",
+    "nb2an.tools.getip",
+    "nb2an.tools.getparameters",
+    "nb2an.tools.update_ansible",
+    "nb2an.tools.checkansible",
+    "nb2an.tools.writeback",
+    "nb2an.tools.mergeshards",
+    "nb2an.tools.cacheserver",
+    "nb2an.tools.rackreport",
+]
+
+HEAVY_MODULES = ["requests", "yaml", "ruamel.yaml", "concurrent.futures", "pyarrow"]
+
+
+def import_tools():
+    "Import all the tools in a fresh interpreter, returning its stderr and stdout"
+    code = f"import sys\nimport {', '.join(TOOLS)}\nprint(' '.join(sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stderr, result.stdout.split()
+
+
+def test_no_heavy_imports():
+    _, modules = import_tools()
+    for module in HEAVY_MODULES:
+        assert module not in modules, f"{module} imported at startup"
+
+
+def test_import_time_budget():
+    importtime, _ = import_tools()
+
+    # sum the cumulative time of the top level nb2an imports
+    total = 0
+    for line in importtime.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line.split("|")
+        if fields[2].startswith(" nb2an"):  # nested imports are indented more
+            total += int(fields[1])
+    assert 0 < total < IMPORT_BUDGET_US, f"importing the tools took {total}us"
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+import threading
+import time
+
+
+class Response:
+    def __init__(self, status_code=200, headers={}):
+        self.status_code = status_code
+        self.headers = headers
+
+
+def test_endpoint_class():
+    from nb2an.throttle import endpoint_class
+
+    assert (
+        endpoint_class("https://netbox/api/dcim/devices/?rack_id=1") == "/dcim/devices/"
+    )
+    assert endpoint_class("https://netbox/api/dcim/devices/40") == "/dcim/devices/<id>/"
+    assert endpoint_class("https://netbox/api/dcim/racks") == "/dcim/racks/"
+
+
+def test_retry_after_seconds():
+    from nb2an.throttle import retry_after_seconds
+
+    assert retry_after_seconds("3") == 3.0
+    assert retry_after_seconds(None, default=2.0) == 2.0
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_aimd():
+    from nb2an.throttle import AdaptiveLimiter
+
+    limiter = AdaptiveLimiter(maximum=8, initial=4)
+    url = "https://netbox/api/dcim/interfaces/"
+    for n in range(40):
+        limiter.request(url, lambda: Response())
+    assert limiter.stats()["/dcim/interfaces/"]["limit"] == 8
+
+    # throttling halves the limit, honoring Retry-After before retrying
+    responses = [Response(429, {"Retry-After": "0.2"}), Response()]
+    start = time.time()
+    response = limiter.request(url, lambda: responses.pop(0))
+    assert response.status_code == 200
+    assert time.time() - start >= 0.2
+    stats = limiter.stats()["/dcim/interfaces/"]
+    assert stats["limit"] == 4
+    assert stats["throttled"] == 1
+    assert stats["requests"] == 42
+
+    # other endpoints are unaffected
+    limiter.request("https://netbox/api/dcim/racks/", lambda: Response())
+    assert limiter.stats()["/dcim/racks/"]["limit"] == 4
+
+
+def test_limit_is_enforced():
+    from nb2an.throttle import AdaptiveLimiter
+
+    limiter = AdaptiveLimiter(maximum=2, initial=2, latency_target=100)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def send():
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return Response()
+
+    threads = [
+        threading.Thread(target=limiter.request, args=("https://netbox/api/x/", send))
+        for n in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 2
+
+
+def test_gives_up_after_retries():
+    from nb2an.throttle import AdaptiveLimiter
+
+    limiter = AdaptiveLimiter()
+    response = limiter.request(
+        "https://netbox/api/x/",
+        lambda: Response(503, {"Retry-After": "0"}),
+        max_retries=2,
+    )
+    assert response.status_code == 503
+    assert limiter.stats()["/x/"]["requests"] == 3
@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+
+
+def test_topology_neighbors(nb):
+    topology = nb.get_topology()
+    assert topology.neighbors("server1") == [
+        {
+            "kind": "interface",
+            "name": "eth0",
+            "device": "switch1",
+            "port": "ge-0/0/1",
+            "port_kind": "interface",
+        },
+        {
+            "kind": "power_port",
+            "name": "PSU1",
+            "device": "pdu1",
+            "port": "PO-1",
+            "port_kind": "power_outlet",
+        },
+    ]
+    assert [x["device"] for x in topology.neighbors(3)] == ["server1"]
+    assert topology.neighbors("server1", kinds=["power_port"])[0]["device"] == "pdu1"
+    assert topology.neighbors("nonexistent") == []
+
+
+def test_topology_paths_and_components(nb):
+    from nb2an.topology import Topology
+
+    topology = nb.get_topology()
+    assert topology.path("switch1", "pdu1") == ["switch1", "server1", "pdu1"]
+    assert topology.path("pdu1", "pdu1") == ["pdu1"]
+
+    topology.add_components(
+        "interface", [{"id": 900, "name": "lo", "device": {"id": 9, "name": "lonely"}}]
+    )
+    assert topology.path("pdu1", "lonely") is None
+    assert sorted(sorted(x) for x in topology.components()) == [
+        ["lonely"],
+        ["pdu1", "server1", "switch1"],
+    ]
+
+
+def test_neighbors_plugin(nb):
+    from nb2an.mapping import process_changes
+
+    server = nb.link_device_data(nb.get_devices())[1]
+    yaml_struct = {}
+    process_changes({"lldp": {"__function": "neighbors"}}, yaml_struct, server)
+    assert yaml_struct == {
+        "lldp": {"eth0": [{"device": "switch1", "port": "ge-0/0/1"}]}
+    }
+
+
+def test_neighbors_plugin_several_links(nb):
+    from nb2an.mapping import process_changes
+
+    # a second link from eth0 to the same switch doesn't replace the first
+    nb.get_topology().add_components(
+        "interface",
+        [
+            {
+                "id": 100,
+                "name": "eth0",
+                "device": {"id": 2, "name": "server1"},
+                "link_peers_type": "dcim.interface",
+                "link_peers": [
+                    {
+                        "id": 102,
+                        "name": "ge-0/0/2",
+                        "device": {"id": 3, "name": "switch1"},
+                    }
+                ],
+            }
+        ],
+    )
+    server = nb.link_device_data(nb.get_devices())[1]
+    yaml_struct = {}
+    mapping = {
+        "lldp": {"__function": "neighbors", "kinds": ["interface", "power_port"]}
+    }
+    process_changes(mapping, yaml_struct, server)
+    assert yaml_struct == {
+        "lldp": {
+            "eth0": [
+                {"device": "switch1", "port": "ge-0/0/1"},
+                {"device": "switch1", "port": "ge-0/0/2"},
+            ],
+            "PSU1": [{"device": "pdu1", "port": "PO-1"}],
+        }
+    }
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class CompressingNetbox(BaseHTTPRequestHandler):
+    "Serves a page of interfaces, gzipped when the client accepts it"
+
+    encodings = []
+
+    def do_GET(self):
+        accepted = self.headers.get("Accept-Encoding", "")
+        self.encodings.append(accepted)
+        body = json.dumps(
+            {
+                "next": None,
+                "results": [{"id": n, "name": f"eth{n}"} for n in range(500)],
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in accepted:
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CompressingNetbox)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/api"
+    server.shutdown()
+
+
+def test_compressed_fetch(nb, server):
+    nb.prefix = server
+    results = nb.fetch(f"{server}/dcim/interfaces/")
+    assert len(results) == 500
+    assert "gzip" in CompressingNetbox.encodings[-1]
+    assert nb.get_stats()["transport"] == "requests"
+
+
+def test_httpx_fallback(monkeypatch):
+    import nb2an.transport
+
+    def missing(*args, **kwargs):
+        raise ImportError("No module named 'httpx'")
+
+    monkeypatch.setattr(nb2an.transport, "HttpxTransport", missing)
+    assert nb2an.transport.create("httpx").name == "requests"
+    with pytest.raises(ValueError):
+        nb2an.transport.create("carrier-pigeon")
+
+
+def test_httpx_transport(nb, server):
+    pytest.importorskip("httpx")
+    nb.prefix = server
+    nb.http_backend = "httpx"
+    assert len(nb.fetch(f"{server}/dcim/interfaces/")) == 500
+    assert nb.get_stats()["transport"] == "httpx"
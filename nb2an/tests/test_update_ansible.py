@@ -0,0 +1,337 @@
+#!/usr/bin/python3
+import copy
+
+device = {
+    "name": "firewall",
+    "url": "https://netbox/api/dcim/devices/40/",
+    "serial": "00112233",
+    "power_ports": [
+        {"display": "left", "connected_endpoint": {"display": "PO-1"}},
+        {"display": "right", "connected_endpoint": {"display": "PO-2"}},
+    ],
+}
+
+changes = {
+    "host_info": {"serial_number": "serial"},
+    "netbox_info": {
+        "device_url": {
+            "__function": "replace",
+            "value": "url",
+            "search": "/api",
+            "replacement": "",
+        }
+    },
+    "power": {
+        "__function": "foreach_create_dict",
+        "array": "power_ports",
+        "keyname": "display",
+        "structure": {"outlet": "connected_endpoint.display"},
+    },
+}
+
+
+def test_process_changes():
+    from nb2an.tools.update_ansible import process_changes
+
+    yaml_struct = {}
+    process_changes(changes, yaml_struct, copy.deepcopy(device))
+    assert yaml_struct == {
+        "host_info": {"serial_number": "00112233"},
+        "netbox_info": {"device_url": "https://netbox/dcim/devices/40/"},
+        "power": {"left": {"outlet": "PO-1"}, "right": {"outlet": "PO-2"}},
+    }
+
+
+def test_mapping_profile():
+    from nb2an.tools.update_ansible import process_changes
+    from nb2an.plugins.update_ansible import profile
+
+    profile.reset()
+    profile.enabled = True
+    try:
+        for n in range(3):
+            process_changes(changes, {}, copy.deepcopy(device))
+    finally:
+        profile.enabled = False
+
+    rows = profile.report()
+    names = {(row["kind"], row["name"]): row for row in rows}
+    assert names[("plugin", "replace")]["count"] == 3
+    assert names[("mapping", "host_info.serial_number")]["count"] == 3
+    # each host is listed once, however often it was evaluated
+    assert names[("mapping", "netbox_info.device_url")]["slowest_hosts"] == ["firewall"]
+    assert rows == sorted(rows, key=lambda x: x["total"], reverse=True)
+    assert len(profile.report(limit=2)) == 2
+
+    # foreach_create_dict isn't counted again as foreach_augment_dict
+    assert names[("plugin", "foreach_create_dict")]["count"] == 3
+    assert ("plugin", "foreach_augment_dict") not in names
+    # sections include their entries' time, so aren't ranked alongside them
+    assert ("mapping", "host_info") not in names
+    assert names[("mapping", "power")]["count"] == 3
+    profile.reset()
+
+
+def test_mapping_profile_outliers():
+    from nb2an.plugins.update_ansible import MappingProfile
+
+    profile = MappingProfile(outliers=2)
+    for host, elapsed in [("a", 1.0), ("b", 2.0), ("a", 5.0), ("c", 3.0), ("b", 0.5)]:
+        profile.record("plugin", "test", host, elapsed)
+    assert profile.report()[0]["slowest_hosts"] == ["a", "c"]
+
+
+def test_profile_mapping_argument():
+    import argparse
+    import pytest
+    from nb2an.tools.update_ansible import positive_int
+
+    assert positive_int("3") == 3
+    for value in ["0", "-1", "x"]:
+        with pytest.raises(argparse.ArgumentTypeError):
+            positive_int(value)
+
+
+def test_replace_many():
+    import nb2an.dotnest
+    from nb2an.plugins.update_ansible import update_ansible_plugins
+
+    dn = nb2an.dotnest.DotNest({"name": "GigabitEthernet0/1.example.com"})
+    definition = {
+        "__function": "replace_many",
+        "value": "name",
+        "rules": [
+            {"search": "GigabitEthernet", "replacement": "Gi"},
+            {"search": r"(\d+)/(\d+)", "replacement": r"\2-\1"},
+            {"search": r"\.example\.com$", "replacement": ""},
+            # never reached: the first rule already consumed this text
+            {"search": "Gi", "replacement": "XX"},
+        ],
+    }
+    yaml_struct = {}
+    update_ansible_plugins["replace_many"](dn, yaml_struct, definition, "short")
+    assert yaml_struct["short"] == "Gi1-0"
+
+
+def replace_many(rules, value):
+    import nb2an.dotnest
+    from nb2an.plugins.update_ansible import update_ansible_plugins
+
+    definition = {
+        "value": "name",
+        "rules": [{"search": x, "replacement": y} for x, y in rules],
+    }
+    yaml_struct = {}
+    dn = nb2an.dotnest.DotNest({"name": value})
+    update_ansible_plugins["replace_many"](dn, yaml_struct, definition, "short")
+    return yaml_struct["short"]
+
+
+def test_replace_many_backreferences():
+    # a rule's group numbers stay its own, wherever it is in the list
+    assert replace_many([(r"(a)\1", "X")], "aab") == "Xb"
+    assert replace_many([("(b)", "B"), (r"(a)\1", "X")], "aab b") == "XB B"
+    assert replace_many([("(b)", "B"), (r"(a)(?(1)a|c)", "X")], "aab") == "XB"
+
+
+def test_replace_many_inline_flags():
+    assert replace_many([("x", "y"), ("(?i)gig", "Gi")], "GIG1 x") == "Gi1 y"
+
+
+def test_replace_many_named_groups():
+    rules = [("(?P<n>a)", r"<\g<n>>"), ("(?P<n>b)", r"[\g<n>]"), ("c", "C")]
+    assert replace_many(rules, "abcab") == "<a>[b]C<a>[b]"
+
+
+def test_replace_many_empty_matches():
+    import itertools
+    import re
+
+    # adding a rule that never matches (but can't be combined, so
+    # moves every rule to the separate path) mustn't change the result
+    never = (r"(q)\1", "")
+    rules = [("x?", ""), ("[ab]+", "")]
+    assert replace_many(rules, "acbxcac") == "ccc"
+    assert replace_many(rules + [never], "acbxcac") == "ccc"
+
+    patterns = ["x?", "[ab]+", "a*", "ab|a", "(?=c)", "c*?", r"\b", "$"]
+    values = ["", "acbxcac", "xcaxb", "abcab", "cxc"]
+    for a, b in itertools.permutations(patterns, 2):
+        rules = [(a, r"<\g<0>>"), (b, "-")]
+        for value in values:
+            combined = replace_many(rules, value)
+            assert replace_many(rules + [never], value) == combined
+
+            # and one rule, either way, does just what re.sub does
+            expected = re.sub(a, r"<\g<0>>", value)
+            assert replace_many(rules[:1], value) == expected
+            assert replace_many(rules[:1] + [never], value) == expected
+
+
+host_vars = """# managed by hand and by nb2an
+host_info:
+  serial_number: 'old-serial'   # from the sticker
+  untouched:   [1,   2]
+other: value
+"""
+
+
+class FakeNetbox:
+    "Returns the canned device for any name"
+
+    def get_devices_by_name(self, hostname, link_other_information=False):
+        return [copy.deepcopy(device)]
+
+
+def test_process_host_edits_in_place(tmp_path):
+    from nb2an.tools.update_ansible import process_host
+
+    yaml_file = tmp_path / "firewall.yml"
+    yaml_file.write_text(host_vars)
+    process_host(
+        FakeNetbox(),
+        "firewall",
+        str(yaml_file),
+        changes={"host_info": {"serial_number": "serial"}},
+    )
+
+    # only the value itself changes; spacing and comments stay
+    assert yaml_file.read_text() == host_vars.replace("'old-serial'", "'00112233'")
+
+
+def test_process_host_full_rewrite(tmp_path):
+    from nb2an.tools.update_ansible import process_host
+
+    yaml_file = tmp_path / "firewall.yml"
+    yaml_file.write_text(host_vars)
+    process_host(
+        FakeNetbox(),
+        "firewall",
+        str(yaml_file),
+        changes={"netbox_info": {"id": "name"}},
+    )
+
+    # a new key can't be edited in, so the whole file is dumped
+    result = yaml_file.read_text()
+    assert "untouched: [1, 2]" in result
+    assert "netbox_info:\n  id: firewall\n" in result
+
+
+def test_process_host_manifest(tmp_path):
+    from nb2an.tools.update_ansible import process_host
+    from nb2an.manifest import Manifest
+
+    host_changes = {"host_info": {"serial_number": "serial"}}
+    yaml_file = tmp_path / "firewall.yml"
+    yaml_file.write_text(host_vars)
+    manifest_path = str(tmp_path / "manifest.json")
+
+    manifest = Manifest(manifest_path, host_changes)
+    process_host(
+        FakeNetbox(),
+        "firewall",
+        str(yaml_file),
+        changes=host_changes,
+        manifest=manifest,
+    )
+    manifest.save()
+    assert manifest.hosts["firewall"]["paths"] == [["serial"]]
+
+    # nothing changed, so the host is skipped
+    manifest = Manifest(manifest_path, host_changes)
+    assert manifest.is_current("firewall", device, yaml_file.read_text())
+
+    # but not when netbox, the file or the mapping differ
+    changed = dict(device, serial="44556677")
+    assert not manifest.is_current("firewall", changed, yaml_file.read_text())
+    assert not manifest.is_current("firewall", device, host_vars)
+    manifest = Manifest(manifest_path, {"host_info": {"serial_number": "name"}})
+    assert not manifest.is_current("firewall", device, yaml_file.read_text())
+
+
+def test_process_devices(nb, tmp_path):
+    from nb2an.tools.update_ansible import process_devices
+
+    host_vars = tmp_path / "host_vars"
+    host_vars.mkdir()
+    for name in ["pdu1", "server1"]:
+        (host_vars / f"{name}.yml").write_text(f"name: old\n")
+
+    stats = {}
+    changes = {"name": "name", "mac": "interfaces.0.name"}
+    process_devices(nb, str(tmp_path), changes=changes, jobs=2, stats=stats)
+
+    assert (host_vars / "server1.yml").read_text() == "name: server1\nmac: eth0\n"
+    assert (host_vars / "pdu1.yml").read_text() == "name: pdu1\n"
+    assert stats["write"]["items"] == 2
+    assert stats["read"]["workers"] == 2
+
+
+def test_batch_plugin():
+    from nb2an.tools.update_ansible import process_changes
+    from nb2an.plugins.update_ansible import (
+        batch_plugin,
+        update_ansible_plugins,
+        PluginRun,
+    )
+
+    devices = [
+        {"name": "a", "site": {"slug": "sea"}},
+        {"name": "b", "site": {"slug": "mia"}},
+        {"name": "c", "site": {"slug": "sea"}},
+    ]
+    prepared = []
+
+    def prepare(all_devices, definition):
+        prepared.append(definition["suffix"])
+        return {x["name"]: x["name"] + definition["suffix"] for x in all_devices}
+
+    @batch_plugin(prepare=prepare)
+    def fn_test_lookup(dn, yaml_struct, definition, item, context):
+        name = dn.get("name")
+        yaml_struct[item] = context.remember(name, lambda: context.prepared[name])
+
+    mapping = {
+        "long": {"__function": "test_lookup", "suffix": ".example.com"},
+        "peers": {"__function": "group_members", "by": "site.slug"},
+    }
+    try:
+        run = PluginRun(devices)
+        results = []
+        for device in devices:
+            result = {}
+            process_changes(mapping, result, device, run=run)
+            results.append(result)
+    finally:
+        del update_ansible_plugins["test_lookup"]
+
+    # prepared once for the whole run, not once per host
+    assert prepared == [".example.com"]
+    assert results == [
+        {"long": "a.example.com", "peers": ["a", "c"]},
+        {"long": "b.example.com", "peers": ["b"]},
+        {"long": "c.example.com", "peers": ["a", "c"]},
+    ]
+    assert run.memos["test_lookup"] == {
+        x["name"]: x["name"] + ".example.com" for x in devices
+    }
+
+
+def test_batch_plugin_sees_every_device(nb, tmp_path):
+    from nb2an.tools.update_ansible import process_devices
+    from nb2an.shard import Shard
+
+    host_vars = tmp_path / "host_vars"
+    host_vars.mkdir()
+    for name in ["pdu1", "server1"]:
+        (host_vars / f"{name}.yml").write_text("name: old\n")
+
+    # only server1 is processed, but its rack peers include pdu1
+    shard = [x for x in [Shard(1, 2), Shard(2, 2)] if x.includes({"name": "server1"})]
+    changes = {"peers": {"__function": "group_members", "by": "rack.id"}}
+    process_devices(nb, str(tmp_path), racks=[10], changes=changes, shard=shard[0])
+
+    assert (host_vars / "server1.yml").read_text() == (
+        "name: old\npeers:\n  - pdu1\n  - server1\n"
+    )
+    assert (host_vars / "pdu1.yml").read_text() == "name: old\n"
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+reverse_mapping = {
+    "devices": {"serial": "ansible_product_serial"},
+    "interfaces": {"mac_address": "ansible_{ansible_name}.macaddress"},
+}
+
+devices = [
+    {"id": 1, "name": "pdu1", "serial": "AAA"},
+    {"id": 2, "name": "server1", "serial": "old"},
+]
+
+interfaces = [
+    {
+        "id": 100,
+        "name": "eth0",
+        "device": {"id": 2},
+        "mac_address": "00:11:22:33:44:55",
+    },
+    {"id": 101, "name": "eth0.5", "device": {"id": 2}, "mac_address": None},
+]
+
+facts = {
+    "pdu1": {"ansible_product_serial": "AAA"},
+    "server1": {
+        "ansible_product_serial": "new",
+        "ansible_eth0": {"macaddress": "00:11:22:33:44:55"},
+        "ansible_eth0_5": {"macaddress": "aa:bb:cc:dd:ee:ff"},
+    },
+}
+
+
+def test_plan_updates():
+    from nb2an.writeback import plan_updates
+
+    assert plan_updates(reverse_mapping, facts, devices, interfaces) == {
+        "/dcim/devices/": [{"id": 2, "serial": "new"}],
+        "/dcim/interfaces/": [{"id": 101, "mac_address": "AA:BB:CC:DD:EE:FF"}],
+    }
+    assert plan_updates(reverse_mapping, {"pdu1": facts["pdu1"]}, devices) == {}
+
+
+def test_plan_updates_dotted_names():
+    from nb2an.writeback import plan_updates
+
+    mapping = {"interfaces": {"description": "interfaces.{name}.description"}}
+    host_facts = {
+        "server1": {"interfaces": {"eth0.5": {"description": "vlan 5"}}},
+    }
+    assert plan_updates(mapping, host_facts, devices, interfaces) == {
+        "/dcim/interfaces/": [{"id": 101, "description": "vlan 5"}],
+    }
+
+
+def test_load_facts(tmp_path):
+    from nb2an.writeback import load_facts
+
+    (tmp_path / "server1").write_text(json.dumps(facts["server1"]))
+    (tmp_path / "pdu1.yml").write_text("ansible_product_serial: AAA\n")
+    assert load_facts(str(tmp_path), "server1") == facts["server1"]
+    assert load_facts(str(tmp_path), "pdu1") == facts["pdu1"]
+    assert load_facts(str(tmp_path), "switch1") is None
+
+
+class MockNetbox(BaseHTTPRequestHandler):
+    "Answers bulk PATCH requests, recording each one"
+
+    requests = []
+
+    def do_PATCH(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append((self.path, self.headers["Authorization"], body))
+        results = [
+            dict(x, url=f"http://{self.headers['Host']}{self.path}{x['id']}/")
+            for x in body
+        ]
+        encoded = json.dumps(results).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_patch_many(nb):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockNetbox)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        nb.prefix = f"http://127.0.0.1:{server.server_port}/api"
+        nb.chunk_size = 2
+        nb.get_dataset("devices")
+        nb.url_cache[f"{nb.prefix}/dcim/devices/?rack_id=10"] = [{"id": 3}]
+        nb.url_cache[f"{nb.prefix}/dcim/racks/"] = [{"id": 10}]
+        updates = [{"id": n, "serial": f"S{n}"} for n in range(5)]
+        results = nb.patch_many("/dcim/devices/", updates)
+    finally:
+        server.shutdown()
+
+    assert [x["id"] for x in results] == list(range(5))
+    assert sorted(len(x[2]) for x in MockNetbox.requests) == [1, 2, 2]
+    assert {x[0] for x in MockNetbox.requests} == {"/api/dcim/devices/"}
+    assert {x[1] for x in MockNetbox.requests} == {"Token abc"}
+    assert nb.cached(f"{nb.prefix}/dcim/devices/3/")["serial"] == "S3"
+
+    # lists and datasets holding the old values are fetched again
+    assert nb.cached(f"{nb.prefix}/dcim/devices/?rack_id=10") is None
+    assert nb.cached(f"{nb.prefix}/dcim/racks/") == [{"id": 10}]
+    assert "devices" not in nb.data
+
+
+def test_write_back_dry_run(nb, tmp_path):
+    from nb2an.tools.writeback import write_back
+
+    (tmp_path / "server1.json").write_text(json.dumps({"ansible_product_serial": "X"}))
+    plan = write_back(
+        nb, {"devices": {"serial": "ansible_product_serial"}}, str(tmp_path), noop=True
+    )
+    assert plan == {"/dcim/devices/": [{"id": 2, "serial": "X"}]}
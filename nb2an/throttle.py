@@ -0,0 +1,205 @@
+"""Adaptive limits on the number of concurrent requests sent to NetBox.
+
+Each class of endpoint (eg /dcim/interfaces/) gets its own limit on
+in-flight requests, adjusted with AIMD: the limit grows slowly while
+responses are quick, and is halved when responses are slow or NetBox
+asks us to back off (429/503), in which case any Retry-After delay is
+honored before that endpoint is used again.
+
+SingleFlight makes concurrent identical requests share one fetch."""
+
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+THROTTLED_STATUSES = [429, 503]
+
+
+def endpoint_class(url: str) -> str:
+    "Group URLs by their path, ignoring object ids and query parameters"
+    path = urlsplit(url).path
+    path = re.sub(r"/\d+(?=/|$)", "/<id>", path)
+    path = re.sub(r"^.*?/api/", "/", path)
+    if not path.endswith("/"):
+        path += "/"
+    return path
+
+
+def retry_after_seconds(value: str, default: float = 1.0) -> float:
+    "Parse a Retry-After header, which is either seconds or an HTTP date"
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return default
+
+
+class EndpointLimit:
+    "The current limit and statistics for one endpoint class"
+
+    def __init__(self, initial: float, maximum: int):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.slow = 0
+        self.total_latency = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self.condition:
+            while True:
+                wait = self.blocked_until - time.time()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self.condition.wait(timeout=wait if wait > 0 else None)
+
+    def release(self) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def increase(self) -> None:
+        with self.condition:
+            # roughly +1 per limit's worth of successful requests
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+    def decrease(self, delay: float = 0.0) -> None:
+        with self.condition:
+            self.limit = max(1.0, self.limit / 2)
+            if delay:
+                self.blocked_until = max(self.blocked_until, time.time() + delay)
+
+
+class AdaptiveLimiter:
+    "Hands out per-endpoint request slots with AIMD-adjusted limits"
+
+    def __init__(
+        self,
+        maximum: int = 4,
+        initial: int = None,
+        latency_target: float = 5.0,
+    ):
+        self.maximum = max(1, maximum)
+        self.initial = initial or max(1, self.maximum // 2)
+        self.latency_target = latency_target
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def endpoint(self, url: str) -> EndpointLimit:
+        name = endpoint_class(url)
+        with self.lock:
+            if name not in self.endpoints:
+                self.endpoints[name] = EndpointLimit(self.initial, self.maximum)
+            return self.endpoints[name]
+
+    def request(self, url: str, send, max_retries: int = 5):
+        """Call send() (which returns a requests-style response) within
+        the endpoint's limit, retrying when asked to back off"""
+        endpoint = self.endpoint(url)
+        for attempt in range(max_retries + 1):
+            endpoint.acquire()
+            start = time.time()
+            try:
+                response = send()
+            finally:
+                endpoint.release()
+            latency = time.time() - start
+
+            with endpoint.condition:
+                endpoint.requests += 1
+                endpoint.total_latency += latency
+
+            if response.status_code in THROTTLED_STATUSES:
+                delay = retry_after_seconds(response.headers.get("Retry-After"))
+                with endpoint.condition:
+                    endpoint.throttled += 1
+                endpoint.decrease(delay)
+                if attempt < max_retries:
+                    continue
+            elif latency > self.latency_target:
+                with endpoint.condition:
+                    endpoint.slow += 1
+                endpoint.decrease()
+            else:
+                endpoint.increase()
+            return response
+
+    def stats(self) -> dict:
+        "Current limits and counts for each endpoint class"
+        results = {}
+        with self.lock:
+            endpoints = dict(self.endpoints)
+        for name, endpoint in sorted(endpoints.items()):
+            with endpoint.condition:
+                results[name] = {
+                    "limit": int(endpoint.limit),
+                    "in_flight": endpoint.in_flight,
+                    "requests": endpoint.requests,
+                    "throttled": endpoint.throttled,
+                    "slow": endpoint.slow,
+                    "mean_latency": endpoint.total_latency / endpoint.requests
+                    if endpoint.requests
+                    else 0.0,
+                }
+        return results
+
+
+class _Call:
+    "One in-flight call that others may be waiting on"
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Makes concurrent calls with the same key share one execution.
+
+    The first caller for a key runs the function, and any callers that
+    arrive while it is running wait for and share its result (or its
+    exception)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.shared = 0
+
+    def do(self, key, function):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except Exception as exp:
+            call.error = exp
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+
+"""Run a local cache broker shared by concurrent nb2an tools"""
+
+import nb2an.netbox
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, FileType
+from logging import debug, info, warning, error, critical
+import logging
+import os
+import sys
+
+
+def parse_args():
+    "Parse the command line arguments."
+    parser = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+        epilog="Exmaple Usage: nb-cache-server --ttl 600",
+    )
+
+    parser.add_argument(
+        "--log-level",
+        "--ll",
+        default="info",
+        help="Define the logging verbosity level (debug, info, warning, error, fotal, critical).",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--socket",
+        default=None,
+        type=str,
+        help="The unix socket to listen on (defaults to cache_socket from the config)",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--ttl",
+        default=None,
+        type=float,
+        help="Seconds to keep cached responses (forever if not set)",
+    )
+
+    args = parser.parse_args()
+    log_level = args.log_level.upper()
+    logging.basicConfig(level=log_level, format="%(levelname)-10s:\t%(message)s")
+    return args
+
+
+def main():
+    import nb2an.cacheserver
+
+    args = parse_args()
+    nb = nb2an.netbox.get_netbox()
+
+    socket_path = args.socket or nb.config.get("cache_socket")
+    if not socket_path:
+        error("Failed to find a socket in args or cache_socket in the .nb2an config")
+        exit(1)
+    socket_path = os.path.expanduser(socket_path)
+
+    server = nb2an.cacheserver.CacheServer(
+        socket_path, nb.fetch, nb.prefix, ttl=args.ttl
+    )
+    info(f"serving cached netbox data on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
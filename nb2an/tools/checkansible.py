@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+
+"""Checks ansible host_vars files for drift from netbox, without changing them.
+
+Exits with 0 when every host matches, 1 when any host has drifted and
+2 when a host could not be checked."""
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, FileType
+from logging import debug, info, warning, error, critical
+import logging
+import copy
+import json
+import sys
+import os
+
+import nb2an.netbox
+import nb2an.shard
+import nb2an.yamlfile
+from nb2an.mapping import process_changes, unknown_functions, PLUGIN_KEY
+from nb2an.plugins.update_ansible import PluginRun
+
+EXIT_CLEAN = 0
+EXIT_DRIFT = 1
+EXIT_ERROR = 2
+
+MISSING = object()
+
+
+def parse_args():
+    parser = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+        epilog="Exmaple Usage: nb-check-ansible -c sample.yml -r 3 -o drift.json",
+    )
+
+    parser.add_argument(
+        "--log-level",
+        "--ll",
+        default="info",
+        help="Define the logging verbosity level (debug, info, warning, error, fotal, critical).",
+    )
+
+    parser.add_argument(
+        "-r", "--racks", default=[], type=int, nargs="*", help="Racks to check"
+    )
+
+    parser.add_argument(
+        "-d", "--ansible-directory", type=str, help="The ansible directory to verify"
+    )
+
+    parser.add_argument(
+        "-D",
+        "--devices",
+        default=[],
+        type=str,
+        nargs="*",
+        help="Check only these NetBox device names",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--changes-file",
+        required=True,
+        type=FileType("r"),
+        help="The changes definition file to use",
+    )
+
+    nb2an.shard.add_arguments(parser)
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=None,
+        type=int,
+        help="The number of hosts to check at once (default: the max_workers setting)",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--format",
+        default="json",
+        choices=["json", "text"],
+        help="The report format",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=sys.stdout,
+        type=FileType("w"),
+        help="Where to write the report",
+    )
+
+    args = parser.parse_args()
+    log_level = args.log_level.upper()
+    logging.basicConfig(level=log_level, format="%(levelname)-10s:\t%(message)s")
+    return args
+
+
+def load_yaml(text: str):
+    """Parse a host_vars file into plain data, as YAML 1.2 like the files
+    nb-update-ansible writes (so eg `yes` stays a string)"""
+    return nb2an.yamlfile.get_parser("safe").load(text)
+
+
+def find_drift(current, expected, path: tuple = ()) -> list[dict]:
+    "List every value that differs between two structures"
+    if isinstance(current, dict) and isinstance(expected, dict):
+        results = []
+        keys = list(current) + [x for x in expected if x not in current]
+        for key in keys:
+            results.extend(
+                find_drift(
+                    current.get(key, MISSING),
+                    expected.get(key, MISSING),
+                    path + (key,),
+                )
+            )
+        return results
+
+    if current == expected and type(current) == type(expected):
+        return []
+
+    result = {"path": ".".join(str(x) for x in path)}
+    if current is not MISSING:
+        result["current"] = current
+    if expected is not MISSING:
+        result["expected"] = expected
+    return [result]
+
+
+def check_host(
+    hostname: str, yaml_file: str, changes: dict, nb_data: dict, run: PluginRun = None
+) -> dict:
+    "Apply the changes to a copy of a host's variables and report any differences"
+    result = {"host": hostname, "file": yaml_file, "drift": []}
+    try:
+        with open(yaml_file) as original:
+            current = load_yaml(original.read()) or {}
+        expected = copy.deepcopy(current)
+        process_changes(changes, expected, nb_data, run=run)
+        result["drift"] = find_drift(current, expected)
+    except Exception as exp:
+        result["error"] = str(exp)
+    return result
+
+
+def check_devices(
+    nb,
+    ansible_directory: str,
+    changes: dict,
+    racks: list = [],
+    names: list = [],
+    jobs: int = None,
+    shard: nb2an.shard.Shard = None,
+) -> dict:
+    "Check every device with a host_vars file, several at a time"
+    import concurrent.futures
+
+    devices = nb.get_devices(racks, link_other_information=True, shard=shard)
+    # batch plugins see every device, not only those being checked
+    run = PluginRun(lambda: nb.get_dataset("devices"))
+    run.prepare_all(changes, PLUGIN_KEY)
+
+    hosts = []
+    for device in devices:
+        if names and device["name"] not in names:
+            continue
+        name = nb.fqdn(device["name"])
+        device_yaml = os.path.join(ansible_directory, "host_vars", name + ".yml")
+        if os.path.exists(device_yaml):
+            hosts.append((name, device_yaml, device))
+
+    jobs = jobs or nb.max_workers
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        results = list(
+            pool.map(
+                lambda host: check_host(host[0], host[1], changes, host[2], run), hosts
+            )
+        )
+
+    return {
+        "summary": {
+            "checked": len(results),
+            "drifted": len([x for x in results if x["drift"]]),
+            "errors": len([x for x in results if "error" in x]),
+        },
+        "hosts": [x for x in results if x["drift"] or "error" in x],
+    }
+
+
+def exit_code(report: dict) -> int:
+    if report["summary"]["errors"]:
+        return EXIT_ERROR
+    if report["summary"]["drifted"]:
+        return EXIT_DRIFT
+    return EXIT_CLEAN
+
+
+def write_text(report: dict, out=sys.stdout) -> None:
+    for host in report["hosts"]:
+        if "error" in host:
+            out.write(f"{host['host']}: ERROR: {host['error']}\n")
+        for drift in host["drift"]:
+            current = drift.get("current", "<missing>")
+            expected = drift.get("expected", "<missing>")
+            out.write(f"{host['host']}: {drift['path']}: {current!r} != {expected!r}\n")
+    summary = report["summary"]
+    out.write(
+        f"{summary['checked']} hosts checked, {summary['drifted']} drifted,"
+        f" {summary['errors']} errors\n"
+    )
+
+
+def main():
+    import yaml
+
+    args = parse_args()
+    nb = nb2an.netbox.get_netbox()
+    config = nb.config
+
+    ansible_directory = args.ansible_directory or config.get("ansible_directory")
+    if not ansible_directory:
+        error("Failed to find ansible_directory in args or .nb2an config")
+        exit(EXIT_ERROR)
+
+    changes = yaml.safe_load(args.changes_file.read())
+    for function_name in unknown_functions(changes):
+        error(f"function '{function_name}' is unknown")
+        exit(EXIT_ERROR)
+
+    try:
+        report = check_devices(
+            nb,
+            ansible_directory,
+            changes,
+            racks=args.racks,
+            names=args.devices,
+            jobs=args.jobs,
+            shard=nb2an.shard.from_args(args),
+        )
+    except Exception as exp:
+        error(f"failed to check the hosts: {exp}")
+        exit(EXIT_ERROR)
+
+    if args.format == "text":
+        write_text(report, args.output)
+    else:
+        json.dump(report, args.output, indent=2, default=str)
+        args.output.write("\n")
+
+    exit(exit_code(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,6 @@
 
 """List attributes of a device"""
 
-import requests
 import nb2an.netbox
 
 try:
@@ -14,7 +13,6 @@ from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, FileType
 from logging import debug, info, warning, error, critical
 import logging
 import sys
-import yaml
 
 
 def parse_args():
@@ -47,9 +45,11 @@ def parse_args():
 
 
 def main():
+    import yaml
+
     args = parse_args()
 
-    nb = nb2an.netbox.Netbox()
+    nb = nb2an.netbox.get_netbox()
 
     for device in args.devices:
         try:
@@ -64,7 +64,7 @@ def main():
 
         for innerdevice in device:  # could have returned more than one
             print(f"#\n# device: #{innerdevice['id']}\n#")
-            print(yaml.dump(innerdevice))
+            print(yaml.dump(innerdevice.materialize()))
 
 
 if __name__ == "__main__":
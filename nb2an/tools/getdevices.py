@@ -2,7 +2,6 @@
 
 """List devices in a rack"""
 
-import requests
 import nb2an.netbox
 
 try:
@@ -40,7 +39,7 @@ def parse_args():
 def main():
     args = parse_args()
 
-    devices = nb2an.netbox.Netbox().get_devices(args.rack)
+    devices = nb2an.netbox.get_netbox().get_devices(args.rack)
     print(f"{'Id':<3} {'Pos':<3} {'Name':<25} {'Type':<20}")
     last_spot = None
     for device in sorted(devices, key=lambda x: x['position'] or 0,
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+
+"""Look up which devices own addresses or sit within prefixes"""
+
+import nb2an.netbox
+
+try:
+    from rich import print
+except Exception:
+    pass
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, FileType
+from logging import debug, info, warning, error, critical
+import logging
+import sys
+
+
+def parse_args():
+    "Parse the command line arguments."
+    parser = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+        epilog="Exmaple Usage: nb-ip 10.20.0.0/16 192.0.2.1",
+    )
+
+    parser.add_argument(
+        "--log-level",
+        "--ll",
+        default="info",
+        help="Define the logging verbosity level (debug, info, warning, error, fotal, critical).",
+    )
+
+    parser.add_argument(
+        "queries",
+        type=str,
+        nargs="+",
+        help="Addresses (owner or longest prefix match) or prefixes (contained addresses)",
+    )
+
+    args = parser.parse_args()
+    log_level = args.log_level.upper()
+    logging.basicConfig(level=log_level, format="%(levelname)-10s:\t%(message)s")
+    return args
+
+
+def lookup(index, query: str) -> list:
+    "Return the entries matching an address or prefix query"
+    if "/" in query:
+        return index.within(query)
+
+    entries = index.owners(query)
+    if not entries:
+        debug(f"{query} is unassigned, using the longest prefix match")
+        entries = index.longest_match(query)
+    return entries
+
+
+def main():
+    args = parse_args()
+
+    index = nb2an.netbox.get_netbox().get_ip_index()
+    for query in args.queries:
+        print(f"{query}:")
+        for entry in lookup(index, query):
+            print(f"  {str(entry.address):<30} {entry.host:<25} {entry.interface}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,6 @@
 
 """List networks in a rack"""
 
-import requests
 import nb2an.netbox
 import collections
 
@@ -32,7 +31,7 @@ def parse_args():
         help="Define the logging verbosity level (debug, info, warning, error, fotal, critical).",
     )
 
-    parser.add_argument("rack", type=str, help="Rack choice")
+    parser.add_argument("rack", type=int, help="Rack choice")
 
     args = parser.parse_args()
     log_level = args.log_level.upper()
@@ -43,11 +42,13 @@ def parse_args():
 def main():
     args = parse_args()
 
-    nb = nb2an.netbox.Netbox()
-    r = nb.get("/dcim/devices/?rack_id=" + args.rack)
+    nb = nb2an.netbox.get_netbox()
+    r = nb.get_devices(int(args.rack))
+    device_ids = [device["id"] for device in r]
 
-    interface_addresses = nb.get_addresses()
-    interfaces = nb.get_interfaces()
+    # only fetch the addresses and interfaces of this rack's devices
+    interface_addresses = nb.get_addresses(device_ids)
+    interfaces = nb.get_interfaces(device_ids)
 
     for device in sorted(r, key=lambda x: x["display"]):
 
@@ -55,10 +56,10 @@ def main():
         print(f"{name}:")
 
         # get interfaces
-        dev_interfaces = interfaces[name]
+        dev_interfaces = interfaces.get(device["name"], [])
+        dev_addresses = interface_addresses.get(name, {})
 
         for interface in dev_interfaces:
-            interface = dev_interfaces[interface]
             other_end = ""
             if (
                 "cable_peer" in interface
@@ -72,12 +73,12 @@ def main():
                 ifname = interface["display"]
 
             ipv4 = ""
-            if ifname in interface_addresses[name]:
-                ipv4 = interface_addresses[name][ifname].get("IPv4", "")
+            if ifname in dev_addresses:
+                ipv4 = dev_addresses[ifname].get("IPv4", "")
 
             ipv6 = ""
-            if ifname in interface_addresses[name]:
-                ipv6 = interface_addresses[name][ifname].get("IPv6", "")
+            if ifname in dev_addresses:
+                ipv6 = dev_addresses[ifname].get("IPv6", "")
 
             print(
                 f"  {interface['name']:<12} {other_end:<10} {ipv4:<20} {ipv6:<30} {interface['type']['label']}"
@@ -2,7 +2,6 @@
 
 """List devices in a rack"""
 
-import requests
 import nb2an.netbox
 import collections
 
@@ -45,7 +44,7 @@ def main():
     by_outlet = {}
     by_device = collections.defaultdict(list)
 
-    nb = nb2an.netbox.Netbox()
+    nb = nb2an.netbox.get_netbox()
     r = nb.get("/dcim/devices/?rack_id=" + args.rack)
     for device in r:
         outlets = nb.get_outlets_by_device_id(device["id"])
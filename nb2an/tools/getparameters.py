@@ -6,16 +6,11 @@ from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, FileType
 from logging import debug, info, warning, error, critical
 import logging
 import sys
-import os
-import re
-import yaml
-import shutil
-import subprocess
-import ruamel.yaml
+import csv
+import json
 
 import nb2an.netbox
 import nb2an.dotnest
-from nb2an.plugins.update_ansible import update_ansible_plugins
 
 
 def parse_args():
@@ -40,6 +35,22 @@ def parse_args():
         "-f", "--fsdb", action="store_true", help="Output data in FSDB format"
     )
 
+    parser.add_argument(
+        "-F",
+        "--format",
+        default=None,
+        choices=OUTPUT_FORMATS,
+        help="Output format (parquet and arrow require pyarrow); defaults to human",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        type=str,
+        help="Output file (required for parquet and arrow)",
+    )
+
     parser.add_argument(
         "-D",
         "--devices",
@@ -62,46 +73,208 @@ def parse_args():
     return args
 
 
-def process_devices(nb, racks=[], specifications=[], as_fsdb=False):
-    devices = nb.get_devices(racks, link_other_information=True)
+OUTPUT_FORMATS = ["human", "fsdb", "csv", "parquet", "arrow"]
+ARROW_BATCH_SIZE = 1000
+
+DNE = object()  # marks specifications that don't exist for a device
+
+
+def extract_rows(nb, devices, specifications):
+    """Evaluate every specification for each device, yielding one
+    [name, value, ...] row per device as soon as it is resolved."""
+    keys = [nb2an.dotnest.DotNest(None).parse_keys(x) for x in specifications]
+    dn = nb2an.dotnest.DotNest(None)
+    for device in nb.link_device_data(devices):
+        dn.data = device
+        row = [nb.fqdn(device["name"])]
+        for key in keys:
+            try:
+                row.append(dn.get(key))
+            except Exception:
+                row.append(DNE)
+        yield row
+
+
+def write_human(rows, specifications, out=sys.stdout):
+    for row in rows:
+        print(f"{row[0]}", file=out)
+        for specification, value in zip(specifications, row[1:]):
+            if value is DNE:
+                value = "[DNE]"
+            print(f"  {specification:<40s}:  {value}", file=out)
+
+
+def write_fsdb(rows, specifications, out=sys.stdout):
+    import pyfsdb
+
+    fh = pyfsdb.Fsdb(out_file_handle=out)
+    fh.out_column_names = ["name"] + [x for x in specifications]
+    for row in rows:
+        fh.append([None if x is DNE else x for x in row])
+
+
+def _flat(value):
+    "Convert a value to something a flat (non-nested) table can hold"
+    if value is DNE:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def write_csv(rows, specifications, out=sys.stdout):
+    writer = csv.writer(out)
+    writer.writerow(["name"] + [x for x in specifications])
+    for row in rows:
+        writer.writerow([_flat(x) for x in row])
 
-    if as_fsdb:
-        import pyfsdb
 
-        fh = pyfsdb.Fsdb(out_file_handle=sys.stdout)
-        fh.out_column_names = ["name"] + [x for x in specifications]
+def _stringify(values):
+    return [None if x is None else str(x) for x in values]
 
-    for device in devices:
-        name = nb.fqdn(device["name"])
-        dn = nb2an.dotnest.DotNest(device)
 
-        # FSDB output
-        if as_fsdb:
-            row = [name]
-            for specification in specifications:
-                try:
-                    row.append(dn.get(specification))
-                except Exception:
-                    row.append(None)
-            fh.append(row)
-            continue
+def _arrow_column(pa, values, column_type=None):
+    """Build an arrow array, stringifying values of mixed types.  Raises
+    pa.ArrowInvalid or pa.ArrowTypeError when values don't fit a given
+    non-string column_type."""
+    if column_type is not None and pa.types.is_string(column_type):
+        return pa.array(_stringify(values), type=column_type)
+    try:
+        array = pa.array(values, type=column_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if column_type is not None:
+            raise
+        return pa.array(_stringify(values), type=pa.string())
+    if pa.types.is_null(array.type):
+        array = array.cast(pa.string())
+    return array
 
-        # human output
-        print(f"{name}")
-        for specification in specifications:
+
+def _open_arrow_writer(pa, output, schema, as_parquet=True):
+    if as_parquet:
+        import pyarrow.parquet
+
+        return pyarrow.parquet.ParquetWriter(output, schema)
+    return pa.ipc.new_file(output, schema)
+
+
+def _read_arrow_batches(pa, source, as_parquet=True):
+    if as_parquet:
+        import pyarrow.parquet
+
+        yield from pyarrow.parquet.ParquetFile(source).iter_batches()
+        return
+    reader = pa.ipc.open_file(source)
+    for n in range(reader.num_record_batches):
+        yield reader.get_batch(n)
+
+
+def write_arrow(rows, specifications, output, as_parquet=True):
+    """Write rows to a parquet or arrow IPC file in batches.
+
+    Column types are taken from the first batch.  When a later batch
+    has values that don't fit a column's type, that column is widened
+    to strings and the batches already written are rewritten to match,
+    so no values are lost."""
+    import os
+    import pyarrow as pa
+
+    columns = ["name"] + [x for x in specifications]
+    writer = None
+    schema = None
+    batch = []
+
+    def widen(widened: list):
+        "Rewrite the file written so far with the widened columns as strings"
+        nonlocal writer, schema
+        writer.close()
+        for n in widened:
+            warning(f"{columns[n]} has values of several types: writing it as strings")
+            schema = schema.set(n, pa.field(columns[n], pa.string()))
+
+        narrow = output + ".narrow"
+        os.replace(output, narrow)
+        writer = _open_arrow_writer(pa, output, schema, as_parquet)
+        with open(narrow, "rb") as source:
+            for old in _read_arrow_batches(pa, source, as_parquet):
+                arrays = [
+                    pa.array(_stringify(old.column(n).to_pylist()), pa.string())
+                    if n in widened
+                    else old.column(n)
+                    for n in range(len(columns))
+                ]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        os.remove(narrow)
+
+    def flush():
+        nonlocal writer, schema
+        if not batch:
+            return
+        arrays = []
+        widened = []
+        for n in range(len(columns)):
+            column_type = schema.field(n).type if schema else None
+            values = [_flat(row[n]) for row in batch]
             try:
-                print(f"  {specification:<40s}:  {dn.get(specification)}")
-            except Exception:
-                print(f"  {specification:<40s}:  [DNE]")
+                arrays.append(_arrow_column(pa, values, column_type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                widened.append(n)
+                arrays.append(_arrow_column(pa, values, pa.string()))
+
+        if widened:
+            widen(widened)
+        if writer is None:
+            schema = pa.Table.from_arrays(arrays, names=columns).schema
+            writer = _open_arrow_writer(pa, output, schema, as_parquet)
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        batch.clear()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= ARROW_BATCH_SIZE:
+            flush()
+    flush()
+
+    if writer:
+        writer.close()
+
+
+def process_devices(
+    nb, racks=[], specifications=[], as_fsdb=False, output_format=None, output=None
+):
+    if not output_format:
+        output_format = "fsdb" if as_fsdb else "human"
+
+    devices = nb.get_devices(racks)
+    rows = extract_rows(nb, devices, specifications)
+
+    if output_format in ["parquet", "arrow"]:
+        if not output:
+            error(f"the {output_format} format requires an output file")
+            exit(1)
+        write_arrow(rows, specifications, output, output_format == "parquet")
+        return
+
+    out = open(output, "w", newline="") if output else sys.stdout
+    try:
+        writers = {"human": write_human, "fsdb": write_fsdb, "csv": write_csv}
+        writers[output_format](rows, specifications, out)
+    finally:
+        if output:
+            out.close()
 
 
 def main():
     args = parse_args()
-    nb = nb2an.netbox.Netbox()
-    config = nb.get_config()
+    nb = nb2an.netbox.get_netbox()
 
     process_devices(
-        nb, racks=args.racks, specifications=args.data_specifications, as_fsdb=args.fsdb
+        nb,
+        racks=args.racks,
+        specifications=args.data_specifications,
+        as_fsdb=args.fsdb,
+        output_format=args.format,
+        output=args.output,
     )
 
 
@@ -1,6 +1,5 @@
 #!/usr/bin/python3
 
-import requests
 import nb2an.netbox
 
 try:
@@ -12,7 +11,7 @@ except Exception:
 def main():
     # args = parse_args()
 
-    racks = nb2an.netbox.Netbox().get_racks()
+    racks = nb2an.netbox.get_netbox().get_racks()
     print(f"{'Id':<3} {'Name':<25} {'Site':<20} {'Location':<20} {'#devs'}")
     for rack in racks:
         print(
@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+
+"""Combines the reports, statistics or patches written by sharded runs"""
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, FileType
+from logging import debug, info, warning, error, critical
+import logging
+import sys
+
+import nb2an.shard
+
+
+def parse_args():
+    parser = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+        epilog="Exmaple Usage: nb-merge-shards -o drift.json drift-*.json",
+    )
+
+    parser.add_argument(
+        "--log-level",
+        "--ll",
+        default="info",
+        help="Define the logging verbosity level (debug, info, warning, error, fotal, critical).",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=sys.stdout,
+        type=FileType("w"),
+        help="Where to write the combined output",
+    )
+
+    parser.add_argument(
+        "inputs", type=FileType("r"), nargs="+", help="The output files of each shard"
+    )
+
+    args = parser.parse_args()
+    log_level = args.log_level.upper()
+    logging.basicConfig(level=log_level, format="%(levelname)-10s:\t%(message)s")
+    return args
+
+
+def main():
+    args = parse_args()
+    try:
+        merged = nb2an.shard.merge([x.read() for x in args.inputs])
+    except ValueError as exp:
+        error(str(exp))
+        exit(1)
+    args.output.write(merged)
+
+
+if __name__ == "__main__":
+    main()
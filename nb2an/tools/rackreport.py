@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+
+"""Report space and power use for every rack (or every rack at a site)"""
+
+import nb2an.netbox
+
+try:
+    from rich import print
+except Exception:
+    pass
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, FileType
+from logging import debug, info, warning, error, critical
+import logging
+import sys
+
+
+def parse_args():
+    "Parse the command line arguments."
+    parser = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+        epilog="Exmaple Usage: nb-rack-report -s mia -p",
+    )
+
+    parser.add_argument(
+        "--log-level",
+        "--ll",
+        default="info",
+        help="Define the logging verbosity level (debug, info, warning, error, fotal, critical).",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--site",
+        default=None,
+        type=str,
+        help="Only report racks at this site (slug)",
+    )
+
+    parser.add_argument(
+        "-e", "--elevations", action="store_true", help="Show each rack's devices"
+    )
+
+    parser.add_argument(
+        "-p", "--pdus", action="store_true", help="Show each rack's PDU power use"
+    )
+
+    parser.add_argument(
+        "-f", "--fsdb", action="store_true", help="Output rack summaries in FSDB format"
+    )
+
+    args = parser.parse_args()
+    log_level = args.log_level.upper()
+    logging.basicConfig(level=log_level, format="%(levelname)-10s:\t%(message)s")
+    return args
+
+
+def get_rack_report(nb, site: str = None) -> list[dict]:
+    "Fetch everything needed in bulk, and summarize each rack"
+    import nb2an.rackreport
+
+    if site:
+        racks = nb.get(f"/dcim/racks/?site={site}")
+        devices = nb.get_devices([x["id"] for x in racks]) if racks else []
+    else:
+        racks = nb.get_racks()
+        devices = nb.get_devices()
+
+    return nb2an.rackreport.build_rack_report(
+        racks,
+        devices,
+        nb.get("/dcim/device-types/"),
+        nb.get_power_ports(),
+        nb.get_outlets(),
+    )
+
+
+COLUMNS = [
+    "id",
+    "name",
+    "site",
+    "u_height",
+    "u_used",
+    "u_free",
+    "devices",
+    "allocated_draw",
+    "maximum_draw",
+]
+
+
+def main():
+    args = parse_args()
+
+    report = get_rack_report(nb2an.netbox.get_netbox(), args.site)
+
+    if args.fsdb:
+        import pyfsdb
+
+        fh = pyfsdb.Fsdb(out_file_handle=sys.stdout)
+        fh.out_column_names = COLUMNS
+        for rack in report:
+            fh.append([rack[x] for x in COLUMNS])
+        return
+
+    print(
+        f"{'Id':<4} {'Name':<20} {'Site':<12} {'U':>4} {'Used':>5} {'Free':>5} {'#devs':>5} {'Alloc W':>8} {'Max W':>8}"
+    )
+    for rack in report:
+        print(
+            f"{rack['id']:<4} {rack['name']:<20} {str(rack['site']):<12} {rack['u_height']:>4}"
+            f" {rack['u_used']:>5} {rack['u_free']:>5} {rack['devices']:>5}"
+            f" {rack['allocated_draw']:>8} {rack['maximum_draw']:>8}"
+        )
+        if args.elevations:
+            for device in rack["elevation"]:
+                position = device["position"] if device["position"] is not None else "-"
+                print(f"       {position:>4} {device['height']:>3}U  {device['name']}")
+        if args.pdus:
+            for name, pdu in rack["pdus"].items():
+                print(
+                    f"       PDU {name:<20} outlets {pdu['used']}/{pdu['outlets']}"
+                    f"  {pdu['allocated_draw']}W allocated, {pdu['maximum_draw']}W max"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,23 +2,38 @@
 
 """Updates ansible YAML files with information from netbox"""
 
-from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, FileType
+from argparse import (
+    ArgumentParser,
+    ArgumentDefaultsHelpFormatter,
+    ArgumentTypeError,
+    FileType,
+)
 from logging import debug, info, warning, error, critical
 import logging
 import sys
 import os
-import re
-import yaml
+import io
 import shutil
 import subprocess
-import traceback
-import ruamel.yaml
 
 import nb2an.netbox
-import nb2an.dotnest
-from nb2an.plugins.update_ansible import update_ansible_plugins
+import nb2an.yamlfile
+import nb2an.manifest
+import nb2an.shard
+import nb2an.journal
+from nb2an.plugins.update_ansible import profile, PluginRun
+from nb2an.mapping import process_changes, unknown_functions, PLUGIN_KEY
 
-PLUGIN_KEY = "__function"
+
+def positive_int(value: str) -> int:
+    "An argparse type for counts that must be at least 1"
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError(f"{value!r} is not a number")
+    if number < 1:
+        raise ArgumentTypeError(f"{value} must be at least 1")
+    return number
 
 
 def parse_args():
@@ -71,98 +86,365 @@ def parse_args():
         help="Try a multi-run with yaml-edit and whitespace ignoring diff to patch minimally",
     )
 
-    args = parser.parse_args()
-    log_level = args.log_level.upper()
-    logging.basicConfig(level=log_level, format="%(levelname)-10s:\t%(message)s")
-    return args
+    parser.add_argument(
+        "-F",
+        "--full-rewrite",
+        action="store_true",
+        help="Always re-dump whole files, rather than editing changed values in place",
+    )
 
+    parser.add_argument(
+        "-M",
+        "--manifest",
+        default=None,
+        type=str,
+        help="A manifest file recording each host's inputs, so unchanged hosts can be skipped",
+    )
 
-def process_changes(changes, yaml_struct, nb_data):
-    dn = nb2an.dotnest.DotNest(nb_data)
-    for item in changes:
-        if isinstance(changes[item], dict):
-
-            # check if it's a special dict with instructions
-            if PLUGIN_KEY in changes[item]:
-                function_name = changes[item][PLUGIN_KEY]
-                if function_name not in update_ansible_plugins:
-                    error(f"function '{function_name}' is unknown")
-                    exit(1)
-
-                try:
-                    fn = update_ansible_plugins[function_name]
-                    value = fn(dn, yaml_struct, changes[item], item)
-                except Exception as exp:
-                    error(f"failed to call function {function_name} for item {item}")
-                    errors = traceback.format_exception(exp)
-                    for err in errors:
-                        debug(err)
-            else:
-                if item not in yaml_struct:
-                    yaml_struct[item] = {}  # TODO: allow list creation
-                process_changes(changes[item], yaml_struct[item], nb_data)
-
-            # if nothing was added, drop it again
-            if item in yaml_struct and yaml_struct[item] == {}:
-                del yaml_struct[item]
-        elif isinstance(changes[item], str):
-            try:
-                value = dn.get(changes[item])
-                yaml_struct[item] = value
-            except Exception:
-                debug(f"skipping {changes[item]}: failed to find netbox value")
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Report NetBox request statistics (and concurrency limits) after the run",
+    )
 
+    parser.add_argument(
+        "--stats-file",
+        default=None,
+        type=str,
+        help="Save NetBox request statistics as JSON (eg, to combine shards with nb-merge-shards)",
+    )
 
-def process_host(
-    nb: nb2an.netbox.Netbox,
-    hostname: str,
-    yaml_file: str,
-    changes: dict = None,
-):
-    info(f"modifying {yaml_file}")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue a failed run, skipping the hosts it completed (if netbox hasn't changed)",
+    )
+
+    parser.add_argument(
+        "--journal",
+        default=None,
+        type=str,
+        help="Where to record completed hosts (default: .nb2an-journal, or .nb2an-journal-i-of-N for a shard, in the ansible directory)",
+    )
+
+    nb2an.shard.add_arguments(parser)
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=None,
+        type=int,
+        help="The number of files to read and transform at once (default: the max_workers setting)",
+    )
+
+    parser.add_argument(
+        "--profile-mapping",
+        default=None,
+        type=positive_int,
+        nargs="?",
+        const=25,
+        help="Report the N most expensive mapping entries and plugins after the run",
+    )
 
-    # load the original YAML
-    with open(yaml_file) as original:
-        yaml_data = original.read()
+    args = parser.parse_args()
+    log_level = args.log_level.upper()
+    logging.basicConfig(level=log_level, format="%(levelname)-10s:\t%(message)s")
+    return args
 
-        yaml_parser = ruamel.yaml.YAML()
-        yaml_parser.indent(mapping=2, sequence=4, offset=2)
-        yaml_parser.preserve_quotes = True
-        yaml_parser.width = 4096
-        yaml_struct = yaml_parser.load(yaml_data)
 
+def print_mapping_profile(limit: int = 25, out=sys.stderr):
+    "Print the most expensive mapping entries and plugins seen this run"
+    rows = profile.report(limit=limit)
+    print(
+        f"{'kind':<8} {'name':<40} {'calls':>7} {'total(s)':>10} {'mean(ms)':>10} {'max(ms)':>10}  slowest hosts",
+        file=out,
+    )
+    for row in rows:
+        print(
+            f"{row['kind']:<8} {row['name']:<40} {row['count']:>7} {row['total']:>10.3f}"
+            f" {row['mean'] * 1000:>10.3f} {row['max'] * 1000:>10.3f}  {', '.join(row['slowest_hosts'])}",
+            file=out,
+        )
+
+
+def print_netbox_stats(nb, out=sys.stderr):
+    "Print the request statistics collected by the NetBox client"
+    stats = nb.get_stats()
+    print(
+        f"{'endpoint':<40} {'limit':>5} {'requests':>9} {'throttled':>9} {'slow':>6} {'latency(ms)':>12}",
+        file=out,
+    )
+    for name, endpoint in stats["endpoints"].items():
+        print(
+            f"{name:<40} {endpoint['limit']:>5} {endpoint['requests']:>9} {endpoint['throttled']:>9}"
+            f" {endpoint['slow']:>6} {endpoint['mean_latency'] * 1000:>12.1f}",
+            file=out,
+        )
+
+    print(
+        f"\n{'cache':<40} {'entries':>8} {'hits':>8} {'misses':>8} {'hit rate':>8} {'evicted':>8} {'expired':>8}",
+        file=out,
+    )
+    for name, cache in stats["caches"].items():
+        print(
+            f"{name:<40} {cache['entries']:>8} {cache['hits']:>8} {cache['misses']:>8}"
+            f" {cache['hit_rate']:>8.2f} {cache['evictions']:>8} {cache['expirations']:>8}",
+            file=out,
+        )
+
+
+def linked_keys(changes) -> set:
+    "The LinkedDevice keys (eg, interfaces) that a changes mapping reads"
+    keys = set()
+    if isinstance(changes, dict):
+        for value in changes.values():
+            keys |= linked_keys(value)
+    elif isinstance(changes, list):
+        for value in changes:
+            keys |= linked_keys(value)
+    elif isinstance(changes, str):
+        first = changes.split(".")[0]
+        if first in nb2an.netbox.LinkedDevice.LINKED_KEYS:
+            keys.add(first)
+    return keys
+
+
+def read_host(job: dict) -> dict:
+    "Load the original YAML text of a host"
+    with open(job["yaml_file"]) as original:
+        job["text"] = original.read()
+    return job
+
+
+def hydrate_host(nb, job: dict, changes=None, manifest=None, linked=()) -> dict:
+    """Find a host's netbox data, and look up the linked data the changes
+    need.  Returns None if the manifest says the host hasn't changed."""
+    hostname = job["hostname"]
+    job["nb_data"] = None
     if changes:
         nb_data = nb.get_devices_by_name(hostname, link_other_information=True)
         if not nb_data or len(nb_data) != 1:
             info(f"not processing changes for {hostname} as no netbox data found")
         else:
-            nb_data = nb_data[0]
-            process_changes(changes, yaml_struct, nb_data)
+            job["nb_data"] = nb_data[0]
+            for key in linked:
+                job["nb_data"].get(key)
+
+    # skip hosts whose inputs are the same as last time
+    if manifest and job["nb_data"] is not None:
+        if manifest.is_current(hostname, job["nb_data"], job["text"]):
+            debug(f"skipping {job['yaml_file']}: nothing has changed")
+            return None
+    return job
+
+
+def transform_host(
+    job: dict, changes=None, fast_path=True, track_reads=False, run=None
+) -> dict:
+    "Apply the changes to a host's YAML, producing the text to write"
+    info(f"modifying {job['yaml_file']}")
+    yaml_data = job["text"]
+    yaml_parser = nb2an.yamlfile.get_parser()
+    yaml_struct = yaml_parser.load(yaml_data)
+
+    # remember what the mapped values were so they can be edited in place
+    paths = None
+    if changes and fast_path:
+        paths = nb2an.yamlfile.leaf_paths(changes, PLUGIN_KEY)
+        if paths is not None:
+            before = nb2an.yamlfile.snapshot(yaml_struct, paths)
+
+    job["reads"] = [] if track_reads else None
+    if changes:
+        if job["nb_data"] is not None:
+            process_changes(
+                changes, yaml_struct, job["nb_data"], reads=job["reads"], run=run
+            )
 
         for item in changes:
             debug(f"setting: {item} to {changes[item]}")
 
-    # write the YAML back out
-    with open(yaml_file, "w") as modified:
-        yaml_parser.dump(yaml_struct, modified)
+    output = None
+    if paths is not None:
+        output = nb2an.yamlfile.edit_in_place(yaml_data, yaml_struct, paths, before)
+        if output is None:
+            debug(f"{job['yaml_file']}: changes need a full rewrite")
 
+    if output is None:
+        stream = io.StringIO()
+        yaml_parser.dump(yaml_struct, stream)
+        output = stream.getvalue()
 
-def process_devices(nb, ansible_directory, racks=[], changes=True):
-    devices = nb.get_devices(racks, link_other_information=True)
+    job["output"] = output
+    return job
 
-    for device in devices:
-        name = nb.fqdn(device["name"])
-        debug(f"starting: {name}")
 
-        device_yaml = os.path.join(ansible_directory, "host_vars", name + ".yml")
-        if os.path.exists(device_yaml):
-            process_host(nb, name, device_yaml, changes=changes)
+def write_host(job: dict, manifest=None, journal=None) -> dict:
+    "Write the YAML back out, if it changed"
+    if job["output"] != job["text"]:
+        nb2an.yamlfile.write_atomic(job["yaml_file"], job["output"])
+
+    if manifest and job["nb_data"] is not None:
+        manifest.record(job["hostname"], job["reads"], job["output"])
+    if journal:
+        journal.complete(job["hostname"])
+    return job
+
+
+def process_host(
+    nb: nb2an.netbox.Netbox,
+    hostname: str,
+    yaml_file: str,
+    changes: dict = None,
+    fast_path: bool = True,
+    manifest: nb2an.manifest.Manifest = None,
+):
+    "Update a single host's YAML file"
+    job = read_host({"hostname": hostname, "yaml_file": yaml_file})
+    job = hydrate_host(nb, job, changes, manifest)
+    if job is None:
+        return
+    transform_host(job, changes, fast_path, track_reads=bool(manifest))
+    write_host(job, manifest)
+
+
+def process_devices(
+    nb,
+    ansible_directory,
+    racks=[],
+    changes=True,
+    fast_path=True,
+    manifest=None,
+    shard=None,
+    jobs=None,
+    stats=None,
+    journal=None,
+):
+    """Update the YAML files of every device through a pipeline of
+    concurrent read, netbox, transform and write stages.  If a stats
+    dict is passed, it's filled in with each stage's throughput.  If a
+    journal is passed, hosts it says were completed are skipped."""
+    import nb2an.pipeline
+
+    devices = nb.get_devices(racks, link_other_information=True, shard=shard)
+    completed = set()
+    linked = linked_keys(changes)
+    if journal:
+        completed = journal.start(
+            nb2an.journal.snapshot_id(devices, linked), nb2an.manifest.digest(changes)
+        )
+    jobs = jobs or nb.max_workers
+    # batch plugins see every device, not only those being processed
+    run = PluginRun(lambda: nb.get_dataset("devices"))
+    run.prepare_all(changes, PLUGIN_KEY)
+
+    def hosts():
+        for device in devices:
+            name = nb.fqdn(device["name"])
+            device_yaml = os.path.join(ansible_directory, "host_vars", name + ".yml")
+            if name in completed:
+                debug(f"skipping {name}: completed by the previous run")
+            elif os.path.exists(device_yaml):
+                debug(f"starting: {name}")
+                yield {"hostname": name, "yaml_file": device_yaml}
+
+    Stage = nb2an.pipeline.Stage
+    pipeline = nb2an.pipeline.Pipeline(
+        [
+            Stage("read", read_host, workers=jobs),
+            Stage(
+                "netbox",
+                lambda job: hydrate_host(nb, job, changes, manifest, linked),
+            ),
+            Stage(
+                "transform",
+                lambda job: transform_host(
+                    job, changes, fast_path, bool(manifest), run
+                ),
+                workers=jobs,
+            ),
+            Stage("write", lambda job: write_host(job, manifest, journal)),
+        ],
+        queue_size=nb.config.get("pipeline_queue_size", 4 * jobs),
+    )
+    try:
+        pipeline.run(hosts())
+    finally:
+        if stats is not None:
+            stats.update(pipeline.stats())
+
+    if manifest:
+        info(f"skipped {manifest.skipped} unchanged hosts")
+        manifest.save()
+
+    if journal:
+        journal.finish()
+
+
+def default_journal_path(ansible_directory: str, shard=None) -> str:
+    "Where a run records its completed hosts; each shard has its own journal"
+    name = ".nb2an-journal"
+    if shard:
+        name += f"-{shard.index}-of-{shard.count}"
+    return os.path.join(ansible_directory, name)
+
+
+def backup_host_vars(host_vars: str, resume: bool = False) -> None:
+    "Keep a copy of the original host_vars to diff against (for -w)"
+    backup = host_vars + ".nb2an-bkup"
+    if os.path.exists(backup):
+        if not resume:
+            error(f"{backup} was left by an earlier run: use --resume to continue it")
+            exit(1)
+        info(f"continuing with the original files in {backup}")
+        return
+
+    # copy under a temporary name, so a partial copy is never used
+    if os.path.exists(backup + ".tmp"):
+        shutil.rmtree(backup + ".tmp")
+    shutil.copytree(host_vars, backup + ".tmp")
+    os.rename(backup + ".tmp", backup)
+
+
+def restore_host_vars(host_vars: str) -> str:
+    """Put the original host_vars back, moving the modified files aside.
+    Returns the modified directory."""
+    backup = host_vars + ".nb2an-bkup"
+    modified = host_vars + ".nb2an-modified"
+    if os.path.exists(modified):
+        shutil.rmtree(modified)
+
+    os.rename(host_vars, modified)
+    try:
+        os.rename(backup, host_vars)
+    except OSError:
+        os.rename(modified, host_vars)
+        raise
+    return modified
+
+
+def print_pipeline_stats(stats: dict, out=sys.stderr):
+    "Print the throughput of each pipeline stage"
+    print(
+        f"{'stage':<12} {'workers':>7} {'items':>7} {'dropped':>7} {'errors':>6}"
+        f" {'busy(s)':>8} {'blocked(s)':>10} {'items/s':>8}",
+        file=out,
+    )
+    for name, stage in stats.items():
+        print(
+            f"{name:<12} {stage['workers']:>7} {stage['items']:>7} {stage['dropped']:>7}"
+            f" {stage['errors']:>6} {stage['busy']:>8.2f} {stage['waiting']:>10.2f}"
+            f" {stage['per_second']:>8.1f}",
+            file=out,
+        )
 
 
 def main():
+    import yaml
+
     args = parse_args()
-    nb = nb2an.netbox.Netbox()
-    config = nb.get_config()
+    nb = nb2an.netbox.get_netbox()
+    config = nb.config
 
     ansible_directory = args.ansible_directory
     if not ansible_directory:
@@ -176,21 +458,75 @@ def main():
     changes = None
     if not args.noop and args.changes_file:
         changes = yaml.safe_load(args.changes_file.read())
+        for function_name in unknown_functions(changes):
+            error(f"function '{function_name}' is unknown")
+            exit(1)
+
+    if args.profile_mapping is not None:
+        profile.enabled = True
+
+    manifest = None
+    manifest_path = args.manifest or config.get("manifest")
+    if changes and manifest_path:
+        manifest = nb2an.manifest.Manifest(os.path.expanduser(manifest_path), changes)
+
+    pipeline_stats = {}
+
+    shard = nb2an.shard.from_args(args)
+
+    journal = None
+    if changes:
+        journal_path = args.journal or config.get("journal")
+        if not journal_path:
+            journal_path = default_journal_path(ansible_directory, shard)
+        journal = nb2an.journal.Journal(
+            os.path.expanduser(journal_path), resume=args.resume
+        )
 
     # maybe copy the info to a separate set of files
     if args.whitespace_hack:
-        shutil.copytree(host_vars, host_vars + ".nb2an-bkup")
-
-    process_devices(nb, ansible_directory, racks=args.racks, changes=changes)
+        backup_host_vars(host_vars, resume=args.resume)
+
+    try:
+        process_devices(
+            nb,
+            ansible_directory,
+            racks=args.racks,
+            changes=changes,
+            fast_path=not args.full_rewrite,
+            manifest=manifest,
+            shard=shard,
+            jobs=args.jobs,
+            stats=pipeline_stats,
+            journal=journal,
+        )
+    except BaseException:
+        if manifest:
+            manifest.save()  # it only holds hosts that were written
+        if journal:
+            error("the run failed: use --resume to continue where it left off")
+        raise
 
     # put the original back
     if args.whitespace_hack:
-        # move the original data back
-        os.rename(host_vars, host_vars + ".nb2an-modified")
-        os.rename(host_vars + ".nb2an-bkup", host_vars)
+        modified = restore_host_vars(host_vars)
 
         # generate a patch
-        subprocess.run(["diff", "-wBuZE", host_vars, host_vars + ".nb2an-modified"])
+        subprocess.run(["diff", "-wBuZE", host_vars, modified])
+
+    if args.profile_mapping is not None:
+        print_mapping_profile(args.profile_mapping)
+
+    if args.stats:
+        print_pipeline_stats(pipeline_stats)
+        print(file=sys.stderr)
+        print_netbox_stats(nb)
+
+    if args.stats_file:
+        import json
+
+        with open(args.stats_file, "w") as stats_file:
+            json.dump(nb.get_stats(), stats_file, indent=2)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+
+"""Updates netbox with facts gathered by ansible, using bulk PATCH requests"""
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, FileType
+from logging import debug, info, warning, error, critical
+import logging
+import json
+import sys
+import os
+
+import nb2an.netbox
+import nb2an.shard
+
+
+def parse_args():
+    parser = ArgumentParser(
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+        epilog="Exmaple Usage: nb-write-back -c reverse.yml -f ~/.cache/ansible-facts -n",
+    )
+
+    parser.add_argument(
+        "-n",
+        "--noop",
+        action="store_true",
+        help="Only show the updates that would be made (a dry run)",
+    )
+
+    parser.add_argument(
+        "--log-level",
+        "--ll",
+        default="info",
+        help="Define the logging verbosity level (debug, info, warning, error, fotal, critical).",
+    )
+
+    parser.add_argument(
+        "-r", "--racks", default=[], type=int, nargs="*", help="Racks to update"
+    )
+
+    parser.add_argument(
+        "-c",
+        "--reverse-mapping",
+        required=True,
+        type=FileType("r"),
+        help="The file mapping NetBox fields to ansible facts",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--facts-directory",
+        default=None,
+        type=str,
+        help="A directory of per-host fact files (default: the ansible host_vars directory)",
+    )
+
+    nb2an.shard.add_arguments(parser)
+
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Report NetBox request statistics (and concurrency limits) after the run",
+    )
+
+    args = parser.parse_args()
+    log_level = args.log_level.upper()
+    logging.basicConfig(level=log_level, format="%(levelname)-10s:\t%(message)s")
+    return args
+
+
+def collect_facts(nb, facts_directory: str, devices: list[dict]) -> dict:
+    "Load the facts of every device that has them, keyed by device name"
+    import nb2an.writeback
+
+    facts_by_host = {}
+    for device in devices:
+        facts = nb2an.writeback.load_facts(facts_directory, nb.fqdn(device["name"]))
+        if facts is not None:
+            facts_by_host[device["name"]] = facts
+    return facts_by_host
+
+
+def write_back(
+    nb,
+    reverse_mapping: dict,
+    facts_directory: str,
+    racks=[],
+    noop=False,
+    shard=None,
+):
+    "Compare facts with NetBox and send any differences, returning the plan"
+    import nb2an.writeback
+
+    devices = nb.get_devices(racks, shard=shard)
+    facts_by_host = collect_facts(nb, facts_directory, devices)
+    info(f"found facts for {len(facts_by_host)} of {len(devices)} devices")
+
+    interfaces = []
+    if reverse_mapping.get("interfaces"):
+        ids = [x["id"] for x in devices if x["name"] in facts_by_host]
+        for device_interfaces in nb.get_interfaces(ids).values():
+            interfaces.extend(device_interfaces)
+
+    plan = nb2an.writeback.plan_updates(
+        reverse_mapping, facts_by_host, devices, interfaces
+    )
+
+    for endpoint, updates in plan.items():
+        if noop:
+            info(f"would update {len(updates)} objects at {endpoint}")
+            continue
+        info(f"updating {len(updates)} objects at {endpoint}")
+        nb.patch_many(endpoint, updates)
+
+    return plan
+
+
+def main():
+    import yaml
+
+    args = parse_args()
+    nb = nb2an.netbox.get_netbox()
+    config = nb.config
+
+    facts_directory = args.facts_directory
+    if not facts_directory:
+        ansible_directory = config.get("ansible_directory")
+        if not ansible_directory:
+            error("Failed to find a facts directory or ansible_directory in .nb2an")
+            exit(1)
+        facts_directory = os.path.join(ansible_directory, "host_vars")
+
+    reverse_mapping = yaml.safe_load(args.reverse_mapping.read()) or {}
+
+    plan = write_back(
+        nb,
+        reverse_mapping,
+        facts_directory,
+        racks=args.racks,
+        noop=args.noop,
+        shard=nb2an.shard.from_args(args),
+    )
+    if args.noop:
+        json.dump(plan, sys.stdout, indent=2, default=str)
+        print()
+
+    if args.stats:
+        from nb2an.tools.update_ansible import print_netbox_stats
+
+        print_netbox_stats(nb)
+
+
+if __name__ == "__main__":
+    main()
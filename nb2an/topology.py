@@ -0,0 +1,158 @@
+"""A graph of the cabled connections between devices.
+
+The graph is built once from the interfaces, power ports and power
+outlets NetBox knows about, using the peer of each cabled component.
+Components are graph endpoints keyed by (kind, id), eg
+("interface", 17), and each device's endpoints are indexed so that
+neighbor lookups cost O(degree)."""
+
+import collections
+
+# NetBox object types -> endpoint kinds
+KINDS = {
+    "dcim.interface": "interface",
+    "dcim.powerport": "power_port",
+    "dcim.poweroutlet": "power_outlet",
+    "dcim.frontport": "front_port",
+    "dcim.rearport": "rear_port",
+    "circuits.circuittermination": "circuit_termination",
+}
+
+
+def peers(obj: dict) -> tuple:
+    "Return (peer objects, peer kind) for a cabled component"
+    if obj.get("link_peers"):
+        peer_type = obj.get("link_peers_type")
+        return obj["link_peers"], KINDS.get(peer_type, peer_type)
+    if obj.get("cable_peer"):
+        peer_type = obj.get("cable_peer_type")
+        return [obj["cable_peer"]], KINDS.get(peer_type, peer_type)
+    return [], None
+
+
+class Topology:
+    "Adjacency between component endpoints and between devices"
+
+    def __init__(self):
+        self.endpoints = {}  # (kind, id) -> {"device_id", "device", "name"}
+        self.links = collections.defaultdict(set)  # (kind, id) -> {(kind, id)}
+        self.device_endpoints = collections.defaultdict(set)  # device id -> ...
+        self.device_ids = {}  # device name -> id
+        self.device_names = {}  # device id -> name
+
+    def add_endpoint(self, kind: str, obj: dict) -> tuple:
+        "Remember a component (if it's on a device), returning its key"
+        key = (kind, obj["id"])
+        device = obj.get("device")
+        if key not in self.endpoints and device:
+            self.endpoints[key] = {
+                "device_id": device["id"],
+                "device": device.get("name") or device.get("display"),
+                "name": obj.get("name") or obj.get("display"),
+            }
+            self.device_endpoints[device["id"]].add(key)
+            self.device_ids[self.endpoints[key]["device"]] = device["id"]
+            self.device_names[device["id"]] = self.endpoints[key]["device"]
+        return key
+
+    def add_components(self, kind: str, objects: list) -> None:
+        "Add components of one kind, linking each to its cable peers"
+        for obj in objects:
+            key = self.add_endpoint(kind, obj)
+            peer_objects, peer_kind = peers(obj)
+            for peer in peer_objects:
+                if not peer_kind or "id" not in peer:
+                    continue
+                peer_key = self.add_endpoint(peer_kind, peer)
+                self.links[key].add(peer_key)
+                self.links[peer_key].add(key)
+
+    @classmethod
+    def from_components(cls, interfaces=[], power_ports=[], outlets=[]):
+        topology = cls()
+        topology.add_components("interface", interfaces)
+        topology.add_components("power_port", power_ports)
+        topology.add_components("power_outlet", outlets)
+        return topology
+
+    def device_id(self, device) -> int:
+        "Accept a device id or name"
+        if isinstance(device, int):
+            return device
+        return self.device_ids.get(device)
+
+    def neighbors(self, device, kinds: list[str] = None) -> list[dict]:
+        "The far end of each of a device's cabled components"
+        results = []
+        for key in sorted(self.device_endpoints.get(self.device_id(device), [])):
+            if kinds and key[0] not in kinds:
+                continue
+            for peer_key in sorted(self.links.get(key, [])):
+                peer = self.endpoints.get(peer_key)
+                if not peer:
+                    continue
+                results.append(
+                    {
+                        "kind": key[0],
+                        "name": self.endpoints[key]["name"],
+                        "device": peer["device"],
+                        "port": peer["name"],
+                        "port_kind": peer_key[0],
+                    }
+                )
+        return results
+
+    def adjacent_devices(self, device_id: int) -> set[int]:
+        results = set()
+        for key in self.device_endpoints.get(device_id, []):
+            for peer_key in self.links.get(key, []):
+                if peer_key in self.endpoints:
+                    results.add(self.endpoints[peer_key]["device_id"])
+        results.discard(device_id)
+        return results
+
+    def device_name(self, device_id: int) -> str:
+        return self.device_names.get(device_id)
+
+    def path(self, source, destination) -> list[str]:
+        "The shortest chain of device names connecting two devices, or None"
+        start = self.device_id(source)
+        end = self.device_id(destination)
+        if start is None or end is None:
+            return None
+
+        previous = {start: None}
+        queue = collections.deque([start])
+        while queue:
+            current = queue.popleft()
+            if current == end:
+                path = []
+                while current is not None:
+                    path.append(self.device_name(current))
+                    current = previous[current]
+                return list(reversed(path))
+            for neighbor in self.adjacent_devices(current):
+                if neighbor not in previous:
+                    previous[neighbor] = current
+                    queue.append(neighbor)
+        return None
+
+    def components(self) -> list[set[str]]:
+        "Groups of device names that are connected to each other"
+        seen = set()
+        results = []
+        for device_id in self.device_endpoints:
+            if device_id in seen:
+                continue
+            seen.add(device_id)
+            component = set()
+            queue = collections.deque([device_id])
+            while queue:
+                current = queue.popleft()
+                component.add(self.device_name(current))
+                for neighbor in self.adjacent_devices(current):
+                    if neighbor not in seen:
+                        seen.add(neighbor)
+                        queue.append(neighbor)
+            results.append(component)
+        return results
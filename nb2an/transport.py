@@ -0,0 +1,96 @@
+"""HTTP transports for talking to NetBox.
+
+The default transport uses a pooled requests session.  Setting
+`http_backend: httpx` uses httpx instead, which (when the h2 package
+is installed) multiplexes concurrent requests over a single HTTP/2
+connection.  If httpx isn't installed, requests is used instead.
+
+Both ask NetBox for compressed responses, using every encoding the
+installed libraries can decode (gzip and deflate, plus br and zstd
+when brotli and zstandard are installed); bodies are decompressed as
+they arrive, before the JSON is decoded."""
+
+from logging import debug, warning
+
+BACKENDS = ["requests", "httpx"]
+
+
+def _importable(*names) -> bool:
+    import importlib.util
+
+    return any(importlib.util.find_spec(name) for name in names)
+
+
+def accept_encoding() -> str:
+    "The content encodings that can be decoded here"
+    encodings = ["gzip", "deflate"]
+    if _importable("brotli", "brotlicffi"):
+        encodings.append("br")
+    if _importable("zstandard"):
+        encodings.append("zstd")
+    return ", ".join(encodings)
+
+
+class RequestsTransport:
+    "Requests sent through a pooled requests session (HTTP/1.1)"
+
+    name = "requests"
+
+    def __init__(self, max_connections: int = 4, verify: bool = True):
+        import requests
+        import requests.adapters
+        import urllib3.util
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(1, max_connections))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # urllib3 knows which decoders it can use
+        encoding = urllib3.util.make_headers(accept_encoding=True)["accept-encoding"]
+        self.session.headers["Accept-Encoding"] = encoding
+
+    def request(self, method, url, headers=None, auth=None, verify=True, json=None):
+        return self.session.request(
+            method, url, headers=headers, auth=auth, verify=verify, json=json
+        )
+
+
+class HttpxTransport:
+    "Requests multiplexed over HTTP/2 (when available) by an httpx client"
+
+    name = "httpx"
+
+    def __init__(self, max_connections: int = 4, verify: bool = True):
+        import httpx
+
+        http2 = _importable("h2")
+        if not http2:
+            warning("the h2 package isn't installed: httpx will use HTTP/1.1")
+
+        self.client = httpx.Client(
+            http2=http2,
+            verify=verify,
+            limits=httpx.Limits(max_connections=max(1, max_connections)),
+            headers={"Accept-Encoding": accept_encoding()},
+            timeout=None,
+        )
+
+    def request(self, method, url, headers=None, auth=None, verify=True, json=None):
+        # verify is set on the client, as httpx doesn't allow it per request
+        return self.client.request(method, url, headers=headers, auth=auth, json=json)
+
+
+def create(backend: str = "requests", max_connections: int = 4, verify: bool = True):
+    "Create a transport, falling back to requests if httpx isn't available"
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown http_backend {backend}")
+
+    if backend == "httpx":
+        try:
+            return HttpxTransport(max_connections, verify)
+        except ImportError as exp:
+            warning(f"not using httpx ({exp}): using requests instead")
+
+    debug("using the requests transport")
+    return RequestsTransport(max_connections, verify)
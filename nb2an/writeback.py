@@ -0,0 +1,128 @@
+"""Planning updates to NetBox from facts gathered by ansible.
+
+A reverse mapping names, for each NetBox field, where its value is
+found in a host's facts:
+
+    devices:
+      serial: ansible_product_serial
+    interfaces:
+      mac_address: "ansible_{ansible_name}.macaddress"
+
+Interface paths are templates filled in with each NetBox interface's
+name (and its ansible_name, with '-', '.' and ':' replaced by '_');
+dots within a name don't split the path.  Facts are compared against
+the NetBox objects already fetched, and only values that differ
+become updates."""
+
+import os
+import re
+from logging import debug, warning
+
+import nb2an.dotnest
+
+ENDPOINTS = {
+    "devices": "/dcim/devices/",
+    "interfaces": "/dcim/interfaces/",
+}
+
+FACT_SUFFIXES = ["", ".json", ".yml", ".yaml"]
+
+
+def load_facts(facts_directory: str, hostname: str) -> dict:
+    """Load a host's facts from a (json or yaml) file named after it,
+    as written by ansible's jsonfile fact cache or kept as host_vars"""
+    import yaml
+
+    for suffix in FACT_SUFFIXES:
+        path = os.path.join(facts_directory, hostname + suffix)
+        if os.path.isfile(path):
+            with open(path) as facts_file:
+                facts = yaml.load(
+                    facts_file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+                )
+            return facts or {}
+    return None
+
+
+def normalize(field: str, value):
+    "Put fact values in the form NetBox reports them"
+    if value is None:
+        return None
+    if field == "mac_address":
+        return str(value).upper()
+    return value
+
+
+def ansible_name(name: str) -> str:
+    return re.sub(r"[-.:]", "_", name)
+
+
+def _changes(obj: dict, fields: dict, facts: nb2an.dotnest.DotNest, names: dict):
+    "The fields of obj whose facts differ from NetBox's values"
+    update = {}
+    for field, path in fields.items():
+        try:
+            # split before filling in names, which may contain dots (eth0.100)
+            value = facts.get([part.format(**names) for part in path.split(".")])
+        except Exception:
+            continue  # no such fact
+        value = normalize(field, value)
+        if value is not None and obj.get(field) != value:
+            update[field] = value
+    return update
+
+
+def plan_updates(
+    reverse_mapping: dict,
+    facts_by_host: dict,
+    devices: list[dict],
+    interfaces: list[dict] = [],
+) -> dict:
+    """Returns {endpoint: [{"id": ..., field: new value, ...}]} for
+    every NetBox object whose mapped fields differ from its facts.
+
+    facts_by_host is keyed by NetBox device name."""
+    for name in reverse_mapping:
+        if name not in ENDPOINTS:
+            warning(f"ignoring unknown reverse mapping section '{name}'")
+
+    updates = {}
+
+    device_fields = reverse_mapping.get("devices") or {}
+    if device_fields:
+        endpoint = updates.setdefault(ENDPOINTS["devices"], [])
+        for device in devices:
+            facts = facts_by_host.get(device["name"])
+            if facts is None:
+                continue
+            names = {
+                "name": device["name"],
+                "ansible_name": ansible_name(device["name"]),
+            }
+            update = _changes(
+                device, device_fields, nb2an.dotnest.DotNest(facts), names
+            )
+            if update:
+                endpoint.append({"id": device["id"], **update})
+
+    interface_fields = reverse_mapping.get("interfaces") or {}
+    if interface_fields:
+        endpoint = updates.setdefault(ENDPOINTS["interfaces"], [])
+        device_names = {x["id"]: x["name"] for x in devices}
+        for interface in interfaces:
+            device_name = device_names.get(interface["device"]["id"])
+            facts = facts_by_host.get(device_name)
+            if facts is None:
+                continue
+            names = {
+                "name": interface["name"],
+                "ansible_name": ansible_name(interface["name"]),
+            }
+            update = _changes(
+                interface, interface_fields, nb2an.dotnest.DotNest(facts), names
+            )
+            if update:
+                endpoint.append({"id": interface["id"], **update})
+
+    debug(f"planned updates: { {x: len(y) for x, y in updates.items()} }")
+    return {x: y for x, y in updates.items() if y}
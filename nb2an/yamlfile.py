@@ -0,0 +1,214 @@
+"""Loading, editing and writing ansible host_vars YAML files.
+
+Parsers are expensive to configure, so a configured round-trip parser
+is kept per thread and reused for every file.  When a mapping only
+changes existing scalar values, the changed values are edited directly
+in the original text (located with ruamel's line/column marks) rather
+than re-dumping the whole document."""
+
+import io
+import threading
+from logging import debug
+
+_parsers = threading.local()
+
+EDITABLE_TYPES = (str, int, float, bool)
+
+
+def get_parser(typ: str = "rt"):
+    "Return this thread's configured YAML parser of the given type"
+    parser = getattr(_parsers, typ, None)
+    if parser is None:
+        import ruamel.yaml
+
+        if typ == "rt":
+            parser = ruamel.yaml.YAML()
+            parser.indent(mapping=2, sequence=4, offset=2)
+            parser.preserve_quotes = True
+            parser.width = 4096
+        else:
+            parser = ruamel.yaml.YAML(typ=typ, pure=True)
+        setattr(_parsers, typ, parser)
+    return parser
+
+
+def leaf_paths(changes: dict, plugin_key: str, prefix: tuple = ()):
+    """Return the key paths of every plain value in a changes mapping.
+
+    Returns None if the mapping uses plugins, as those may make
+    arbitrary structural changes."""
+    paths = []
+    for item in changes:
+        value = changes[item]
+        if isinstance(value, dict):
+            if plugin_key in value:
+                return None
+            subpaths = leaf_paths(value, plugin_key, prefix + (item,))
+            if subpaths is None:
+                return None
+            paths.extend(subpaths)
+        elif isinstance(value, str):
+            paths.append(prefix + (item,))
+    return paths
+
+
+def _lookup(struct, path: tuple):
+    "Return (exists, value) for a path of dict keys"
+    ptr = struct
+    for key in path:
+        if not isinstance(ptr, dict) or key not in ptr:
+            return (False, None)
+        ptr = ptr[key]
+    return (True, ptr)
+
+
+def snapshot(struct, paths: list) -> dict:
+    """Record the current state of every path (and its parents), along
+    with the text position of each existing scalar value."""
+    state = {}
+    for path in paths:
+        for n in range(1, len(path) + 1):
+            subpath = path[0:n]
+            if subpath in state:
+                continue
+            exists, value = _lookup(struct, subpath)
+            position = None
+            if exists and n == len(path):
+                parent = _lookup(struct, path[0:-1])[1]
+                try:
+                    if not parent.fa.flow_style():
+                        position = parent.lc.value(path[-1])
+                except Exception:
+                    pass
+            state[subpath] = (exists, value, position)
+    return state
+
+
+def _same(left, right) -> bool:
+    if isinstance(left, bool) != isinstance(right, bool):
+        return False
+    if isinstance(left, (list, dict)) or isinstance(right, (list, dict)):
+        return left is right
+    return left == right
+
+
+def _scalar_end(line: str, col: int):
+    "Find where the scalar starting at col on line ends, or None"
+    start = line[col : col + 1]
+    if start in ("", "&", "*", "!", "|", ">", "[", "{"):
+        return None
+
+    if start == "'":
+        n = col + 1
+        while n < len(line):
+            if line[n] == "'":
+                if line[n + 1 : n + 2] == "'":
+                    n += 2
+                    continue
+                return n + 1
+            n += 1
+        return None
+
+    if start == '"':
+        n = col + 1
+        while n < len(line):
+            if line[n] == "\\":
+                n += 2
+                continue
+            if line[n] == '"':
+                return n + 1
+            n += 1
+        return None
+
+    # a plain scalar runs until a comment or the end of the line
+    end = len(line)
+    for marker in (" #", "\t#"):
+        found = line.find(marker, col)
+        if found != -1:
+            end = min(end, found)
+    return len(line[0:end].rstrip())
+
+
+def render_scalar(value):
+    "Render a scalar exactly as a full dump would, or None if not possible"
+    if value is None or not isinstance(value, EDITABLE_TYPES):
+        return None
+    output = io.StringIO()
+    get_parser().dump({"k": value}, output)
+    text = output.getvalue()
+    if not text.startswith("k: ") or text.count("\n") != 1:
+        return None
+    return text[3:-1]
+
+
+def edit_in_place(text: str, struct, paths: list, before: dict):
+    """Apply scalar changes made to struct directly to its source text.
+
+    Returns the edited text, or None if the changes can't be expressed
+    as in-place scalar edits (in which case the caller should dump the
+    whole structure)."""
+    leaves = set(paths)
+    edits = []
+    for subpath, (existed, old_value, position) in before.items():
+        exists, value = _lookup(struct, subpath)
+        if exists != existed:
+            return None
+        if not exists or _same(old_value, value):
+            continue
+
+        # only scalar leaves that are already in the file can be edited
+        if subpath not in leaves or position is None:
+            return None
+        if not isinstance(old_value, EDITABLE_TYPES):
+            return None
+        rendered = render_scalar(value)
+        if rendered is None:
+            return None
+        edits.append((position, old_value, rendered))
+
+    if not edits:
+        return text
+
+    lines = text.splitlines(keepends=True)
+    checker = get_parser("safe")
+    for (line_number, col), old_value, rendered in edits:
+        if line_number >= len(lines):
+            return None
+        line = lines[line_number]
+        content = line.rstrip("\r\n")
+        end = _scalar_end(content, col)
+        if end is None:
+            return None
+
+        # make sure we found exactly the original value
+        try:
+            if not _same(checker.load(content[col:end]), old_value):
+                return None
+        except Exception:
+            return None
+
+        debug(f"editing line {line_number + 1}: {content[col:end]} -> {rendered}")
+        lines[line_number] = content[0:col] + rendered + line[end:]
+
+    return "".join(lines)
+
+
+def write_atomic(path: str, text: str) -> None:
+    """Replace a file's contents so that a crash leaves either the old or
+    the new file, never a partly written one"""
+    import os
+    import tempfile
+
+    directory, name = os.path.split(path)
+    fd, temporary = tempfile.mkstemp(dir=directory or ".", prefix=f".{name}.")
+    try:
+        with os.fdopen(fd, "w") as output:
+            output.write(text)
+            output.flush()
+            os.fsync(output.fileno())
+        if os.path.exists(path):
+            os.chmod(temporary, os.stat(path).st_mode & 0o7777)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
@@ -16,6 +16,7 @@ setuptools.setup(
     entry_points={
         "console_scripts": [
             # migrating to pdb prefixes
+            "nb2an = nb2an.cli:main",
             "nb-device = nb2an.tools.getdevice:main",
             "nb-devices = nb2an.tools.getdevices:main",
             "nb-racks = nb2an.tools.getracks:main",
@@ -23,7 +24,12 @@ setuptools.setup(
             "nb-networks = nb2an.tools.getnetwork:main",
             "nb-update-ansible = nb2an.tools.update_ansible:main",
             "nb-parameters = nb2an.tools.getparameters:main",
-            #            'nb-check-ansible = nb2an.tools.checkansible:main',
+            "nb-ip = nb2an.tools.getip:main",
+            "nb-cache-server = nb2an.tools.cacheserver:main",
+            "nb-rack-report = nb2an.tools.rackreport:main",
+            "nb-check-ansible = nb2an.tools.checkansible:main",
+            "nb-write-back = nb2an.tools.writeback:main",
+            "nb-merge-shards = nb2an.tools.mergeshards:main",
         ]
     },
     classifiers=[
@@ -37,5 +43,8 @@ setuptools.setup(
         "requests",
         "pyaml",
     ],
+    extras_require={
+        "http2": ["httpx[http2,brotli,zstd]"],
+    },
     python_requires=">=3.6",
 )